@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Set, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Канал Redis с событиями изменения flows (общий с backend)
+FLOW_EVENTS_CHANNEL = "flows:events"
+
+# События: saved, activated, deleted, updated (блоки/связи)
+FLOW_SAVED = "saved"
+FLOW_ACTIVATED = "activated"
+FLOW_DELETED = "deleted"
+FLOW_UPDATED = "updated"
+
+
+class FlowEventBus:
+    """Рассылка событий изменения flows
+
+    С redis_url события публикуются в Redis pub/sub (их видят все воркеры
+    API, backend и боты), локальные подписчики SSE получают их из того же
+    канала. Без Redis - рассылка внутри процесса.
+
+    Обработчик только кладёт событие в очередь (outbox_size) и не ждёт
+    Redis: одна фоновая задача публикует события по порядку, с таймаутом
+    publish_timeout. При переполнении очереди событие теряется - боты
+    перепроверят flow по TTL кэша.
+    """
+
+    def __init__(self, redis_url: str = "", channel: str = FLOW_EVENTS_CHANNEL, queue_size: int = 100,
+                 outbox_size: int = 1000, publish_timeout: float = 1.0):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.queue_size = queue_size
+        self.outbox_size = outbox_size
+        self.publish_timeout = publish_timeout
+        self._redis = None
+        self._pubsub_redis = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._publish_task: Optional[asyncio.Task] = None
+        self._relay_task: Optional[asyncio.Task] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self.redis_url and self._redis is None:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(
+                self.redis_url, decode_responses=True,
+                socket_timeout=self.publish_timeout, socket_connect_timeout=self.publish_timeout,
+            )
+            # Подписка ждёт сообщений сколько угодно: socket_timeout рвал бы её без событий
+            self._pubsub_redis = redis.from_url(
+                self.redis_url, decode_responses=True, socket_connect_timeout=self.publish_timeout,
+            )
+            self._outbox = asyncio.Queue(maxsize=self.outbox_size)
+            self._publish_task = asyncio.create_task(self._publish_loop())
+            self._relay_task = asyncio.create_task(self._relay())
+
+    async def close(self, timeout: float = 2.0):
+        """Дослать очередь (не дольше timeout) и остановить задачи"""
+        if self._publish_task is not None:
+            try:
+                await asyncio.wait_for(self._outbox.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Flow events not published on shutdown: {self._outbox.qsize()}")
+            self._publish_task.cancel()
+            await asyncio.gather(self._publish_task, return_exceptions=True)
+            self._publish_task = None
+            self._outbox = None
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            await asyncio.gather(self._relay_task, return_exceptions=True)
+            self._relay_task = None
+        for client in (self._redis, self._pubsub_redis):
+            if client is not None:
+                await client.close()
+        self._redis = None
+        self._pubsub_redis = None
+
+    def publish(self, event: str, bot_id: int, flow_id: str, updated_at: Optional[str] = None):
+        """Поставить событие в очередь (не блокирует)"""
+        payload = json.dumps({
+            "event": event,
+            "bot_id": bot_id,
+            "flow_id": str(flow_id),
+            "updated_at": updated_at,
+            "ts": time.time(),
+        })
+        if self._outbox is None:
+            self._fanout(payload)
+            return
+        try:
+            self._outbox.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Flow events queue is full, event dropped")
+
+    async def _publish_loop(self):
+        while True:
+            payload = await self._outbox.get()
+            try:
+                await self._redis.publish(self.channel, payload)
+                self.published += 1
+            except Exception as e:
+                logger.warning(f"Flow event not published to Redis: {e!r}")
+                # Подписчики этого воркера получат событие и без Redis
+                self._fanout(payload)
+            finally:
+                self._outbox.task_done()
+
+    def _fanout(self, payload: str):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Медленный подписчик пропустит событие, но не задержит остальных
+                logger.warning("Flow events subscriber queue is full, event dropped")
+
+    async def _relay(self):
+        """Redis -> локальные подписчики"""
+        while True:
+            try:
+                pubsub = self._pubsub_redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._fanout(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Flow events relay failed: {e!r}")
+                await asyncio.sleep(1)
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[asyncio.Queue]:
+        """Очередь событий (JSON строки) на время подписки"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
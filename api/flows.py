@@ -1,10 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import asyncio
 import json
-from datetime import datetime
+import logging
+import os
 import uuid
 
+from events import FlowEventBus, FLOW_SAVED, FLOW_ACTIVATED, FLOW_DELETED
+from storage import create_storage
+
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Упрощенные модели
@@ -31,30 +40,53 @@ class FlowSave(BaseModel):
     flow: Flow
     flow_id: Optional[str] = None  # Для обновления существующего
 
-# Новая структура: {bot_id: {flow_id: {flow, name, is_active, created_at, updated_at}}}
-flows_storage = {}
+# Хранилище flows: memory://, sqlite:///..., postgresql://..., redis://...
+storage = create_storage(os.getenv("FLOWS_STORAGE_URL", "sqlite:///flows.db"))
+
+# События изменений для ботов: Redis pub/sub или рассылка внутри процесса
+events = FlowEventBus(os.getenv("FLOW_EVENTS_REDIS_URL", ""))
+
+# Период комментария-heartbeat в SSE (сек)
+SSE_HEARTBEAT = 15
+
+
+# Сериализованные тела flow по версии: версия неизменна, JSON собираем один раз
+serialized_flows: "OrderedDict[str, bytes]" = OrderedDict()
+SERIALIZED_FLOWS_SIZE = 256
+
+
+def make_etag(flow_id: str, updated_at: str) -> str:
+    """ETag версии flow - меняется при каждом сохранении"""
+    return f'"{flow_id}:{updated_at}"'
+
+
+def flow_response(data: Dict[str, Any], if_none_match: Optional[str]) -> Response:
+    """Ответ с телом flow (или 304), JSON версии кэшируется по ETag"""
+    etag = make_etag(data["flow_id"], data["updated_at"])
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # is_active меняется без смены версии - входит в ключ кэша
+    key = f'{etag}:{data["is_active"]}'
+    body = serialized_flows.get(key)
+    if body is None:
+        body = json.dumps(data, ensure_ascii=False).encode()
+        serialized_flows[key] = body
+        if len(serialized_flows) > SERIALIZED_FLOWS_SIZE:
+            serialized_flows.popitem(last=False)
+    else:
+        serialized_flows.move_to_end(key)
+    
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @router.post("/flows/save")
 async def save_flow(flow_data: FlowSave):
-    print(f"Received data: {flow_data}")
     bot_id = flow_data.bot_id
     flow_id = flow_data.flow_id or str(uuid.uuid4())
     
-    # Инициализируем хранилище для бота если его нет
-    if bot_id not in flows_storage:
-        flows_storage[bot_id] = {}
-    
-    # Если это первый flow для бота - делаем его активным
-    is_active = len(flows_storage[bot_id]) == 0
-    
-    flows_storage[bot_id][flow_id] = {
-        "flow": flow_data.flow.dict(),
-        "flow_id": flow_id,
-        "name": flow_data.flow.name,
-        "is_active": is_active,
-        "created_at": flows_storage[bot_id].get(flow_id, {}).get("created_at", datetime.now().isoformat()),
-        "updated_at": datetime.now().isoformat()
-    }
+    record = await storage.save(bot_id, flow_id, flow_data.flow.dict(), flow_data.flow.name)
+    logger.info(f"Flow {flow_id} saved for bot {bot_id} ({len(flow_data.flow.nodes)} nodes)")
+    events.publish(FLOW_SAVED, bot_id, flow_id, record["updated_at"])
 
     return {
         "success": True,
@@ -63,54 +95,65 @@ async def save_flow(flow_data: FlowSave):
         "flow_id": flow_id
     }
 
+@router.get("/flows/events")
+async def flow_events():
+    """SSE поток событий изменения flows (saved / activated / deleted / updated)"""
+    async def stream():
+        async with events.subscribe() as queue:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @router.get("/flows/{bot_id}")
 async def list_bot_flows(bot_id: int):
     """Получить список всех flows для бота"""
-    if bot_id not in flows_storage:
-        return {"flows": []}
+    return {"flows": await storage.list(bot_id)}
+
+@router.get("/flows/{bot_id}/active")
+async def get_active_flow(bot_id: int, if_none_match: Optional[str] = Header(None)):
+    """Получить активный flow целиком одним запросом (поддерживает If-None-Match)
     
-    flows_list = [
-        {
-            "flow_id": flow_id,
-            "name": data["name"],
-            "is_active": data["is_active"],
-            "created_at": data["created_at"],
-            "updated_at": data["updated_at"]
-        }
-        for flow_id, data in flows_storage[bot_id].items()
-    ]
+    Хранилище держит указатель на активный flow бота, поиск не зависит
+    от числа flows.
+    """
+    active = await storage.get_active(bot_id)
+    if not active:
+        raise HTTPException(status_code=404, detail="No active flow")
     
-    return {"flows": flows_list}
+    return flow_response(active, if_none_match)
 
 @router.get("/flows/{bot_id}/{flow_id}")
-async def get_flow(bot_id: int, flow_id: str):
-    """Получить конкретный flow"""
-    if bot_id not in flows_storage or flow_id not in flows_storage[bot_id]:
+async def get_flow(bot_id: int, flow_id: str, if_none_match: Optional[str] = Header(None)):
+    """Получить конкретный flow (поддерживает If-None-Match)"""
+    data = await storage.get(bot_id, flow_id)
+    if not data:
         raise HTTPException(status_code=404, detail="Flow not found")
     
-    return flows_storage[bot_id][flow_id]
+    return flow_response(data, if_none_match)
 
 @router.delete("/flows/{bot_id}/{flow_id}")
 async def delete_flow(bot_id: int, flow_id: str):
     """Удалить flow"""
-    if bot_id not in flows_storage or flow_id not in flows_storage[bot_id]:
+    if not await storage.delete(bot_id, flow_id):
         raise HTTPException(status_code=404, detail="Flow not found")
     
-    del flows_storage[bot_id][flow_id]
+    events.publish(FLOW_DELETED, bot_id, flow_id)
     
     return {"success": True, "message": "Flow deleted"}
 
 @router.put("/flows/{bot_id}/{flow_id}/activate")
 async def activate_flow(bot_id: int, flow_id: str):
     """Сделать flow активным"""
-    if bot_id not in flows_storage or flow_id not in flows_storage[bot_id]:
+    if not await storage.activate(bot_id, flow_id):
         raise HTTPException(status_code=404, detail="Flow not found")
     
-    # Деактивируем все flows
-    for fid in flows_storage[bot_id]:
-        flows_storage[bot_id][fid]["is_active"] = False
-    
-    # Активируем выбранный
-    flows_storage[bot_id][flow_id]["is_active"] = True
+    events.publish(FLOW_ACTIVATED, bot_id, flow_id)
     
     return {"success": True, "message": "Flow activated"}
@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from flows import router as flows_router
+from flows import router as flows_router, storage as flows_storage, events as flow_events
 
 app = FastAPI(title="Bot Builder API", version="1.0.0")
 
@@ -16,6 +16,15 @@ app.add_middleware(
 # Подключаем роутеры
 app.include_router(flows_router, prefix="/api", tags=["flows"])
 
+@app.on_event("startup")
+async def startup_event():
+    await flow_events.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await flow_events.close()
+    await flows_storage.close()
+
 @app.get("/")
 async def root():
     return {"message": "Bot Builder API", "version": "1.0.0"}
@@ -0,0 +1,399 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Поля записи flow без графа (для списков)
+SUMMARY_FIELDS = ("flow_id", "name", "is_active", "created_at", "updated_at")
+
+
+def summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: record[field] for field in SUMMARY_FIELDS}
+
+
+class FlowStorage(ABC):
+    """Хранилище flows ботов
+
+    Запись flow: {flow, flow_id, name, is_active, created_at, updated_at}.
+    Активный flow у бота один. Сохранённый flow становится активным, если
+    у бота нет активного: первый flow бота или первый сохранённый после
+    удаления активного (удаление сам другой flow не активирует).
+    """
+
+    @abstractmethod
+    async def save(self, bot_id: int, flow_id: str, flow: Dict[str, Any], name: str) -> Dict[str, Any]:
+        """Создать или обновить flow, вернуть запись"""
+
+    @abstractmethod
+    async def list(self, bot_id: int) -> List[Dict[str, Any]]:
+        """Flows бота без графа"""
+
+    @abstractmethod
+    async def get(self, bot_id: int, flow_id: str) -> Optional[Dict[str, Any]]:
+        """Запись flow; None - flow не найден"""
+
+    @abstractmethod
+    async def get_active(self, bot_id: int) -> Optional[Dict[str, Any]]:
+        """Запись активного flow; None - активного нет"""
+
+    @abstractmethod
+    async def delete(self, bot_id: int, flow_id: str) -> bool:
+        """False - flow не найден"""
+
+    @abstractmethod
+    async def activate(self, bot_id: int, flow_id: str) -> bool:
+        """Сделать flow активным; False - flow не найден"""
+
+    async def close(self):
+        pass
+
+
+class MemoryFlowStorage(FlowStorage):
+    """Flows в памяти процесса (разработка; не переживает рестарт и не делится между воркерами)"""
+
+    def __init__(self):
+        # {bot_id: {flow_id: запись}}
+        self._flows: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        # bot_id -> flow_id активного flow
+        self._active: Dict[int, str] = {}
+
+    def _record(self, bot_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {**data, "is_active": self._active.get(bot_id) == data["flow_id"]}
+
+    async def save(self, bot_id, flow_id, flow, name):
+        bot_flows = self._flows.setdefault(bot_id, {})
+        now = datetime.now().isoformat()
+        bot_flows[flow_id] = {
+            "flow": flow,
+            "flow_id": flow_id,
+            "name": name,
+            "created_at": bot_flows.get(flow_id, {}).get("created_at", now),
+            "updated_at": now,
+        }
+        self._active.setdefault(bot_id, flow_id)
+        return self._record(bot_id, bot_flows[flow_id])
+
+    async def list(self, bot_id):
+        return [summary(self._record(bot_id, data)) for data in self._flows.get(bot_id, {}).values()]
+
+    async def get(self, bot_id, flow_id):
+        data = self._flows.get(bot_id, {}).get(flow_id)
+        return self._record(bot_id, data) if data else None
+
+    async def get_active(self, bot_id):
+        flow_id = self._active.get(bot_id)
+        return await self.get(bot_id, flow_id) if flow_id else None
+
+    async def delete(self, bot_id, flow_id):
+        if self._flows.get(bot_id, {}).pop(flow_id, None) is None:
+            return False
+        if self._active.get(bot_id) == flow_id:
+            del self._active[bot_id]
+        return True
+
+    async def activate(self, bot_id, flow_id):
+        if flow_id not in self._flows.get(bot_id, {}):
+            return False
+        self._active[bot_id] = flow_id
+        return True
+
+
+class SQLFlowStorage(FlowStorage):
+    """Flows в SQLite / PostgreSQL (SQLAlchemy Core, запросы в пуле потоков)
+
+    Один активный flow на бота гарантирует частичный уникальный индекс
+    по bot_id WHERE is_active. save - один upsert, activate снимает флаг
+    и ставит новый в одной транзакции; в PostgreSQL транзакции одного
+    бота дополнительно идут по очереди (advisory lock), в SQLite запись
+    и так последовательна.
+    """
+
+    def __init__(self, url: str):
+        from sqlalchemy import (
+            MetaData, Table, Column, Integer, String, Text, Boolean, Index, create_engine, event,
+        )
+
+        if url.startswith("sqlite"):
+            self.engine = create_engine(url, connect_args={"check_same_thread": False})
+
+            @event.listens_for(self.engine, "connect")
+            def set_sqlite_pragma(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.close()
+        else:
+            self.engine = create_engine(url, pool_size=10, max_overflow=20, pool_pre_ping=True)
+
+        metadata = MetaData()
+        self.flows = Table(
+            "flows",
+            metadata,
+            Column("bot_id", Integer, primary_key=True),
+            Column("flow_id", String(36), primary_key=True),
+            Column("name", String(200), nullable=False),
+            Column("flow", Text, nullable=False),
+            Column("is_active", Boolean, nullable=False, default=False),
+            Column("created_at", String(32), nullable=False),
+            Column("updated_at", String(32), nullable=False),
+            # Поиск активного flow бота - самый частый запрос от ботов
+            Index("ix_flows_bot_id_is_active", "bot_id", "is_active"),
+        )
+        active = self.flows.c.is_active.is_(True)
+        self.active_index = Index(
+            "ux_flows_bot_id_active", self.flows.c.bot_id, unique=True,
+            sqlite_where=active, postgresql_where=active,
+        )
+        metadata.create_all(self.engine)
+        self._create_active_index()
+
+    def _create_active_index(self):
+        """Уникальный индекс активного flow для таблицы, созданной до него"""
+        from sqlalchemy import inspect, select
+
+        t = self.flows
+        with self.engine.begin() as conn:
+            if self.active_index.name in {index["name"] for index in inspect(conn).get_indexes("flows")}:
+                return
+            # Параллельные activate прежней версии могли оставить у бота
+            # несколько активных flows: оставляем последний сохранённый
+            rows = conn.execute(
+                select(t.c.bot_id, t.c.flow_id).where(t.c.is_active.is_(True))
+                .order_by(t.c.bot_id, t.c.updated_at.desc())
+            ).all()
+            seen = set()
+            for bot_id, flow_id in rows:
+                if bot_id in seen:
+                    conn.execute(
+                        t.update().where(t.c.bot_id == bot_id, t.c.flow_id == flow_id).values(is_active=False)
+                    )
+                seen.add(bot_id)
+            self.active_index.create(conn)
+
+    def _lock_bot(self, conn, bot_id: int):
+        """Транзакции save / activate одного бота - по очереди (PostgreSQL)"""
+        from sqlalchemy import select, func
+
+        if self.engine.dialect.name == "postgresql":
+            conn.execute(select(func.pg_advisory_xact_lock(bot_id)))
+
+    @staticmethod
+    def _record(row) -> Dict[str, Any]:
+        return {
+            "flow": json.loads(row.flow),
+            "flow_id": row.flow_id,
+            "name": row.name,
+            "is_active": bool(row.is_active),
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+        }
+
+    def _insert(self):
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(self.flows)
+
+    def _save(self, bot_id, flow_id, flow, name):
+        from sqlalchemy import select, exists
+
+        now = datetime.now().isoformat()
+        t = self.flows
+        # Как setdefault / SET NX у других хранилищ: активируем, если активного нет
+        no_active = ~exists().where(t.c.bot_id == bot_id, t.c.is_active.is_(True))
+        stmt = self._insert().values(
+            bot_id=bot_id, flow_id=flow_id, name=name, flow=json.dumps(flow),
+            is_active=no_active, created_at=now, updated_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.bot_id, t.c.flow_id],
+            set_={
+                "name": stmt.excluded.name,
+                "flow": stmt.excluded.flow,
+                "updated_at": stmt.excluded.updated_at,
+                "is_active": t.c.is_active | no_active,
+            },
+        )
+        with self.engine.begin() as conn:
+            self._lock_bot(conn, bot_id)
+            conn.execute(stmt)
+            row = conn.execute(select(t).where(t.c.bot_id == bot_id, t.c.flow_id == flow_id)).first()
+        return self._record(row)
+
+    def _list(self, bot_id):
+        from sqlalchemy import select
+
+        t = self.flows
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.flow_id, t.c.name, t.c.is_active, t.c.created_at, t.c.updated_at)
+                .where(t.c.bot_id == bot_id)
+            ).all()
+        return [{**row._asdict(), "is_active": bool(row.is_active)} for row in rows]
+
+    def _get(self, bot_id, flow_id):
+        from sqlalchemy import select
+
+        t = self.flows
+        with self.engine.connect() as conn:
+            row = conn.execute(select(t).where(t.c.bot_id == bot_id, t.c.flow_id == flow_id)).first()
+        return self._record(row) if row else None
+
+    def _get_active(self, bot_id):
+        from sqlalchemy import select
+
+        t = self.flows
+        with self.engine.connect() as conn:
+            row = conn.execute(select(t).where(t.c.bot_id == bot_id, t.c.is_active.is_(True))).first()
+        return self._record(row) if row else None
+
+    def _delete(self, bot_id, flow_id):
+        t = self.flows
+        with self.engine.begin() as conn:
+            result = conn.execute(t.delete().where(t.c.bot_id == bot_id, t.c.flow_id == flow_id))
+        return result.rowcount > 0
+
+    def _activate(self, bot_id, flow_id):
+        from sqlalchemy import exists
+
+        t = self.flows
+        target = exists().where(t.c.bot_id == bot_id, t.c.flow_id == flow_id)
+        with self.engine.begin() as conn:
+            self._lock_bot(conn, bot_id)
+            # Снимаем флаг и ставим новый в одной транзакции; сначала снимаем -
+            # иначе уникальный индекс увидит два активных flow
+            conn.execute(
+                t.update()
+                .where(t.c.bot_id == bot_id, t.c.flow_id != flow_id, t.c.is_active.is_(True), target)
+                .values(is_active=False)
+            )
+            result = conn.execute(
+                t.update().where(t.c.bot_id == bot_id, t.c.flow_id == flow_id).values(is_active=True)
+            )
+        return result.rowcount > 0
+
+    async def save(self, bot_id, flow_id, flow, name):
+        return await asyncio.to_thread(self._save, bot_id, flow_id, flow, name)
+
+    async def list(self, bot_id):
+        return await asyncio.to_thread(self._list, bot_id)
+
+    async def get(self, bot_id, flow_id):
+        return await asyncio.to_thread(self._get, bot_id, flow_id)
+
+    async def get_active(self, bot_id):
+        return await asyncio.to_thread(self._get_active, bot_id)
+
+    async def delete(self, bot_id, flow_id):
+        return await asyncio.to_thread(self._delete, bot_id, flow_id)
+
+    async def activate(self, bot_id, flow_id):
+        return await asyncio.to_thread(self._activate, bot_id, flow_id)
+
+    async def close(self):
+        self.engine.dispose()
+
+
+# Проверка и запись указателя активного flow должны быть атомарны:
+# иначе параллельные delete и activate оставят указатель на удалённый flow
+DELETE_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+ACTIVATE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+class RedisFlowStorage(FlowStorage):
+    """Flows в Redis
+
+    flows:{bot_id} - hash flow_id -> JSON записи, flows:{bot_id}:active -
+    flow_id активного flow (флаг is_active вычисляется при чтении).
+    delete и activate - Lua скрипты, выполняются атомарно за один запрос.
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self._delete_script = self.redis.register_script(DELETE_SCRIPT)
+        self._activate_script = self.redis.register_script(ACTIVATE_SCRIPT)
+
+    @staticmethod
+    def _key(bot_id: int) -> str:
+        return f"flows:{bot_id}"
+
+    @staticmethod
+    def _active_key(bot_id: int) -> str:
+        return f"flows:{bot_id}:active"
+
+    async def save(self, bot_id, flow_id, flow, name):
+        now = datetime.now().isoformat()
+        raw = await self.redis.hget(self._key(bot_id), flow_id)
+        created_at = json.loads(raw)["created_at"] if raw else now
+        data = {"flow": flow, "flow_id": flow_id, "name": name, "created_at": created_at, "updated_at": now}
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(bot_id), flow_id, json.dumps(data))
+            # Первый flow бота становится активным
+            pipe.set(self._active_key(bot_id), flow_id, nx=True)
+            pipe.get(self._active_key(bot_id))
+            _, _, active_id = await pipe.execute()
+        return {**data, "is_active": active_id == flow_id}
+
+    async def list(self, bot_id):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._key(bot_id))
+            pipe.get(self._active_key(bot_id))
+            flows, active_id = await pipe.execute()
+        return [
+            summary({**json.loads(raw), "is_active": flow_id == active_id})
+            for flow_id, raw in flows.items()
+        ]
+
+    async def get(self, bot_id, flow_id):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(self._key(bot_id), flow_id)
+            pipe.get(self._active_key(bot_id))
+            raw, active_id = await pipe.execute()
+        return {**json.loads(raw), "is_active": flow_id == active_id} if raw else None
+
+    async def get_active(self, bot_id):
+        flow_id = await self.redis.get(self._active_key(bot_id))
+        return await self.get(bot_id, flow_id) if flow_id else None
+
+    async def delete(self, bot_id, flow_id):
+        # Указатель снимается, только если он всё ещё на удалённый flow
+        keys = [self._key(bot_id), self._active_key(bot_id)]
+        return bool(await self._delete_script(keys=keys, args=[flow_id]))
+
+    async def activate(self, bot_id, flow_id):
+        keys = [self._key(bot_id), self._active_key(bot_id)]
+        return bool(await self._activate_script(keys=keys, args=[flow_id]))
+
+    async def close(self):
+        await self.redis.close()
+
+
+def create_storage(url: str) -> FlowStorage:
+    """Хранилище по URL: memory://, sqlite:///..., postgresql://..., redis://..."""
+    if url.startswith("memory"):
+        return MemoryFlowStorage()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisFlowStorage(url)
+    if url.startswith(("sqlite", "postgresql")):
+        return SQLFlowStorage(url)
+    raise ValueError(f"Unsupported flows storage: {url}")
@@ -1,3 +1,3 @@
-from app.api.v1 import auth, bots, flows
+from app.api.v1 import auth, bots, flows, broadcasts
 
-__all__ = ["auth", "bots", "flows"]
\ No newline at end of file
+__all__ = ["auth", "bots", "flows", "broadcasts"]
\ No newline at end of file
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_user, invalidate_user
 from app.models.bot import Bot
 from app.schemas.bot import (
     BotCreate,
@@ -20,14 +21,14 @@ router = APIRouter(prefix="/bots", tags=["bots"])
 async def create_bot(
     bot_data: BotCreate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать нового бота"""
     
     user_id = int(current_user["sub"])
     
     # Проверяем уникальность токена
-    existing_bot = db.query(Bot).filter(Bot.token == bot_data.token).first()
+    existing_bot = await db.scalar(select(Bot).where(Bot.token == bot_data.token))
     if existing_bot:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -43,8 +44,11 @@ async def create_bot(
     )
     
     db.add(bot)
-    db.commit()
-    db.refresh(bot)
+    await db.commit()
+    await db.refresh(bot)
+    
+    # В кэше пользователя список его ботов устарел
+    invalidate_user(user_id)
     
     logger.info(f"Bot created: {bot.name} (ID: {bot.id}) by user {user_id}")
     
@@ -53,7 +57,7 @@ async def create_bot(
 @router.get("", response_model=List[BotListResponse])
 async def get_bots(
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100
 ):
@@ -61,9 +65,9 @@ async def get_bots(
     
     user_id = int(current_user["sub"])
     
-    bots = db.query(Bot).filter(
+    bots = (await db.scalars(select(Bot).where(
         Bot.user_id == user_id
-    ).offset(skip).limit(limit).all()
+    ).offset(skip).limit(limit))).all()
     
     return [BotListResponse.from_orm(bot) for bot in bots]
 
@@ -71,16 +75,16 @@ async def get_bots(
 async def get_bot(
     bot_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить бота по ID"""
     
     user_id = int(current_user["sub"])
     
-    bot = db.query(Bot).filter(
+    bot = await db.scalar(select(Bot).where(
         Bot.id == bot_id,
         Bot.user_id == user_id
-    ).first()
+    ))
     
     if not bot:
         raise HTTPException(
@@ -95,16 +99,16 @@ async def update_bot(
     bot_id: int,
     bot_data: BotUpdate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить бота"""
     
     user_id = int(current_user["sub"])
     
-    bot = db.query(Bot).filter(
+    bot = await db.scalar(select(Bot).where(
         Bot.id == bot_id,
         Bot.user_id == user_id
-    ).first()
+    ))
     
     if not bot:
         raise HTTPException(
@@ -117,8 +121,8 @@ async def update_bot(
     for field, value in update_data.items():
         setattr(bot, field, value)
     
-    db.commit()
-    db.refresh(bot)
+    await db.commit()
+    await db.refresh(bot)
     
     logger.info(f"Bot updated: {bot.name} (ID: {bot.id})")
     
@@ -128,16 +132,16 @@ async def update_bot(
 async def delete_bot(
     bot_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить бота"""
     
     user_id = int(current_user["sub"])
     
-    bot = db.query(Bot).filter(
+    bot = await db.scalar(select(Bot).where(
         Bot.id == bot_id,
         Bot.user_id == user_id
-    ).first()
+    ))
     
     if not bot:
         raise HTTPException(
@@ -145,8 +149,9 @@ async def delete_bot(
             detail="Bot not found"
         )
     
-    db.delete(bot)
-    db.commit()
+    await db.delete(bot)
+    await db.commit()
+    invalidate_user(user_id)
     
     logger.info(f"Bot deleted: {bot.name} (ID: {bot.id})")
     
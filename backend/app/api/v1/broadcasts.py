@@ -0,0 +1,123 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.models.bot import Bot
+from app.models.broadcast import Broadcast
+from app.schemas.broadcast import BroadcastCreate, BroadcastResponse
+from app.tasks.broadcast import start_broadcast
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/broadcasts", tags=["broadcasts"])
+
+async def get_owned_broadcast(db: AsyncSession, broadcast_id: int, user_id: int) -> Broadcast:
+    """Найти рассылку с проверкой владельца бота"""
+    broadcast = await db.scalar(select(Broadcast).join(Bot, Bot.id == Broadcast.bot_id).where(
+        Broadcast.id == broadcast_id,
+        Bot.user_id == user_id
+    ))
+    
+    if not broadcast:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Broadcast not found"
+        )
+    
+    return broadcast
+
+@router.post("", response_model=BroadcastResponse, status_code=status.HTTP_201_CREATED)
+async def create_broadcast(
+    broadcast_data: BroadcastCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Создать и запустить рассылку всем пользователям бота"""
+    
+    user_id = int(current_user["sub"])
+    
+    # Проверяем что бот принадлежит пользователю
+    bot = await db.scalar(select(Bot).where(
+        Bot.id == broadcast_data.bot_id,
+        Bot.user_id == user_id
+    ))
+    
+    if not bot:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bot not found"
+        )
+    
+    broadcast = Broadcast(
+        bot_id=broadcast_data.bot_id,
+        text=broadcast_data.text,
+        parse_mode=broadcast_data.parse_mode
+    )
+    
+    db.add(broadcast)
+    await db.commit()
+    await db.refresh(broadcast)
+    
+    start_broadcast(broadcast.id)
+    
+    logger.info(f"Broadcast created: ID {broadcast.id} for bot {bot.id}")
+    
+    return BroadcastResponse.from_orm(broadcast)
+
+@router.get("/{broadcast_id}", response_model=BroadcastResponse)
+async def get_broadcast(
+    broadcast_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Прогресс и скорость рассылки"""
+    
+    broadcast = await get_owned_broadcast(db, broadcast_id, int(current_user["sub"]))
+    
+    return BroadcastResponse.from_orm(broadcast)
+
+@router.post("/{broadcast_id}/cancel", response_model=BroadcastResponse)
+async def cancel_broadcast(
+    broadcast_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Остановить рассылку (останавливается после текущей пачки)"""
+    
+    broadcast = await get_owned_broadcast(db, broadcast_id, int(current_user["sub"]))
+    
+    if broadcast.status in ("pending", "running"):
+        broadcast.status = "cancelled"
+        await db.commit()
+        await db.refresh(broadcast)
+        logger.info(f"Broadcast cancelled: ID {broadcast.id}")
+    
+    return BroadcastResponse.from_orm(broadcast)
+
+@router.post("/{broadcast_id}/resume", response_model=BroadcastResponse)
+async def resume_broadcast(
+    broadcast_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Продолжить остановленную рассылку с чекпоинта"""
+    
+    broadcast = await get_owned_broadcast(db, broadcast_id, int(current_user["sub"]))
+    
+    if broadcast.status == "completed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Broadcast already completed"
+        )
+    
+    broadcast.status = "running"
+    await db.commit()
+    await db.refresh(broadcast)
+    
+    start_broadcast(broadcast.id)
+    
+    logger.info(f"Broadcast resumed: ID {broadcast.id} from {broadcast.last_bot_user_id}")
+    
+    return BroadcastResponse.from_orm(broadcast)
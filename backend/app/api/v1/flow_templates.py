@@ -1,25 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
-from pydantic import BaseModel
-import json
+from pydantic import BaseModel, Field
+import hmac
 import os
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.bot import Bot
-from app.models.flow import Flow
-from app.models.block import Block
-from app.models.connection import Connection
+from app.services.flow_templates import TemplateRegistry, TemplateCatalog, TemplatePlan, TemplateError
+from app.services.flow_import import bulk_import_flow, bulk_create_flows
+from app.services.flow_events import publish_flow_event, FLOW_SAVED
 
 router = APIRouter()
 
-# Путь к файлу с шаблонами
-TEMPLATES_FILE = os.path.join(
+# Файл или каталог с шаблонами
+TEMPLATES_PATH = settings.FLOW_TEMPLATES_PATH or os.path.join(
     os.path.dirname(__file__), 
-    "../../templates/flows/templates.json"
+    "../../templates/flows"
 )
 
+registry = TemplateRegistry(TEMPLATES_PATH, settings.FLOW_TEMPLATES_CHECK_INTERVAL)
+
 
 class TemplateInfo(BaseModel):
     """Информация о шаблоне"""
@@ -48,21 +52,36 @@ class CreateFromTemplate(BaseModel):
     flow_name: str = None  # Если не указано, берется из шаблона
 
 
-def load_templates() -> Dict[str, Any]:
-    """Загрузить шаблоны из JSON файла"""
+class CreateFromTemplateBulk(BaseModel):
+    """Запрос на создание Flow из шаблона сразу для многих ботов"""
+    bot_ids: List[int] = Field(..., min_length=1, max_length=1000)
+    template_id: str
+    copies: int = Field(1, ge=1, le=100)  # Копий на каждого бота
+    flow_name: str = None
+
+
+def get_catalog() -> TemplateCatalog:
+    """Текущий каталог шаблонов (загружается один раз, перечитывается при изменении файлов)"""
     try:
-        with open(TEMPLATES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
+        return registry.catalog()
+    except (OSError, TemplateError) as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Templates file not found"
+            detail=f"Templates are not available: {e}"
         )
-    except json.JSONDecodeError:
+
+
+def get_plan(template_id: str) -> TemplatePlan:
+    """Подготовленный шаблон или 404"""
+    plan = get_catalog().get(template_id)
+    
+    if plan is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Invalid templates file format"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Template '{template_id}' not found"
         )
+    
+    return plan
 
 
 @router.get("/flow-templates", response_model=List[TemplateInfo])
@@ -70,20 +89,32 @@ def get_templates():
     """
     Получить список всех доступных шаблонов
     """
-    templates = load_templates()
+    # Список сериализуется один раз при загрузке каталога
+    return Response(content=get_catalog().summary, media_type="application/json")
+
+
+@router.post("/flow-templates/reload")
+def reload_templates(x_admin_token: str = Header("")):
+    """
+    Перечитать шаблоны (заголовок X-Admin-Token = FLOW_TEMPLATES_ADMIN_TOKEN)
+    """
+    if not settings.FLOW_TEMPLATES_ADMIN_TOKEN or not hmac.compare_digest(
+        x_admin_token, settings.FLOW_TEMPLATES_ADMIN_TOKEN
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Forbidden"
+        )
     
-    result = []
-    for template_id, template_data in templates.items():
-        result.append(TemplateInfo(
-            id=template_data["id"],
-            name=template_data["name"],
-            description=template_data["description"],
-            category=template_data["category"],
-            blocks_count=len(template_data["blocks"]),
-            connections_count=len(template_data["connections"])
-        ))
+    try:
+        catalog = registry.reload()
+    except (OSError, TemplateError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Templates not reloaded: {e}"
+        )
     
-    return result
+    return {"templates": len(catalog.plans)}
 
 
 @router.get("/flow-templates/{template_id}", response_model=TemplateDetail)
@@ -91,30 +122,15 @@ def get_template_detail(template_id: str):
     """
     Получить детальную информацию о шаблоне
     """
-    templates = load_templates()
+    plan = get_plan(template_id)
     
-    if template_id not in templates:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Template '{template_id}' not found"
-        )
-    
-    template = templates[template_id]
-    
-    return TemplateDetail(
-        id=template["id"],
-        name=template["name"],
-        description=template["description"],
-        category=template["category"],
-        blocks=template["blocks"],
-        connections=template["connections"]
-    )
+    return Response(content=plan.detail, media_type="application/json")
 
 
 @router.post("/flows/from-template", status_code=status.HTTP_201_CREATED)
-def create_flow_from_template(
+async def create_flow_from_template(
     data: CreateFromTemplate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -124,10 +140,10 @@ def create_flow_from_template(
     user_id = int(current_user["sub"])
     
     # Проверка что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
+    bot = await db.scalar(select(Bot).where(
         Bot.id == data.bot_id,
         Bot.user_id == user_id
-    ).first()
+    ))
     
     if not bot:
         raise HTTPException(
@@ -135,69 +151,92 @@ def create_flow_from_template(
             detail="Bot not found"
         )
     
-    # Загружаем шаблон
-    templates = load_templates()
+    # Берем подготовленный шаблон
+    plan = get_plan(data.template_id)
+    
+    # Flow, блоки и связи - одной транзакцией, пачками
+    new_flow = await db.run_sync(bulk_import_flow, {
+        "bot_id": data.bot_id,
+        "name": data.flow_name if data.flow_name else plan.name,
+        "description": plan.description,
+        "is_active": True,
+    }, plan.blocks, plan.connections)
+    
+    publish_flow_event(FLOW_SAVED, new_flow.bot_id, new_flow.id, new_flow.updated_at.isoformat())
+    
+    return {
+        "flow_id": new_flow.id,
+        "name": new_flow.name,
+        "template_id": data.template_id,
+        "blocks_created": len(plan.blocks),
+        "connections_created": len(plan.connections),
+        "message": f"Flow created from template '{plan.name}'"
+    }
+
+
+@router.post("/flows/from-template/bulk", status_code=status.HTTP_201_CREATED)
+async def create_flows_from_template(
+    data: CreateFromTemplateBulk,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Создать Flow из шаблона для многих ботов (copies копий на бота) одной транзакцией
+    """
+    # Получаем user_id из токена
+    user_id = int(current_user["sub"])
+    
+    bot_ids = list(dict.fromkeys(data.bot_ids))
+    plan = get_plan(data.template_id)
+    
+    # Вся вставка идёт одной транзакцией - её размер ограничен до запросов к базе
+    rows = len(bot_ids) * data.copies * (1 + len(plan.blocks) + len(plan.connections))
+    if rows > settings.FLOW_TEMPLATES_BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many rows to create: {rows} (max {settings.FLOW_TEMPLATES_BULK_MAX_ROWS})"
+        )
+    
+    # Все боты должны принадлежать пользователю - проверка одним запросом
+    owned = set((await db.scalars(select(Bot.id).where(
+        Bot.id.in_(bot_ids),
+        Bot.user_id == user_id
+    ))).all())
+    missing = [bot_id for bot_id in bot_ids if bot_id not in owned]
     
-    if data.template_id not in templates:
+    if missing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Template '{data.template_id}' not found"
+            detail=f"Bots not found: {missing}"
         )
     
-    template = templates[data.template_id]
-    
-    # Создаем Flow
-    flow_name = data.flow_name if data.flow_name else template["name"]
-    
-    new_flow = Flow(
-        bot_id=data.bot_id,
-        name=flow_name,
-        description=template["description"],
-        is_active=True
-    )
-    db.add(new_flow)
-    db.commit()
-    db.refresh(new_flow)
-    
-    # Создаем блоки
-    created_blocks = []
-    for block_data in template["blocks"]:
-        new_block = Block(
-            flow_id=new_flow.id,
-            title=block_data["title"],
-            type=block_data["type"],
-            content=block_data["content"],
-            position_x=block_data.get("position_x", 0),
-            position_y=block_data.get("position_y", 0)
-        )
-        db.add(new_block)
-        db.commit()
-        db.refresh(new_block)
-        created_blocks.append(new_block)
-    
-    # Создаем связи
-    created_connections = []
-    for conn_data in template["connections"]:
-        if conn_data["from_index"] >= len(created_blocks) or conn_data["to_index"] >= len(created_blocks):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid block index in template connections"
-            )
-        
-        new_connection = Connection(
-            from_block_id=created_blocks[conn_data["from_index"]].id,
-            to_block_id=created_blocks[conn_data["to_index"]].id
-        )
-        db.add(new_connection)
-        db.commit()
-        db.refresh(new_connection)
-        created_connections.append(new_connection)
+    name = data.flow_name if data.flow_name else plan.name
+    
+    flows_fields = [
+        {
+            "bot_id": bot_id,
+            "name": f"{name} #{copy + 1}" if data.copies > 1 else name,
+            "description": plan.description,
+            "is_active": True,
+        }
+        for bot_id in bot_ids
+        for copy in range(data.copies)
+    ]
+    flow_ids = await db.run_sync(bulk_create_flows, flows_fields, plan.blocks, plan.connections)
+    
+    # Одно событие на бота: бот по любому событию сбрасывает активный flow,
+    # а событие на каждую копию только переполняло бы очередь publisher
+    last_flow_ids = {}
+    for fields, flow_id in zip(flows_fields, flow_ids):
+        last_flow_ids[fields["bot_id"]] = flow_id
+    for bot_id, flow_id in last_flow_ids.items():
+        publish_flow_event(FLOW_SAVED, bot_id, flow_id)
     
     return {
-        "flow_id": new_flow.id,
-        "name": new_flow.name,
+        "flow_ids": flow_ids,
         "template_id": data.template_id,
-        "blocks_created": len(created_blocks),
-        "connections_created": len(created_connections),
-        "message": f"Flow created from template '{template['name']}'"
+        "flows_created": len(flow_ids),
+        "blocks_created": len(flow_ids) * len(plan.blocks),
+        "connections_created": len(flow_ids) * len(plan.connections),
+        "message": f"{len(flow_ids)} flows created from template '{plan.name}'"
     }
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from datetime import datetime
+import json
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_user, owns_bot
 from app.models.bot import Bot
 from app.models.flow import Flow
 from app.models.block import Block
@@ -15,31 +18,52 @@ from app.schemas.flow import (
 )
 from app.schemas.block import BlockCreate, BlockUpdate, BlockResponse
 from app.schemas.connection import ConnectionCreate, ConnectionResponse
+from app.services.flow_events import publish_flow_event, FLOW_SAVED, FLOW_UPDATED, FLOW_DELETED
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/flows", tags=["flows"])
 
+async def get_owned_flow(db: AsyncSession, flow_id: int, user_id: int) -> Flow:
+    """Найти flow и владельца его бота одним запросом"""
+    row = (await db.execute(
+        select(Flow, Bot.user_id).join(Bot, Bot.id == Flow.bot_id).where(Flow.id == flow_id)
+    )).first()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Flow not found"
+        )
+    
+    flow, owner_id = row
+    if owner_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return flow
+
+def json_default(value):
+    """datetime в ISO формате при сериализации ответа"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
 # ============ FLOWS ============
 
 @router.post("", response_model=FlowResponse, status_code=status.HTTP_201_CREATED)
 async def create_flow(
     flow_data: FlowCreate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать новый flow"""
     
-    user_id = int(current_user["sub"])
-    
     # Проверяем что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == flow_data.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, flow_data.bot_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Bot not found"
@@ -53,10 +77,11 @@ async def create_flow(
     )
     
     db.add(flow)
-    db.commit()
-    db.refresh(flow)
+    await db.commit()
+    await db.refresh(flow)
     
-    logger.info(f"Flow created: {flow.name} (ID: {flow.id}) for bot {bot.id}")
+    logger.info(f"Flow created: {flow.name} (ID: {flow.id}) for bot {flow.bot_id}")
+    publish_flow_event(FLOW_SAVED, flow.bot_id, flow.id, flow.updated_at.isoformat())
     
     return FlowResponse.from_orm(flow)
 
@@ -64,29 +89,22 @@ async def create_flow(
 async def get_flows(
     bot_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     skip: int = 0,
     limit: int = 100
 ):
     """Получить список flows для бота"""
     
-    user_id = int(current_user["sub"])
-    
     # Проверяем что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, bot_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Bot not found"
         )
     
-    flows = db.query(Flow).filter(
+    flows = (await db.scalars(select(Flow).where(
         Flow.bot_id == bot_id
-    ).offset(skip).limit(limit).all()
+    ).offset(skip).limit(limit))).all()
     
     return [FlowListResponse.from_orm(flow) for flow in flows]
 
@@ -94,31 +112,13 @@ async def get_flows(
 async def get_flow(
     flow_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить flow по ID"""
     
     user_id = int(current_user["sub"])
     
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    
-    if not flow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Flow not found"
-        )
-    
-    # Проверяем что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    flow = await get_owned_flow(db, flow_id, user_id)
     
     return FlowResponse.from_orm(flow)
 
@@ -127,13 +127,11 @@ async def update_flow(
     flow_id: int,
     flow_data: FlowUpdate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить flow"""
     
-    user_id = int(current_user["sub"])
-    
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
     
     if not flow:
         raise HTTPException(
@@ -142,12 +140,7 @@ async def update_flow(
         )
     
     # Проверяем что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -158,10 +151,11 @@ async def update_flow(
     for field, value in update_data.items():
         setattr(flow, field, value)
     
-    db.commit()
-    db.refresh(flow)
+    await db.commit()
+    await db.refresh(flow)
     
     logger.info(f"Flow updated: {flow.name} (ID: {flow.id})")
+    publish_flow_event(FLOW_SAVED, flow.bot_id, flow.id, flow.updated_at.isoformat())
     
     return FlowResponse.from_orm(flow)
 
@@ -169,13 +163,11 @@ async def update_flow(
 async def delete_flow(
     flow_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить flow"""
     
-    user_id = int(current_user["sub"])
-    
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
     
     if not flow:
         raise HTTPException(
@@ -184,21 +176,17 @@ async def delete_flow(
         )
     
     # Проверяем что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    db.delete(flow)
-    db.commit()
+    await db.delete(flow)
+    await db.commit()
     
     logger.info(f"Flow deleted: {flow.name} (ID: {flow.id})")
+    publish_flow_event(FLOW_DELETED, flow.bot_id, flow_id)
     
     return None
 
@@ -209,26 +197,19 @@ async def create_block(
     flow_id: int,
     block_data: BlockCreate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать блок в flow"""
     
-    user_id = int(current_user["sub"])
-    
     # Проверяем доступ к flow
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
     if not flow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Flow not found"
         )
     
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -245,10 +226,11 @@ async def create_block(
     )
     
     db.add(block)
-    db.commit()
-    db.refresh(block)
+    await db.commit()
+    await db.refresh(block)
     
     logger.info(f"Block created: {block.title} (ID: {block.id}) in flow {flow_id}")
+    publish_flow_event(FLOW_UPDATED, flow.bot_id, flow_id)
     
     return BlockResponse.from_orm(block)
 
@@ -256,32 +238,16 @@ async def create_block(
 async def get_blocks(
     flow_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить все блоки flow"""
     
     user_id = int(current_user["sub"])
     
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    if not flow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Flow not found"
-        )
-    
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    await get_owned_flow(db, flow_id, user_id)
     
-    blocks = db.query(Block).filter(Block.flow_id == flow_id).all()
+    blocks = (await db.scalars(select(Block).where(Block.flow_id == flow_id))).all()
     
     return [BlockResponse.from_orm(block) for block in blocks]
 
@@ -291,16 +257,14 @@ async def update_block(
     block_id: int,
     block_data: BlockUpdate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить блок"""
     
-    user_id = int(current_user["sub"])
-    
-    block = db.query(Block).filter(
+    block = await db.scalar(select(Block).where(
         Block.id == block_id,
         Block.flow_id == flow_id
-    ).first()
+    ))
     
     if not block:
         raise HTTPException(
@@ -309,13 +273,8 @@ async def update_block(
         )
     
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -326,10 +285,11 @@ async def update_block(
     for field, value in update_data.items():
         setattr(block, field, value)
     
-    db.commit()
-    db.refresh(block)
+    await db.commit()
+    await db.refresh(block)
     
     logger.info(f"Block updated: {block.title} (ID: {block.id})")
+    publish_flow_event(FLOW_UPDATED, flow.bot_id, flow_id)
     
     return BlockResponse.from_orm(block)
 
@@ -338,16 +298,14 @@ async def delete_block(
     flow_id: int,
     block_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить блок"""
     
-    user_id = int(current_user["sub"])
-    
-    block = db.query(Block).filter(
+    block = await db.scalar(select(Block).where(
         Block.id == block_id,
         Block.flow_id == flow_id
-    ).first()
+    ))
     
     if not block:
         raise HTTPException(
@@ -356,22 +314,18 @@ async def delete_block(
         )
     
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    db.delete(block)
-    db.commit()
+    await db.delete(block)
+    await db.commit()
     
     logger.info(f"Block deleted: {block.title} (ID: {block.id})")
+    publish_flow_event(FLOW_UPDATED, flow.bot_id, flow_id)
     
     return None
 
@@ -382,26 +336,19 @@ async def create_connection(
     flow_id: int,
     connection_data: ConnectionCreate,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Создать связь между блоками"""
     
-    user_id = int(current_user["sub"])
-    
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
     if not flow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Flow not found"
         )
     
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -415,10 +362,11 @@ async def create_connection(
     )
     
     db.add(connection)
-    db.commit()
-    db.refresh(connection)
+    await db.commit()
+    await db.refresh(connection)
     
     logger.info(f"Connection created: {connection.from_block_id} -> {connection.to_block_id}")
+    publish_flow_event(FLOW_UPDATED, flow.bot_id, flow_id)
     
     return ConnectionResponse.from_orm(connection)
 
@@ -426,53 +374,82 @@ async def create_connection(
 async def get_connections(
     flow_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить все связи flow"""
     
     user_id = int(current_user["sub"])
     
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    if not flow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Flow not found"
-        )
+    await get_owned_flow(db, flow_id, user_id)
     
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
+    # Связи блоков flow - join вместо списка ID в IN (...)
+    connections = (await db.scalars(select(Connection).join(
+        Block, Block.id == Connection.from_block_id
+    ).where(Block.flow_id == flow_id))).all()
     
-    if not bot:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
-        )
+    return [ConnectionResponse.from_orm(conn) for conn in connections]
+
+@router.get("/{flow_id}/graph")
+async def get_flow_graph(
+    flow_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить flow целиком: flow, блоки и связи
     
-    # Получаем все блоки flow
-    block_ids = [block.id for block in db.query(Block.id).filter(Block.flow_id == flow_id).all()]
+    Три запроса (flow с владельцем, блоки, связи через join) вместо
+    отдельных вызовов get_flow / get_blocks / get_connections, строки
+    сериализуются в JSON без ORM объектов и pydantic моделей.
+    """
     
-    # Получаем связи
-    connections = db.query(Connection).filter(
-        Connection.from_block_id.in_(block_ids)
-    ).all()
+    user_id = int(current_user["sub"])
     
-    return [ConnectionResponse.from_orm(conn) for conn in connections]
+    flow = await get_owned_flow(db, flow_id, user_id)
+    
+    blocks = (await db.execute(select(
+        Block.id, Block.flow_id, Block.title, Block.type, Block.content,
+        Block.position_x, Block.position_y, Block.created_at, Block.updated_at
+    ).where(Block.flow_id == flow_id).order_by(Block.id))).all()
+    
+    connections = (await db.execute(select(
+        Connection.id, Connection.from_block_id, Connection.to_block_id,
+        Connection.label, Connection.created_at
+    ).join(
+        Block, Block.id == Connection.from_block_id
+    ).where(Block.flow_id == flow_id).order_by(Connection.id))).all()
+    
+    graph = {
+        "flow": {
+            "id": flow.id,
+            "bot_id": flow.bot_id,
+            "name": flow.name,
+            "description": flow.description,
+            "is_active": flow.is_active,
+            "is_published": flow.is_published,
+            "start_block_id": flow.start_block_id,
+            "created_at": flow.created_at,
+            "updated_at": flow.updated_at,
+        },
+        "blocks": [row._asdict() for row in blocks],
+        "connections": [row._asdict() for row in connections],
+    }
+    
+    return Response(
+        content=json.dumps(graph, default=json_default, ensure_ascii=False),
+        media_type="application/json"
+    )
 
 @router.delete("/{flow_id}/connections/{connection_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_connection(
     flow_id: int,
     connection_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить связь"""
     
-    user_id = int(current_user["sub"])
-    
-    connection = db.query(Connection).filter(Connection.id == connection_id).first()
+    connection = await db.scalar(select(Connection).where(Connection.id == connection_id))
     
     if not connection:
         raise HTTPException(
@@ -481,21 +458,17 @@ async def delete_connection(
         )
     
     # Проверяем доступ
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
-    
-    if not bot:
+    flow = await db.scalar(select(Flow).where(Flow.id == flow_id))
+    if not await owns_bot(db, current_user, flow.bot_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    db.delete(connection)
-    db.commit()
+    await db.delete(connection)
+    await db.commit()
     
     logger.info(f"Connection deleted: ID {connection_id}")
+    publish_flow_event(FLOW_UPDATED, flow.bot_id, flow_id)
     
     return None
@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from pydantic import BaseModel, ValidationError
+import json
+import zlib
 
 from app.core.database import get_db
 from app.core.security import get_current_user
+from app.api.v1.flows import get_owned_flow
 from app.models.bot import Bot
 from app.models.flow import Flow
 from app.models.block import Block
 from app.models.connection import Connection
+from app.services.flow_import import bulk_import_flow, FlowImportError
+from app.services.flow_events import publish_flow_event, FLOW_SAVED
 
 router = APIRouter()
 
+# Строк, читаемых курсором за раз при экспорте
+EXPORT_BATCH_SIZE = 500
+
 
 class BlockImport(BaseModel):
     title: str
@@ -24,44 +34,27 @@ class BlockImport(BaseModel):
 class ConnectionImport(BaseModel):
     from_index: int  # индекс блока в массиве blocks
     to_index: int
+    label: Optional[str] = None
 
 
-class FlowImport(BaseModel):
+class FlowImportHeader(BaseModel):
     bot_id: int
     name: str
     description: Optional[str] = None
     is_active: bool = True
-    blocks: List[BlockImport]
-    connections: List[ConnectionImport]
 
 
-class FlowExport(BaseModel):
-    id: int
-    bot_id: int
-    name: str
-    description: Optional[str]
-    is_active: bool
-    blocks: List[Dict[str, Any]]
-    connections: List[Dict[str, Any]]
+class FlowImport(FlowImportHeader):
+    blocks: List[BlockImport]
+    connections: List[ConnectionImport]
 
 
-@router.post("/flows/import", status_code=status.HTTP_201_CREATED)
-def import_flow(
-    flow_data: FlowImport,
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user)
-):
-    """
-    Импорт Flow со всеми блоками и связями одним запросом
-    """
-    # Получаем user_id из токена
-    user_id = int(current_user["sub"])
-    
-    # Проверка что бот принадлежит пользователю
-    bot = db.query(Bot).filter(
-        Bot.id == flow_data.bot_id,
+async def get_owned_bot(db: AsyncSession, bot_id: int, user_id: int) -> Bot:
+    """Бот пользователя или 404"""
+    bot = await db.scalar(select(Bot).where(
+        Bot.id == bot_id,
         Bot.user_id == user_id
-    ).first()
+    ))
     
     if not bot:
         raise HTTPException(
@@ -69,126 +62,220 @@ def import_flow(
             detail="Bot not found"
         )
     
-    # Создаем Flow
-    new_flow = Flow(
-        bot_id=flow_data.bot_id,
-        name=flow_data.name,
-        description=flow_data.description,
-        is_active=flow_data.is_active
-    )
-    db.add(new_flow)
-    db.commit()
-    db.refresh(new_flow)
-    
-    # Создаем блоки и сохраняем их ID
-    created_blocks = []
-    for block_data in flow_data.blocks:
-        new_block = Block(
-            flow_id=new_flow.id,
-            title=block_data.title,
-            type=block_data.type,
-            content=block_data.content,
-            position_x=block_data.position_x,
-            position_y=block_data.position_y
-        )
-        db.add(new_block)
-        db.commit()
-        db.refresh(new_block)
-        created_blocks.append(new_block)
-    
-    # Создаем связи используя индексы
-    created_connections = []
-    for conn_data in flow_data.connections:
-        if conn_data.from_index >= len(created_blocks) or conn_data.to_index >= len(created_blocks):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid block index in connections"
-            )
-        
-        new_connection = Connection(
-            from_block_id=created_blocks[conn_data.from_index].id,
-            to_block_id=created_blocks[conn_data.to_index].id
+    return bot
+
+
+async def run_import(db: AsyncSession, header: Dict[str, Any], blocks: List[Dict[str, Any]],
+                     connections: List[Tuple[int, int, Optional[str]]], user_id: int) -> Dict[str, Any]:
+    """Проверить владельца и выполнить пакетный импорт"""
+    await get_owned_bot(db, header["bot_id"], user_id)
+    
+    try:
+        # Пакетная вставка написана для Session - run_sync выполняет её на соединении AsyncSession
+        new_flow = await db.run_sync(bulk_import_flow, header, blocks, connections)
+    except FlowImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        db.add(new_connection)
-        db.commit()
-        db.refresh(new_connection)
-        created_connections.append(new_connection)
+    
+    publish_flow_event(FLOW_SAVED, new_flow.bot_id, new_flow.id, new_flow.updated_at.isoformat())
     
     return {
         "flow_id": new_flow.id,
         "name": new_flow.name,
-        "blocks_created": len(created_blocks),
-        "connections_created": len(created_connections),
+        "blocks_created": len(blocks),
+        "connections_created": len(connections),
         "message": "Flow imported successfully"
     }
 
 
-@router.get("/flows/{flow_id}/export", response_model=FlowExport)
-def export_flow(
-    flow_id: int,
-    db: Session = Depends(get_db),
+@router.post("/flows/import", status_code=status.HTTP_201_CREATED)
+async def import_flow(
+    flow_data: FlowImport,
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Экспорт Flow со всеми блоками и связями
+    Импорт Flow со всеми блоками и связями одним запросом (одна транзакция)
     """
     # Получаем user_id из токена
     user_id = int(current_user["sub"])
     
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    header = flow_data.dict(include={"bot_id", "name", "description", "is_active"})
+    blocks = [block.dict() for block in flow_data.blocks]
+    connections = [(conn.from_index, conn.to_index, conn.label) for conn in flow_data.connections]
     
-    if not flow:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Flow not found"
-        )
+    return await run_import(db, header, blocks, connections, user_id)
+
+
+@router.post("/flows/import/ndjson", status_code=status.HTTP_201_CREATED)
+async def import_flow_ndjson(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Импорт большого Flow потоком NDJSON (Content-Type: application/x-ndjson)
     
-    # Проверка владельца
-    bot = db.query(Bot).filter(
-        Bot.id == flow.bot_id,
-        Bot.user_id == user_id
-    ).first()
+    Первая строка - flow: {"bot_id", "name", "description", "is_active"},
+    далее по строке на объект: {"block": {...}} или {"connection": {...}}.
+    Тело разбирается по мере поступления, без загрузки целиком.
+    """
+    user_id = int(current_user["sub"])
     
-    if not bot:
+    header = None
+    blocks: List[Dict[str, Any]] = []
+    connections: List[Tuple[int, int, Optional[str]]] = []
+    line_number = 0
+    buffer = b""
+    
+    def parse_line(raw: bytes):
+        nonlocal header
+        if not raw.strip():
+            return
+        try:
+            item = json.loads(raw)
+            if header is None:
+                header = FlowImportHeader(**item).dict()
+            elif "block" in item:
+                blocks.append(BlockImport(**item["block"]).dict())
+            elif "connection" in item:
+                conn = ConnectionImport(**item["connection"])
+                connections.append((conn.from_index, conn.to_index, conn.label))
+            else:
+                raise ValueError("expected 'block' or 'connection'")
+        except (ValueError, TypeError, ValidationError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid NDJSON line {line_number}: {e}"
+            )
+    
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line_number += 1
+            parse_line(raw)
+    line_number += 1
+    parse_line(buffer)
+    
+    if header is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty import"
         )
     
-    # Получаем блоки
-    blocks = db.query(Block).filter(Block.flow_id == flow_id).all()
-    
-    # Получаем связи
-    connections = db.query(Connection).filter(Connection.flow_id == flow_id).all()
-    
-    # Формируем ответ
-    blocks_data = [
-        {
-            "id": block.id,
-            "title": block.title,
-            "type": block.type,
-            "content": block.content,
-            "position_x": block.position_x,
-            "position_y": block.position_y
-        }
-        for block in blocks
-    ]
-    
-    connections_data = [
-        {
-            "id": conn.id,
-            "from_block_id": conn.from_block_id,
-            "to_block_id": conn.to_block_id
-        }
-        for conn in connections
-    ]
+    return await run_import(db, header, blocks, connections, user_id)
+
+
+async def iter_export(db: AsyncSession, flow: Flow, fmt: str) -> AsyncIterator[bytes]:
+    """Строки экспорта flow: блоки и связи читаются курсором пачками
     
-    return {
+    Строки выбираются колонками (без ORM объектов) через yield_per,
+    поэтому память не зависит от размера flow. В ndjson связи содержат
+    и индексы блоков - такой файл принимает /flows/import/ndjson.
+    """
+    flow_fields = {
         "id": flow.id,
         "bot_id": flow.bot_id,
         "name": flow.name,
         "description": flow.description,
         "is_active": flow.is_active,
-        "blocks": blocks_data,
-        "connections": connections_data
     }
+    
+    blocks = await db.stream(
+        select(Block.id, Block.title, Block.type, Block.content, Block.position_x, Block.position_y)
+        .where(Block.flow_id == flow.id)
+        .order_by(Block.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    
+    async def select_connections():
+        # Связи блоков flow (у Connection нет flow_id - фильтр через блок-источник).
+        # Курсор открывается после того, как курсор блоков прочитан
+        return await db.stream(
+            select(Connection.id, Connection.from_block_id, Connection.to_block_id, Connection.label)
+            .join(Block, Block.id == Connection.from_block_id)
+            .where(Block.flow_id == flow.id)
+            .order_by(Connection.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+    
+    if fmt == "ndjson":
+        yield json.dumps(flow_fields, ensure_ascii=False).encode() + b"\n"
+        
+        block_indexes: Dict[int, int] = {}
+        async for row in blocks:
+            block_indexes[row.id] = len(block_indexes)
+            yield json.dumps({"block": row._asdict()}, ensure_ascii=False).encode() + b"\n"
+        
+        async for row in await select_connections():
+            connection = row._asdict()
+            connection["from_index"] = block_indexes.get(row.from_block_id)
+            connection["to_index"] = block_indexes.get(row.to_block_id)
+            yield json.dumps({"connection": connection}, ensure_ascii=False).encode() + b"\n"
+        return
+    
+    yield json.dumps(flow_fields, ensure_ascii=False)[:-1].encode() + b', "blocks": ['
+    separator = b""
+    async for row in blocks:
+        yield separator + json.dumps(row._asdict(), ensure_ascii=False).encode()
+        separator = b", "
+    yield b'], "connections": ['
+    separator = b""
+    async for row in await select_connections():
+        yield separator + json.dumps(row._asdict(), ensure_ascii=False).encode()
+        separator = b", "
+    yield b"]}"
+
+
+async def compress_stream(chunks: AsyncIterator[bytes], compressor) -> AsyncIterator[bytes]:
+    """Сжимать поток по мере выдачи"""
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@router.get("/flows/{flow_id}/export")
+async def export_flow(
+    flow_id: int,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    compress: Optional[str] = Query(None, pattern="^(gzip|zstd)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Экспорт Flow со всеми блоками и связями потоком (json или ndjson, опционально gzip/zstd)
+    """
+    # Получаем user_id из токена
+    user_id = int(current_user["sub"])
+    
+    flow = await get_owned_flow(db, flow_id, user_id)
+    
+    chunks = iter_export(db, flow, format)
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    filename = f"flow-{flow_id}.{format}"
+    
+    if compress == "gzip":
+        # wbits=31 - формат gzip
+        chunks = compress_stream(chunks, zlib.compressobj(6, zlib.DEFLATED, 31))
+        media_type, filename = "application/gzip", filename + ".gz"
+    elif compress == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="zstd compression is not available"
+            )
+        chunks = compress_stream(chunks, zstandard.ZstdCompressor().compressobj())
+        media_type, filename = "application/zstd", filename + ".zst"
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -24,11 +24,29 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
     TELEGRAM_WEBHOOK_URL: str = os.getenv("TELEGRAM_WEBHOOK_URL", "")
     
+    # Рассылки (лимит Telegram ~30 сообщений/сек на бота)
+    BROADCAST_RATE: float = float(os.getenv("BROADCAST_RATE", "25"))
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+    BROADCAST_BATCH_SIZE: int = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))
+    # Через сколько секунд без heartbeat рассылку может забрать другой воркер
+    BROADCAST_HEARTBEAT_TIMEOUT: float = float(os.getenv("BROADCAST_HEARTBEAT_TIMEOUT", "60"))
+    # Как часто каждый воркер ищет рассылки с устаревшим heartbeat (упавший владелец)
+    BROADCAST_SWEEP_INTERVAL: float = float(os.getenv("BROADCAST_SWEEP_INTERVAL", "30"))
+    
     # JWT
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
     
+    # Кэш проверенных токенов и пользователей (записей, секунд)
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "60"))
+    
+    # Пароли: схема новых хешей (bcrypt / argon2), стоимость bcrypt, потоков хеширования
+    PASSWORD_HASH_SCHEME: str = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+    PASSWORD_BCRYPT_ROUNDS: int = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    
     # Integrации (опционально)
     PRODAMUS_API_KEY: str = os.getenv("PRODAMUS_API_KEY", "")
     STRIPE_API_KEY: str = os.getenv("STRIPE_API_KEY", "")
@@ -37,6 +55,17 @@ class Settings(BaseSettings):
     # Redis (опционально)
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     
+    # События изменения flows для ботов (Redis pub/sub)
+    FLOW_EVENTS_ENABLED: bool = os.getenv("FLOW_EVENTS_ENABLED", "true").lower() == "true"
+    FLOW_EVENTS_CHANNEL: str = os.getenv("FLOW_EVENTS_CHANNEL", "flows:events")
+    
+    # Шаблоны flows: файл или каталог *.json (по умолчанию app/templates/flows)
+    FLOW_TEMPLATES_PATH: str = os.getenv("FLOW_TEMPLATES_PATH", "")
+    FLOW_TEMPLATES_CHECK_INTERVAL: float = float(os.getenv("FLOW_TEMPLATES_CHECK_INTERVAL", "2"))
+    FLOW_TEMPLATES_ADMIN_TOKEN: str = os.getenv("FLOW_TEMPLATES_ADMIN_TOKEN", "")
+    # Предел строк (flows + блоки + связи), создаваемых одним массовым запросом
+    FLOW_TEMPLATES_BULK_MAX_ROWS: int = int(os.getenv("FLOW_TEMPLATES_BULK_MAX_ROWS", "100000"))
+    
     # Email (опционально)
     SMTP_SERVER: str = os.getenv("SMTP_SERVER", "smtp.gmail.com")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
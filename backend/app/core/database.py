@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from typing import AsyncIterator
 from app.core.config import settings
 import logging
 
@@ -28,23 +30,57 @@ else:
         echo=settings.DEBUG
     )
 
-# Session factory
+# Session factory (фоновые задачи и init_db)
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+def make_async_url(url: str) -> str:
+    """URL для асинхронного драйвера: sqlite -> aiosqlite, postgresql -> asyncpg"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+ASYNC_DATABASE_URL = make_async_url(DATABASE_URL)
+
+# Асинхронный движок для обработчиков API - запросы не блокируют event loop
+if "sqlite" in ASYNC_DATABASE_URL:
+    # Без явного пула aiosqlite для файла берет NullPool - соединение
+    # и его поток открывались бы заново на каждый запрос
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=10,
+        max_overflow=20,
+        echo=settings.DEBUG
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=10,
+        max_overflow=20,
+        echo=settings.DEBUG
+    )
+
+# expire_on_commit=False: после commit атрибуты читаются без неявного запроса
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Base для моделей
 Base = declarative_base()
 
-def get_db() -> Session:
-    """Dependency для получения сессии БД"""
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency для получения асинхронной сессии БД"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def init_db():
     """Инициализация БД - создание всех таблиц"""
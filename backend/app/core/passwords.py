@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def create_context(scheme: str = "bcrypt", bcrypt_rounds: int = 12) -> CryptContext:
+    """Контекст хеширования паролей
+
+    Новые хеши - схемой scheme (bcrypt или argon2, для argon2 нужен
+    argon2-cffi). Старые несолёные SHA-256 (hex_sha256) и хеши другой
+    схемы или меньшей стоимости проверяются, но помечаются устаревшими -
+    при успешном входе их нужно перехешировать.
+    """
+    schemes = list(dict.fromkeys([scheme, "bcrypt", "hex_sha256"]))
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+    )
+
+
+class PasswordHasher:
+    """Хеширование паролей вне event loop
+
+    bcrypt/argon2 занимают ~100 мс CPU и отпускают GIL, поэтому
+    выполняются в ограниченном пуле потоков: запросы не блокируют
+    event loop, а одновременных хеширований не больше max_workers
+    (остальные ждут в очереди, не перегружая CPU).
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int = 4):
+        self.context = context
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Хеш для проверки несуществующего пользователя - чтобы время ответа не выдавало,
+        # есть ли такой логин
+        self._dummy_hash: Optional[str] = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """(пароль верный, новый хеш или None, если перехешировать не нужно)"""
+        if not password_hash:
+            if self._dummy_hash is None:
+                self._dummy_hash = await self.hash("dummy-password")
+            await self._run(self.context.verify, password, self._dummy_hash)
+            return False, None
+        try:
+            return await self._run(self.context.verify_and_update, password, password_hash)
+        except ValueError:
+            # Хеш неизвестного формата
+            logger.warning("Unknown password hash format")
+            return False, None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+pwd_context = create_context(settings.PASSWORD_HASH_SCHEME, settings.PASSWORD_BCRYPT_ROUNDS)
+password_hasher = PasswordHasher(pwd_context, settings.PASSWORD_HASH_WORKERS)
@@ -1,24 +1,39 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import Optional, Dict, Any
+from jose import JWTError, jwt, jwk
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.passwords import pwd_context, password_hasher
+from app.core.auth_cache import TTLCache
 from app.models.user import User
-import hashlib
+from app.models.bot import Bot
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 # Bearer token scheme
 security = HTTPBearer()
 
+# Ключ проверки подписи JWT готовится один раз, а не на каждый запрос
+jwt_key = jwk.construct(settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM)
+
+# Проверенные токены (до истечения exp) и пользователи с id их ботов.
+# Кэши локальны для процесса: изменения в других воркерах видны через AUTH_CACHE_TTL
+token_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+principal_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
 def hash_password(password: str) -> str:
-    """Хешировать пароль (SHA256)"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Хешировать пароль (синхронно; в обработчиках - password_hasher.hash)"""
+    return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверить пароль"""
-    return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
+    """Проверить пароль (bcrypt/argon2 или старый SHA256)"""
+    return pwd_context.verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Создать JWT токен"""
@@ -39,12 +54,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def decode_token(token: str) -> dict:
     """Декодировать JWT токен"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    
     try:
         payload = jwt.decode(
             token,
-            settings.JWT_SECRET_KEY,
+            jwt_key,
             algorithms=[settings.JWT_ALGORITHM]
         )
+        if "exp" in payload:
+            token_cache.set(token, payload, payload["exp"] - time.time())
         return payload
     except JWTError:
         raise HTTPException(
@@ -55,7 +76,7 @@ def decode_token(token: str) -> dict:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """Получить текущего пользователя из токена"""
     token = credentials.credentials
@@ -68,29 +89,78 @@ async def get_current_user(
             detail="Invalid authentication credentials"
         )
     
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if user is None:
+    principal = principal_cache.get(int(user_id))
+    if principal is None:
+        principal = await load_principal(db, int(user_id))
+    
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    if not user.is_active:
+    if not principal["is_active"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
     
-    return {"sub": str(user.id), "username": user.username, "email": user.email}
+    return principal
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Аутентифицировать пользователя"""
-    user = db.query(User).filter(User.username == username).first()
-    
-    if not user:
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[Dict[str, Any]]:
+    """Загрузить пользователя и id его ботов в кэш"""
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if user is None:
         return None
     
-    if not verify_password(password, user.password_hash):
+    bot_ids = frozenset((await db.scalars(select(Bot.id).where(Bot.user_id == user_id))).all())
+    principal = {
+        "sub": str(user.id),
+        "username": user.username,
+        "email": user.email,
+        "is_active": user.is_active,
+        "bot_ids": bot_ids,
+    }
+    principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_user(user_id: int):
+    """Сбросить кэш пользователя (после изменения пользователя или его ботов)"""
+    principal_cache.pop(int(user_id))
+
+async def owns_bot(db: AsyncSession, current_user: dict, bot_id: int) -> bool:
+    """Принадлежит ли бот пользователю
+    
+    Обычно ответ берется из кэша; бота нет в кэше (например, создан
+    в другом воркере) - проверка по базе.
+    """
+    if bot_id in current_user.get("bot_ids", ()):
+        return True
+    
+    user_id = int(current_user["sub"])
+    owned = await db.scalar(select(Bot.id).where(Bot.id == bot_id, Bot.user_id == user_id)) is not None
+    if owned:
+        invalidate_user(user_id)
+    return owned
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """Аутентифицировать пользователя
+    
+    Хеш проверяется в пуле потоков. Устаревший хеш (SHA256, другая схема
+    или меньшая стоимость) после успешной проверки заменяется новым.
+    """
+    user = await db.scalar(select(User).where(User.username == username))
+    
+    valid, new_hash = await password_hasher.verify_and_update(
+        password, user.password_hash if user else None
+    )
+    
+    if not user or not valid:
         return None
     
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+        logger.info(f"Password hash upgraded for user {user.id}")
+    
     return user
\ No newline at end of file
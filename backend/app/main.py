@@ -7,7 +7,11 @@ import sys
 import os
 
 from app.core import settings, init_db
-from app.api.v1 import auth, bots, flows
+from app.core.passwords import password_hasher
+from app.core.database import async_engine
+from app.tasks.broadcast import resume_broadcasts, start_sweeper, stop_sweeper
+from app.services.flow_events import publisher as flow_event_publisher
+from app.api.v1 import auth, bots, flows, broadcasts
 from app.api.v1 import flows_import
 from app.api.v1 import flow_templates
 
@@ -56,6 +60,7 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/v1")
 app.include_router(bots.router, prefix="/api/v1")
 app.include_router(flows.router, prefix="/api/v1")
+app.include_router(broadcasts.router, prefix="/api/v1")
 app.include_router(flows_import.router, prefix="/api/v1", tags=["flows-import"])
 app.include_router(flow_templates.router, prefix="/api/v1", tags=["flow-templates"])
 
@@ -73,11 +78,30 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Database initialization failed: {str(e)}")
         raise
+    
+    # Продолжаем рассылки, прерванные перезапуском, и дальше периодически
+    # забираем рассылки упавших воркеров
+    await resume_broadcasts()
+    start_sweeper()
+    
+    # События flows для ботов публикуются фоновой задачей
+    if settings.FLOW_EVENTS_ENABLED:
+        await flow_event_publisher.start()
+    
+    # Шаблоны flows загружаем и проверяем сразу, а не на первом запросе
+    try:
+        flow_templates.registry.reload()
+    except Exception as e:
+        logger.error(f"❌ Flow templates not loaded: {str(e)}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при остановке приложения"""
     logger.info(f"🛑 Shutting down {settings.APP_NAME}")
+    await stop_sweeper()
+    await flow_event_publisher.close()
+    password_hasher.close()
+    await async_engine.dispose()
 
 # Маршруты здоровья
 @app.get("/health")
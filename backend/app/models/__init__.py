@@ -4,6 +4,7 @@ from app.models.flow import Flow
 from app.models.block import Block
 from app.models.connection import Connection
 from app.models.bot_user import BotUser
+from app.models.broadcast import Broadcast
 
 __all__ = [
     "User",
@@ -12,4 +13,5 @@ __all__ = [
     "Block",
     "Connection",
     "BotUser",
+    "Broadcast",
 ]
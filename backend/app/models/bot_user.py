@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Boolean, Index
 from datetime import datetime
 from app.core.database import Base
 
 class BotUser(Base):
     """Пользователь бота в Telegram"""
     __tablename__ = "bot_users"
+    __table_args__ = (
+        # Keyset пагинация аудитории бота (рассылки)
+        Index("ix_bot_users_bot_id_id", "bot_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from datetime import datetime
+from app.core.database import Base
+
+class Broadcast(Base):
+    """Рассылка сообщения всем пользователям бота"""
+    __tablename__ = "broadcasts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    bot_id = Column(Integer, ForeignKey("bots.id"), nullable=False, index=True)
+    
+    # Сообщение
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(20), nullable=True)  # HTML, MarkdownV2
+    
+    # Статус: pending, running, completed, cancelled, failed
+    status = Column(String(20), default="pending", nullable=False, index=True)
+    
+    # Чекпоинт: последний обработанный BotUser.id (keyset пагинация)
+    last_bot_user_id = Column(Integer, default=0, nullable=False)
+    
+    # Воркер, выполняющий рассылку, и время его последнего heartbeat
+    owner = Column(String(100), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    
+    # Статистика
+    sent_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    blocked_count = Column(Integer, default=0)
+    
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def throughput(self) -> float:
+        """Сообщений в секунду с момента старта"""
+        if not self.started_at:
+            return 0.0
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        processed = (self.sent_count or 0) + (self.failed_count or 0) + (self.blocked_count or 0)
+        return round(processed / elapsed, 2) if elapsed > 0 else 0.0
@@ -29,6 +29,10 @@ from app.schemas.connection import (
 from app.schemas.bot_user import (
     BotUserResponse
 )
+from app.schemas.broadcast import (
+    BroadcastCreate,
+    BroadcastResponse
+)
 
 __all__ = [
     "UserCreate", "UserLogin", "UserUpdate", "UserResponse", "TokenResponse",
@@ -37,4 +41,5 @@ __all__ = [
     "BlockCreate", "BlockUpdate", "BlockResponse",
     "ConnectionCreate", "ConnectionResponse",
     "BotUserResponse",
+    "BroadcastCreate", "BroadcastResponse",
 ]
@@ -0,0 +1,28 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+
+class BroadcastCreate(BaseModel):
+    """Схема для создания рассылки"""
+    bot_id: int
+    text: str = Field(..., min_length=1, max_length=4096)
+    parse_mode: Optional[str] = None
+
+class BroadcastResponse(BaseModel):
+    """Схема ответа рассылки"""
+    id: int
+    bot_id: int
+    text: str
+    parse_mode: Optional[str]
+    status: str
+    last_bot_user_id: int
+    sent_count: int
+    failed_count: int
+    blocked_count: int
+    throughput: float
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import logging
+from typing import List, Tuple, Optional
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.bot_user import BotUser
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+# Результаты отправки одному получателю
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class RateLimiter:
+    """Асинхронный token bucket: не больше rate отправок в секунду"""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Flood wait от Telegram - обнуляем запас на seconds секунд"""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class TelegramSender:
+    """Отправка сообщений через Bot API с общим HTTP пулом"""
+    
+    def __init__(self, token: str, rate: float = 25.0, concurrency: int = 20, max_retries: int = 3):
+        self.token = token
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(
+            base_url=f"{TELEGRAM_API_URL}/bot{token}",
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+    
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None) -> str:
+        """Отправить сообщение, вернуть SENT / BLOCKED / FAILED"""
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        
+        for _ in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                resp = await self._client.post("/sendMessage", json=payload)
+            except httpx.HTTPError as e:
+                logger.warning(f"Broadcast send to {chat_id} failed: {e!r}")
+                continue
+            
+            if resp.status_code == 200:
+                return SENT
+            if resp.status_code == 403:
+                # Пользователь заблокировал бота
+                return BLOCKED
+            if resp.status_code == 429:
+                self.limiter.pause(self._retry_after(resp))
+                continue
+            if resp.status_code < 500:
+                return FAILED
+        
+        return FAILED
+    
+    @staticmethod
+    def _retry_after(resp: httpx.Response) -> float:
+        """retry_after из ответа 429 (тело может быть не JSON - например, от прокси)"""
+        try:
+            return float(resp.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(resp.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+    
+    async def close(self):
+        await self._client.aclose()
+
+
+async def fetch_recipient_batch(
+    db: AsyncSession,
+    bot_id: int,
+    after_id: int = 0,
+    batch_size: int = 500
+) -> List[Tuple[int, int]]:
+    """Следующая пачка (BotUser.id, telegram_user_id) по keyset пагинации, без заблокировавших бота"""
+    rows = await db.execute(select(BotUser.id, BotUser.telegram_user_id).where(
+        BotUser.bot_id == bot_id,
+        BotUser.id > after_id,
+        BotUser.is_blocked == False  # noqa: E712
+    ).order_by(BotUser.id).limit(batch_size))
+    return [(row.id, row.telegram_user_id) for row in rows]
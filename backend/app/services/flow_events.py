@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+import logging
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# События изменения flows (тот же формат, что у api/flows.py)
+FLOW_SAVED = "saved"
+FLOW_UPDATED = "updated"
+FLOW_DELETED = "deleted"
+
+
+class FlowEventPublisher:
+    """Публикация событий flows в Redis из фоновой задачи
+
+    Обработчик только кладёт событие в очередь и не ждёт Redis: медленный
+    или недоступный Redis не задерживает запросы. Одна задача публикует
+    события по порядку. При переполнении очереди или ошибке Redis событие
+    теряется - боты перепроверят flow по TTL кэша.
+    """
+
+    def __init__(self, url: str, channel: str, queue_size: int = 1000):
+        self.url = url
+        self.channel = channel
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._redis = None
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self._task is not None:
+            return
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    def publish(self, payload: str):
+        """Поставить событие в очередь (не блокирует)"""
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Flow events queue is full, event dropped")
+
+    async def _run(self):
+        while True:
+            payload = await self._queue.get()
+            try:
+                await self._redis.publish(self.channel, payload)
+                self.published += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.warning(f"Flow event not published: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def close(self, timeout: float = 2.0):
+        """Дослать очередь (не дольше timeout) и остановить задачу"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Flow events not published on shutdown: {self._queue.qsize()}")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        await self._redis.close()
+        self._task = None
+        self._queue = None
+        self._redis = None
+
+
+publisher = FlowEventPublisher(settings.REDIS_URL, settings.FLOW_EVENTS_CHANNEL)
+
+
+def publish_flow_event(event: str, bot_id: int, flow_id, updated_at: Optional[str] = None):
+    """Опубликовать изменение flow в канал, на который подписаны боты
+
+    Не ждёт Redis: событие отправит фоновая задача publisher.
+    """
+    if not settings.FLOW_EVENTS_ENABLED:
+        return
+
+    publisher.publish(json.dumps({
+        "event": event,
+        "bot_id": bot_id,
+        "flow_id": str(flow_id),
+        "updated_at": updated_at,
+        "ts": time.time(),
+    }))
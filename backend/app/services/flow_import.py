@@ -0,0 +1,134 @@
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.flow import Flow
+from app.models.block import Block
+from app.models.connection import Connection
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном executemany
+IMPORT_BATCH_SIZE = 1000
+
+
+class FlowImportError(ValueError):
+    """Некорректные данные импорта"""
+
+
+def validate_connections(blocks_count: int, connections: List[Tuple[int, int, Optional[str]]]):
+    """Проверить индексы блоков во всех связях до записи в базу"""
+    for position, (from_index, to_index, _) in enumerate(connections):
+        if not (0 <= from_index < blocks_count and 0 <= to_index < blocks_count):
+            raise FlowImportError(
+                f"Invalid block index in connection #{position}: {from_index} -> {to_index} "
+                f"(blocks: {blocks_count})"
+            )
+
+
+def insert_returning_ids(db: Session, model, rows: List[Dict[str, Any]], batch_size: int = IMPORT_BATCH_SIZE) -> List[int]:
+    """Вставить строки пачками, вернуть их id в порядке rows
+
+    PostgreSQL сопоставляет id со строками через sort_by_parameter_order.
+    SQLite так не умеет (нет sentinel) - SQLAlchemy вставлял бы по строке,
+    поэтому там пачка вставляется одним запросом без сортировки: rowid
+    INTEGER PRIMARY KEY внутри транзакции растут в порядке вставки.
+    """
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    ids: List[int] = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if sqlite:
+            result = db.execute(insert(model).returning(model.id), batch)
+            ids.extend(sorted(result.scalars().all()))
+        else:
+            result = db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), batch)
+            ids.extend(result.scalars().all())
+    return ids
+
+
+def insert_graphs(
+    db: Session,
+    flow_ids: List[int],
+    blocks: List[Dict[str, Any]],
+    connections: List[Tuple[int, int, Optional[str]]],
+    batch_size: int = IMPORT_BATCH_SIZE
+):
+    """Вставить одинаковый граф блоков и связей в каждый из flow_ids (без commit)
+
+    id блоков возвращаются в порядке входных строк, поэтому блок i
+    копии k - это block_ids[k * len(blocks) + i].
+    """
+    rows = [{**block, "flow_id": flow_id} for flow_id in flow_ids for block in blocks]
+    block_ids = insert_returning_ids(db, Block, rows, batch_size)
+    
+    connection_rows = [
+        {
+            "from_block_id": block_ids[offset + from_index],
+            "to_block_id": block_ids[offset + to_index],
+            "label": label,
+        }
+        for offset in range(0, len(block_ids), len(blocks) or 1)
+        for from_index, to_index, label in connections
+    ]
+    for start in range(0, len(connection_rows), batch_size):
+        db.execute(insert(Connection), connection_rows[start:start + batch_size])
+
+
+def bulk_import_flow(
+    db: Session,
+    flow_fields: Dict[str, Any],
+    blocks: List[Dict[str, Any]],
+    connections: List[Tuple[int, int, Optional[str]]],
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> Flow:
+    """Создать flow с блоками и связями в одной транзакции
+
+    blocks - поля блоков (title, type, content, position_x, position_y),
+    connections - (индекс from, индекс to, label). Блоки вставляются
+    пачками insert().returning(id) в порядке входных данных, затем
+    связи - пачками executemany. При любой ошибке откатывается всё.
+    """
+    validate_connections(len(blocks), connections)
+
+    try:
+        flow = Flow(**flow_fields)
+        db.add(flow)
+        db.flush()
+        insert_graphs(db, [flow.id], blocks, connections, batch_size)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    db.refresh(flow)
+    logger.info(f"Flow imported: {flow.name} (ID: {flow.id}), {len(blocks)} blocks, {len(connections)} connections")
+    return flow
+
+
+def bulk_create_flows(
+    db: Session,
+    flows_fields: List[Dict[str, Any]],
+    blocks: List[Dict[str, Any]],
+    connections: List[Tuple[int, int, Optional[str]]],
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> List[int]:
+    """Создать несколько flows с одним и тем же графом в одной транзакции
+
+    Для массового создания из шаблона: flows, блоки всех копий и связи
+    вставляются пачками, количество запросов не зависит от числа копий
+    (только от batch_size). Возвращает id flows в порядке flows_fields.
+    """
+    validate_connections(len(blocks), connections)
+
+    try:
+        flow_ids = insert_returning_ids(db, Flow, flows_fields, batch_size)
+        insert_graphs(db, flow_ids, blocks, connections, batch_size)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Flows created: {len(flow_ids)} x ({len(blocks)} blocks, {len(connections)} connections)")
+    return flow_ids
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
+
+from app.services.flow_import import validate_connections, FlowImportError
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateError(ValueError):
+    """Некорректный файл или каталог шаблонов"""
+
+
+class TemplateBlock(BaseModel):
+    title: str = Field(..., min_length=1, max_length=100)
+    type: str = Field(..., min_length=1)
+    content: Dict[str, Any] = Field(default_factory=dict)
+    position_x: int = 0
+    position_y: int = 0
+
+
+class TemplateConnection(BaseModel):
+    from_index: int  # индекс блока в массиве blocks
+    to_index: int
+    label: Optional[str] = Field(None, max_length=50)
+
+
+class FlowTemplate(BaseModel):
+    """Схема шаблона flow"""
+    id: str = Field(..., min_length=1)
+    name: str = Field(..., min_length=1)
+    description: str = ""
+    category: str = ""
+    blocks: List[TemplateBlock]
+    connections: List[TemplateConnection] = Field(default_factory=list)
+
+
+class TemplatePlan:
+    """Шаблон, подготовленный к созданию flow
+
+    blocks и connections - в формате bulk_import_flow, detail - готовый
+    JSON ответа с деталями шаблона.
+    """
+
+    __slots__ = ("id", "name", "description", "category", "blocks", "connections", "detail")
+
+    def __init__(self, template: FlowTemplate):
+        self.id = template.id
+        self.name = template.name
+        self.description = template.description
+        self.category = template.category
+        self.blocks: List[Dict[str, Any]] = [block.dict() for block in template.blocks]
+        self.connections: List[Tuple[int, int, Optional[str]]] = [
+            (conn.from_index, conn.to_index, conn.label) for conn in template.connections
+        ]
+        self.detail: bytes = json.dumps(template.dict(), ensure_ascii=False).encode()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "category": self.category,
+            "blocks_count": len(self.blocks),
+            "connections_count": len(self.connections),
+        }
+
+
+class TemplateCatalog:
+    """Неизменяемый снимок загруженных шаблонов"""
+
+    def __init__(self, plans: Dict[str, TemplatePlan], versions: Dict[str, float]):
+        self.plans = plans
+        self.versions = versions
+        self.summary: bytes = json.dumps(
+            [plan.summary() for plan in plans.values()], ensure_ascii=False
+        ).encode()
+        self.loaded_at = time.time()
+
+    def get(self, template_id: str) -> Optional[TemplatePlan]:
+        return self.plans.get(template_id)
+
+
+class TemplateRegistry:
+    """Реестр шаблонов flows
+
+    path - JSON файл или каталог с *.json (в т.ч. во вложенных папках).
+    Файл содержит один шаблон ({"id": ...}) или словарь {id: шаблон}.
+    Шаблоны загружаются один раз, проверяются по схеме, и сразу
+    готовятся список (готовые байты ответа) и планы вставки. Не чаще
+    раза в check_interval секунд сверяются mtime файлов: при изменении
+    каталог перечитывается, а при ошибке остаётся прежний снимок.
+    """
+
+    def __init__(self, path: str, check_interval: float = 2.0):
+        self.path = os.path.abspath(path)
+        self.check_interval = check_interval
+        self._catalog: Optional[TemplateCatalog] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _files(self) -> List[str]:
+        if os.path.isfile(self.path):
+            return [self.path]
+        if not os.path.isdir(self.path):
+            raise TemplateError(f"Templates path not found: {self.path}")
+        files = []
+        for root, _, names in os.walk(self.path):
+            files.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        return sorted(files)
+
+    def _versions(self) -> Dict[str, float]:
+        return {path: os.stat(path).st_mtime for path in self._files()}
+
+    @staticmethod
+    def _read(path: str) -> List[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise TemplateError(f"{path}: invalid JSON: {e}")
+        if isinstance(data, dict) and "id" in data:
+            return [data]
+        if isinstance(data, dict):
+            for key, template in data.items():
+                if not isinstance(template, dict) or template.get("id", key) != key:
+                    raise TemplateError(f"{path}: template key '{key}' does not match its id")
+            return [{"id": key, **template} for key, template in data.items()]
+        if isinstance(data, list):
+            return data
+        raise TemplateError(f"{path}: expected a template, a list or an object of templates")
+
+    def _load(self, versions: Dict[str, float]) -> TemplateCatalog:
+        plans: Dict[str, TemplatePlan] = {}
+        for path in versions:
+            for raw in self._read(path):
+                if not isinstance(raw, dict):
+                    raise TemplateError(f"{path}: template must be an object")
+                try:
+                    template = FlowTemplate(**raw)
+                    validate_connections(
+                        len(template.blocks),
+                        [(conn.from_index, conn.to_index, conn.label) for conn in template.connections]
+                    )
+                except (ValidationError, FlowImportError, TypeError) as e:
+                    raise TemplateError(f"{path}: template '{raw.get('id')}': {e}")
+                if template.id in plans:
+                    raise TemplateError(f"{path}: duplicate template id '{template.id}'")
+                plans[template.id] = TemplatePlan(template)
+        return TemplateCatalog(plans, versions)
+
+    def reload(self) -> TemplateCatalog:
+        """Перечитать шаблоны сейчас (ошибка - исключение, снимок не меняется)"""
+        with self._lock:
+            catalog = self._load(self._versions())
+            self._catalog = catalog
+            self._checked_at = time.monotonic()
+        logger.info(f"Flow templates loaded: {len(catalog.plans)} from {self.path}")
+        return catalog
+
+    def catalog(self) -> TemplateCatalog:
+        """Текущий снимок; при изменении файлов - перечитанный"""
+        catalog = self._catalog
+        if catalog is None:
+            return self.reload()
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return catalog
+
+        self._checked_at = now
+        try:
+            changed = self._versions() != catalog.versions
+        except (OSError, TemplateError) as e:
+            logger.error(f"Flow templates check failed: {e}")
+            return catalog
+        if not changed:
+            return catalog
+        try:
+            return self.reload()
+        except (OSError, TemplateError) as e:
+            # Битый файл не должен ломать уже работающий каталог
+            logger.error(f"Flow templates reload failed, keeping previous: {e}")
+            return catalog
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.bot import Bot
+from app.models.bot_user import BotUser
+from app.models.broadcast import Broadcast
+from app.services.broadcast import TelegramSender, fetch_recipient_batch, SENT, BLOCKED
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор этого процесса - владельца рассылок (воркеров uvicorn несколько)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# broadcast_id -> выполняющаяся задача
+running_broadcasts: Dict[int, asyncio.Task] = {}
+
+# Периодический поиск брошенных рассылок
+_sweeper: Optional[asyncio.Task] = None
+
+
+def start_broadcast(broadcast_id: int) -> asyncio.Task:
+    """Запустить рассылку в фоне (повторный запуск возвращает ту же задачу)"""
+    task = running_broadcasts.get(broadcast_id)
+    if task is None or task.done():
+        task = asyncio.create_task(run_broadcast(broadcast_id))
+        running_broadcasts[broadcast_id] = task
+        task.add_done_callback(lambda _: running_broadcasts.pop(broadcast_id, None))
+    return task
+
+
+async def claim_broadcast(db: AsyncSession, broadcast_id: int) -> bool:
+    """Занять рассылку этим процессом
+    
+    Получается, если у рассылки нет владельца, владелец - этот процесс или
+    его heartbeat устарел (процесс упал). Проверка и запись - один UPDATE,
+    поэтому из нескольких воркеров рассылку получает только один.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=settings.BROADCAST_HEARTBEAT_TIMEOUT)
+    result = await db.execute(
+        update(Broadcast)
+        .where(
+            Broadcast.id == broadcast_id,
+            Broadcast.status.in_(("pending", "running")),
+            or_(
+                Broadcast.owner.is_(None),
+                Broadcast.owner == WORKER_ID,
+                Broadcast.heartbeat_at < stale_before
+            )
+        )
+        .values(owner=WORKER_ID, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def release_broadcast(db: AsyncSession, broadcast_id: int):
+    """Снять владение рассылкой (её сможет продолжить любой воркер)"""
+    await db.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.owner == WORKER_ID)
+        .values(owner=None)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def set_status(db: AsyncSession, broadcast_id: int, status: str, **values) -> bool:
+    """Сменить статус рассылки, если она ещё выполняется этим воркером
+    
+    Отмена через API или перехват другим воркером не перезаписываются:
+    условие проверяется в том же UPDATE.
+    """
+    result = await db.execute(
+        update(Broadcast)
+        .where(
+            Broadcast.id == broadcast_id,
+            Broadcast.status.in_(("pending", "running")),
+            Broadcast.owner == WORKER_ID
+        )
+        .values(status=status, **values)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def heartbeat(broadcast_id: int):
+    """Продлевать владение, пока идёт рассылка (пачка может отправляться дольше таймаута)"""
+    while True:
+        await asyncio.sleep(settings.BROADCAST_HEARTBEAT_TIMEOUT / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id, Broadcast.owner == WORKER_ID)
+                    .values(heartbeat_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Broadcast {broadcast_id} heartbeat failed: {e!r}")
+
+
+async def run_broadcast(broadcast_id: int):
+    """Выполнить рассылку с чекпоинтом после каждой пачки получателей
+    
+    Рассылку выполняет только занявший её воркер. Получатели читаются
+    пачками по keyset пагинации (BotUser.id > чекпоинт), поэтому в памяти
+    одновременно только одна пачка. После пачки прогресс коммитится: при
+    перезапуске рассылка продолжается с чекпоинта, повторно может уйти
+    не больше одной пачки.
+    """
+    async with AsyncSessionLocal() as db:
+        if not await claim_broadcast(db, broadcast_id):
+            logger.info(f"Broadcast {broadcast_id} is finished or owned by another worker")
+            return
+        
+        sender = None
+        heartbeat_task = asyncio.create_task(heartbeat(broadcast_id))
+        try:
+            broadcast = await db.get(Broadcast, broadcast_id)
+            bot = await db.get(Bot, broadcast.bot_id)
+            if not bot:
+                await set_status(db, broadcast_id, "failed")
+                return
+            
+            sender = TelegramSender(
+                bot.token,
+                rate=settings.BROADCAST_RATE,
+                concurrency=settings.BROADCAST_CONCURRENCY
+            )
+            semaphore = asyncio.Semaphore(settings.BROADCAST_CONCURRENCY)
+            
+            async def send(chat_id: int) -> str:
+                async with semaphore:
+                    return await sender.send_message(chat_id, broadcast.text, broadcast.parse_mode)
+            
+            if not await set_status(db, broadcast_id, "running",
+                                    started_at=broadcast.started_at or datetime.utcnow()):
+                logger.info(f"Broadcast {broadcast_id} was cancelled before start")
+                return
+            await db.refresh(broadcast)
+            
+            after_id = broadcast.last_bot_user_id
+            logger.info(f"Broadcast {broadcast_id} started for bot {bot.id} from checkpoint {after_id}")
+            
+            while True:
+                batch = await fetch_recipient_batch(db, broadcast.bot_id, after_id, settings.BROADCAST_BATCH_SIZE)
+                if not batch:
+                    break
+                
+                results = await asyncio.gather(*(send(telegram_user_id) for _, telegram_user_id in batch))
+                
+                blocked_ids = [bot_user_id for (bot_user_id, _), result in zip(batch, results) if result == BLOCKED]
+                if blocked_ids:
+                    await db.execute(
+                        update(BotUser)
+                        .where(BotUser.id.in_(blocked_ids))
+                        .values(is_blocked=True)
+                        .execution_options(synchronize_session=False)
+                    )
+                
+                # Чекпоинт пачки - только пока рассылка за этим воркером
+                sent = sum(1 for result in results if result == SENT)
+                after_id = batch[-1][0]
+                checkpoint = await db.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id, Broadcast.owner == WORKER_ID)
+                    .values(
+                        sent_count=Broadcast.sent_count + sent,
+                        blocked_count=Broadcast.blocked_count + len(blocked_ids),
+                        failed_count=Broadcast.failed_count + len(results) - sent - len(blocked_ids),
+                        last_bot_user_id=after_id,
+                        heartbeat_at=datetime.utcnow()
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if checkpoint.rowcount != 1:
+                    logger.warning(f"Broadcast {broadcast_id} was taken over by another worker at {after_id}")
+                    return
+                
+                # Рассылку могли отменить через API
+                await db.refresh(broadcast)
+                if broadcast.status == "cancelled":
+                    logger.info(f"Broadcast {broadcast_id} cancelled at {broadcast.last_bot_user_id}")
+                    return
+            
+            # Отмена, пришедшая после последней пачки, остаётся в силе
+            if not await set_status(db, broadcast_id, "completed", finished_at=datetime.utcnow()):
+                logger.info(f"Broadcast {broadcast_id} was cancelled or taken over before completion")
+                return
+            await db.refresh(broadcast)
+            
+            logger.info(
+                f"Broadcast {broadcast_id} completed: sent={broadcast.sent_count} "
+                f"blocked={broadcast.blocked_count} failed={broadcast.failed_count} "
+                f"throughput={broadcast.throughput} msg/s"
+            )
+        except asyncio.CancelledError:
+            # Остановка приложения - остаёмся в running и продолжим с чекпоинта
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} failed: {str(e)}", exc_info=True)
+            await db.rollback()
+            await set_status(db, broadcast_id, "failed")
+        finally:
+            heartbeat_task.cancel()
+            if sender is not None:
+                await sender.close()
+            try:
+                await db.rollback()
+                await release_broadcast(db, broadcast_id)
+            except Exception as e:
+                logger.warning(f"Broadcast {broadcast_id} release failed: {e!r}")
+
+
+async def resume_broadcasts() -> List[int]:
+    """Продолжить рассылки без живого владельца
+    
+    Вызывается при старте и периодически (sweep_broadcasts): рассылка
+    упавшего процесса освобождается только через
+    BROADCAST_HEARTBEAT_TIMEOUT после его последнего heartbeat, и при
+    быстром перезапуске на старте её ещё нельзя занять. Рассылку
+    запускает только тот воркер, кто её занял. Возвращает id запущенных.
+    """
+    async with AsyncSessionLocal() as db:
+        ids = (await db.scalars(select(Broadcast.id).where(
+            Broadcast.status.in_(("pending", "running"))
+        ))).all()
+        claimed = [
+            broadcast_id for broadcast_id in ids
+            if broadcast_id not in running_broadcasts and await claim_broadcast(db, broadcast_id)
+        ]
+    
+    for broadcast_id in claimed:
+        logger.info(f"Resuming broadcast {broadcast_id}")
+        start_broadcast(broadcast_id)
+    return claimed
+
+
+async def sweep_broadcasts(interval: float):
+    """Раз в interval секунд забирать рассылки с устаревшим heartbeat"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await resume_broadcasts()
+        except Exception as e:
+            logger.warning(f"Broadcast sweep failed: {e!r}")
+
+
+def start_sweeper():
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.create_task(sweep_broadcasts(settings.BROADCAST_SWEEP_INTERVAL))
+
+
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
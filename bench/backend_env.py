@@ -0,0 +1,96 @@
+"""Общая подготовка backend для бенчмарков
+
+Как tests/backend/conftest.py: временная SQLite база, события flows
+выключены, bcrypt с минимальной стоимостью (если не задано иначе).
+setup() нужно вызвать до импорта app.*.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def setup(**env):
+    """Окружение backend во временном каталоге; env переопределяет настройки"""
+    tmp = tempfile.mkdtemp(prefix='bench-backend-')
+    defaults = {
+        'DB_NAME': os.path.join(tmp, 'bench.db'),
+        'DEBUG': 'false',
+        'LOG_DIR': os.path.join(tmp, 'logs'),
+        'LOG_LEVEL': 'WARNING',
+        'FLOW_EVENTS_ENABLED': 'false',
+        'PASSWORD_BCRYPT_ROUNDS': '4',
+    }
+    for key, value in {**defaults, **env}.items():
+        os.environ.setdefault(key, str(value))
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+    # Порядок импорта как у uvicorn: app.core раньше app.models
+    import app.main  # noqa: F401
+    from app.core.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    return app.main.app
+
+
+class QueryCounter:
+    """Число SQL запросов к базе за блок with"""
+
+    def __init__(self):
+        from app.core.database import async_engine, engine
+
+        self.engines = [async_engine.sync_engine, engine]
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    @contextlib.contextmanager
+    def measure(self):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._on_execute)
+        try:
+            yield self
+        finally:
+            for engine in self.engines:
+                event.remove(engine, 'before_cursor_execute', self._on_execute)
+
+
+def register(client, username: str = 'bench', password: str = 'secret123'):
+    """Зарегистрировать пользователя, вернуть заголовки авторизации"""
+    response = client.post('/api/v1/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': password,
+    })
+    assert response.status_code == 201, response.text
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+def create_bot(client, headers, name: str = 'bench', token: str = '123:abc') -> int:
+    response = client.post('/api/v1/bots', json={'name': name, 'token': token}, headers=headers)
+    assert response.status_code in (200, 201), response.text
+    return response.json()['id']
+
+
+def chain_graph(size: int):
+    """Блоки и связи цепочки из size текстовых блоков (формат /flows/import)"""
+    blocks = [
+        {'title': f'Block {i}', 'type': 'text', 'content': {'text': f'Step {i}'},
+         'position_x': 0, 'position_y': i * 100}
+        for i in range(size)
+    ]
+    connections = [{'from_index': i, 'to_index': i + 1} for i in range(size - 1)]
+    return blocks, connections
+
+
+def import_flow(client, headers, bot_id: int, size: int) -> int:
+    blocks, connections = chain_graph(size)
+    response = client.post('/api/v1/flows/import', json={
+        'bot_id': bot_id, 'name': f'Flow {size}', 'blocks': blocks, 'connections': connections,
+    }, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()['flow_id']
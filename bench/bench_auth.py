@@ -0,0 +1,93 @@
+"""Стоимость авторизации на запрос
+
+1. Проверка JWT: jwt.decode с секретом строкой (как до кэша),
+   с готовым ключом jwk, и decode_token из token_cache.
+2. Запрос целиком с пустыми кэшами перед каждым запросом и с тёплыми:
+   POST /auth/logout - только авторизация, GET /flows?bot_id=... -
+   авторизация, владение ботом и список flows. GET /health без
+   авторизации - базовая стоимость запроса.
+
+Печатает мкс на вызов, мс на запрос, разницу с /health и SQL запросы
+на запрос.
+
+    python bench/bench_auth.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup, QueryCounter, register, create_bot  # noqa: E402
+
+DECODES = 20000
+REQUESTS = 1000
+
+
+def per_call(func, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    app = setup()
+    from fastapi.testclient import TestClient
+    from jose import jwt
+    from app.core.config import settings
+    from app.core.security import create_access_token, decode_token, jwt_key, principal_cache, token_cache
+
+    def clear():
+        token_cache.clear()
+        principal_cache.clear()
+
+    token = create_access_token({'sub': '1'})
+    algorithms = [settings.JWT_ALGORITHM]
+
+    def cold_decode():
+        token_cache.clear()
+        decode_token(token)
+
+    print(f"{'jwt decode':>24} {'us/call':>9}")
+    for name, func in (
+        ('secret string', lambda: jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=algorithms)),
+        ('prebuilt key', lambda: jwt.decode(token, jwt_key, algorithms=algorithms)),
+        ('decode_token, miss', cold_decode),
+        ('decode_token, cached', lambda: decode_token(token)),
+    ):
+        print(f'{name:>24} {per_call(func, DECODES) * 1e6:>9.1f}')
+
+    counter = QueryCounter()
+    with TestClient(app) as client:
+        headers = register(client)
+        bot_id = create_bot(client, headers)
+
+        def request(method, path, params=None, auth=True, before=None):
+            latencies = []
+            with counter.measure():
+                for _ in range(REQUESTS):
+                    if before:
+                        before()
+                    start = time.perf_counter()
+                    response = client.request(method, path, params=params, headers=headers if auth else None)
+                    latencies.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.text
+            return statistics.mean(latencies), sorted(latencies)[int(len(latencies) * 0.99)], counter.count / REQUESTS
+
+        base, _, _ = request('GET', '/health', auth=False)
+        print()
+        print(f"{'request':>24} {'mean ms':>8} {'p99 ms':>8} {'+health':>8} {'queries':>8}")
+        print(f"{'/health, no auth':>24} {base * 1000:>8.3f}")
+        for method, path, params in (('POST', '/api/v1/auth/logout', None),
+                                     ('GET', '/api/v1/flows', {'bot_id': bot_id})):
+            for cache, before in (('cold', clear), ('cached', None)):
+                request(method, path, params, before=before)
+                mean, p99, queries = request(method, path, params, before=before)
+                name = f"{path.rsplit('/', 1)[1]}, {cache}"
+                print(f'{name:>24} {mean * 1000:>8.3f} {p99 * 1000:>8.3f} {(mean - base) * 1000:>8.3f} {queries:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
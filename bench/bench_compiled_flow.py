@@ -0,0 +1,47 @@
+"""Шаг интерпретатора: линейный поиск по спискам узлов и рёбер против CompiledFlow
+
+    python bench/bench_compiled_flow.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+from utils.compiled_flow import CompiledFlow  # noqa: E402
+
+
+def make_chain(size: int):
+    nodes = [{'id': 'n0', 'type': 'input', 'data': {}}]
+    nodes += [{'id': f'n{i}', 'type': 'messageNode', 'data': {'text': str(i)}} for i in range(1, size)]
+    edges = [{'source': f'n{i}', 'target': f'n{i + 1}'} for i in range(size - 1)]
+    return {'flow_id': 'bench', 'flow': {'nodes': nodes, 'edges': edges}}
+
+
+def scan_step(flow_data, node_id):
+    """Шаг как до компиляции: поиск узла и исходящих рёбер перебором"""
+    flow = flow_data['flow']
+    node = next(n for n in flow['nodes'] if n['id'] == node_id)
+    targets = [e['target'] for e in flow['edges'] if e['source'] == node['id']]
+    return [n for n in flow['nodes'] if n['id'] in targets]
+
+
+def compiled_step(flow, node_id):
+    flow.find_node(node_id)
+    return flow.get_next_nodes(node_id)
+
+
+def main():
+    print(f"{'nodes':>8} {'scan, us/step':>14} {'compiled, us/step':>18} {'speedup':>8}")
+    for size in (10, 100, 1000, 5000):
+        flow_data = make_chain(size)
+        flow = CompiledFlow(flow_data)
+        node_id = f'n{size // 2}'
+        number = max(10, 20000 // size)
+        scan = min(timeit.repeat(lambda: scan_step(flow_data, node_id), number=number, repeat=3)) / number
+        compiled = min(timeit.repeat(lambda: compiled_step(flow, node_id), number=100000, repeat=3)) / 100000
+        print(f"{size:>8} {scan * 1e6:>14.2f} {compiled * 1e6:>18.3f} {scan / compiled:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
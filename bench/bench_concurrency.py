@@ -0,0 +1,135 @@
+"""Пропускная способность API при 1 / 10 / 100 одновременных клиентах
+
+Один воркер (httpx + ASGITransport в одном event loop, как uvicorn),
+клиенты по кругу запрашивают список ботов:
+
+- sync Session: копия обработчика до перехода на AsyncSession - запрос
+  к базе через SessionLocal прямо в async def;
+- AsyncSession: настоящий GET /api/v1/bots.
+
+Локальная SQLite отвечает за микросекунды, поэтому к каждому запросу
+добавляется задержка сети до базы (DB_LATENCY_MS, через запятую). У sync
+Session это time.sleep в before_cursor_execute - он блокирует event loop,
+как ожидание ответа синхронным драйвером. У AsyncSession задержка идёт в
+потоке соединения aiosqlite (события SQLAlchemy выполняются в потоке
+event loop), как ожидание сокета у asyncpg.
+
+    python bench/bench_concurrency.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup  # noqa: E402
+
+DB_LATENCY_MS = [float(ms) for ms in os.getenv('DB_LATENCY_MS', '0,2,10').split(',')]
+CLIENTS = (1, 10, 100)
+REQUESTS = 500
+
+
+def add_sync_route(app):
+    """Обработчик списка ботов в прежнем виде - синхронная сессия в async def"""
+    from typing import List
+    from fastapi import Depends
+    from sqlalchemy import select
+    from app.core.database import SessionLocal
+    from app.core.security import get_current_user
+    from app.models.bot import Bot
+    from app.schemas.bot import BotListResponse
+
+    @app.get('/bench/bots-sync', response_model=List[BotListResponse])
+    async def get_bots_sync(current_user: dict = Depends(get_current_user), skip: int = 0, limit: int = 100):
+        with SessionLocal() as db:
+            bots = db.scalars(select(Bot).where(
+                Bot.user_id == int(current_user['sub'])
+            ).offset(skip).limit(limit)).all()
+            return [BotListResponse.from_orm(bot) for bot in bots]
+
+
+async def run(client, headers, path: str, clients: int):
+    latencies = []
+    pending = iter(range(REQUESTS))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return REQUESTS / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def add_async_delay(latency):
+    """Задержка запроса внутри потока соединения aiosqlite"""
+    import aiosqlite
+
+    async def execute(cursor, sql, parameters=None):
+        def slow_execute(sql, parameters):
+            if latency[0]:
+                time.sleep(latency[0])
+            return cursor._cursor.execute(sql, parameters)
+
+        await cursor._execute(slow_execute, sql, [] if parameters is None else parameters)
+        return cursor
+
+    aiosqlite.Cursor.execute = execute
+
+
+async def bench(app):
+    import httpx
+    from sqlalchemy import event
+    from app.core.database import async_engine, engine
+
+    # Все прогоны в одном event loop и без lifespan: после async_engine.dispose()
+    # одновременные первые подключения нового пула ждут threading-блокировку
+    # first_connect SQLAlchemy (2.0.23) и вешают event loop
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        response = await client.post('/api/v1/auth/register', json={
+            'username': 'bench', 'email': 'bench@example.com', 'password': 'secret123',
+        })
+        assert response.status_code == 201, response.text
+        headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+        for i in range(5):
+            response = await client.post('/api/v1/bots', json={'name': f'bot{i}', 'token': f'{i}:abc'},
+                                         headers=headers)
+            assert response.status_code == 201, response.text
+
+        latency = [0.0]
+
+        def network_delay(conn, cursor, statement, parameters, context, executemany):
+            if latency[0]:
+                time.sleep(latency[0])
+
+        event.listen(engine, 'before_cursor_execute', network_delay)
+        add_async_delay(latency)
+
+        print(f'{REQUESTS} requests per run, cpus={os.cpu_count()}')
+        print(f"{'db ms':>6} {'clients':>8} {'session':>13} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for latency_ms in DB_LATENCY_MS:
+            latency[0] = latency_ms / 1000
+            for clients in CLIENTS:
+                for name, path in (('sync Session', '/bench/bots-sync'), ('AsyncSession', '/api/v1/bots')):
+                    rate, p50, p99 = await run(client, headers, path, clients)
+                    print(f'{latency_ms:>6g} {clients:>8} {name:>13} {rate:>8.1f} '
+                          f'{p50 * 1000:>8.2f} {p99 * 1000:>8.2f}')
+    await async_engine.dispose()
+
+
+def main():
+    app = setup()
+    add_sync_route(app)
+    asyncio.run(bench(app))
+
+
+if __name__ == '__main__':
+    main()
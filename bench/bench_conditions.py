@@ -0,0 +1,37 @@
+"""Условия conditionNode: компиляция (раз на версию flow) и вычисление, мкс
+
+    python bench/bench_conditions.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+from utils.conditions import compile_expression, compile_condition  # noqa: E402
+
+CASES = [
+    ('comparison', 'age >= 18', {'age': '21'}),
+    ('boolean', 'city == "Riga" and not vip or score > 10', {'city': 'Riga', 'vip': False, 'score': 3}),
+    ('membership', 'tag in ["a", "b", "c", "d"]', {'tag': 'd'}),
+    ('regex', 'matches(phone, "^\\\\+7\\\\d{10}$")', {'phone': '+79990000000'}),
+    ('arithmetic', 'price * qty - discount > 100', {'price': '20', 'qty': 6, 'discount': 5}),
+]
+
+
+def main():
+    number = 200000
+    print(f"{'case':>12} {'compile, us':>12} {'eval, us':>9}")
+    for name, expression, context in CASES:
+        compile_time = min(timeit.repeat(lambda: compile_expression(expression), number=1000, repeat=3)) / 1000
+        predicate = compile_expression(expression)
+        evaluation = min(timeit.repeat(lambda: predicate(context), number=number, repeat=3)) / number
+        print(f"{name:>12} {compile_time * 1e6:>12.1f} {evaluation * 1e6:>9.2f}")
+
+    legacy = compile_condition({'conditionType': 'text_equals', 'conditionValue': 'yes'})
+    per_call = min(timeit.repeat(lambda: legacy({'last_button_value': 'yes'}), number=number, repeat=3)) / number
+    print(f"{'legacy':>12} {'':>12} {per_call * 1e6:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
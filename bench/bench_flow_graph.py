@@ -0,0 +1,63 @@
+"""Загрузка графа flow из 1000 блоков: число запросов и задержка
+
+GET /flows/{id}/graph (flow с владельцем, блоки, связи - три запроса)
+против прежней последовательности GET /flows/{id}, /blocks, /connections.
+Авторизация прогрета (кэш principal), поэтому считаются только запросы
+самой загрузки.
+
+    python bench/bench_flow_graph.py
+"""
+import statistics
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup, QueryCounter, register, create_bot, import_flow  # noqa: E402
+
+BLOCKS = 1000
+REPEATS = 30
+
+
+def measure(client, headers, paths):
+    counter = QueryCounter()
+    latencies = []
+    for _ in range(REPEATS):
+        with counter.measure():
+            start = time.perf_counter()
+            for path in paths:
+                response = client.get(path, headers=headers)
+                assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+    return counter.count, statistics.median(latencies) * 1000, max(latencies) * 1000
+
+
+def main():
+    app = setup()
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        headers = register(client)
+        bot_id = create_bot(client, headers)
+        flow_id = import_flow(client, headers, bot_id, BLOCKS)
+        # Прогрев кэша авторизации
+        client.get(f'/api/v1/flows/{flow_id}', headers=headers)
+
+        variants = {
+            'graph': [f'/api/v1/flows/{flow_id}/graph'],
+            'flow+blocks+conns': [
+                f'/api/v1/flows/{flow_id}',
+                f'/api/v1/flows/{flow_id}/blocks',
+                f'/api/v1/flows/{flow_id}/connections',
+            ],
+        }
+        print(f'{BLOCKS} blocks, {BLOCKS - 1} connections')
+        print(f"{'variant':>18} {'requests':>9} {'queries':>8} {'p50 ms':>8} {'max ms':>8}")
+        for name, paths in variants.items():
+            queries, p50, worst = measure(client, headers, paths)
+            print(f'{name:>18} {len(paths):>9} {queries:>8} {p50:>8.1f} {worst:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
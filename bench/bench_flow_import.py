@@ -0,0 +1,114 @@
+"""Импорт flow на 100 / 1k / 10k блоков
+
+- row-by-row: как до пакетного импорта - add + commit + refresh на
+  каждый блок и каждую связь;
+- bulk: bulk_import_flow, одна транзакция и пачки insert().returning();
+- POST /flows/import и /flows/import/ndjson целиком, с разбором тела.
+
+Печатает время импорта, число SQL запросов и commit-ов.
+
+    python bench/bench_flow_import.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup, QueryCounter, register, create_bot, chain_graph  # noqa: E402
+
+SIZES = (100, 1000, 10000)
+# Построчный импорт 10k блоков идёт минуты - только до этого размера
+ROW_BY_ROW_MAX = 1000
+
+
+def row_by_row(db, fields, blocks, connections):
+    """Прежний импорт: каждая строка - отдельная транзакция"""
+    from app.models.flow import Flow
+    from app.models.block import Block
+    from app.models.connection import Connection
+
+    flow = Flow(**fields)
+    db.add(flow)
+    db.commit()
+    db.refresh(flow)
+    created = []
+    for block in blocks:
+        new_block = Block(flow_id=flow.id, **block)
+        db.add(new_block)
+        db.commit()
+        db.refresh(new_block)
+        created.append(new_block)
+    for conn in connections:
+        new_connection = Connection(from_block_id=created[conn['from_index']].id,
+                                    to_block_id=created[conn['to_index']].id)
+        db.add(new_connection)
+        db.commit()
+        db.refresh(new_connection)
+    return flow.id
+
+
+def bulk(db, fields, blocks, connections):
+    from app.services.flow_import import bulk_import_flow
+
+    triples = [(conn['from_index'], conn['to_index'], None) for conn in connections]
+    return bulk_import_flow(db, fields, blocks, triples).id
+
+
+def ndjson_body(bot_id, size):
+    blocks, connections = chain_graph(size)
+    lines = [{'bot_id': bot_id, 'name': f'Flow {size}'}]
+    lines += [{'block': block} for block in blocks]
+    lines += [{'connection': conn} for conn in connections]
+    return '\n'.join(json.dumps(line) for line in lines).encode()
+
+
+def main():
+    app = setup()
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.core.database import SessionLocal, engine
+
+    counter = QueryCounter()
+    commits = [0]
+    event.listen(engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    with TestClient(app) as client:
+        headers = register(client)
+        bot_id = create_bot(client, headers)
+        fields = {'bot_id': bot_id, 'name': 'bench', 'is_active': False}
+
+        print(f"{'blocks':>7} {'variant':>12} {'ms':>9} {'queries':>8} {'commits':>8}")
+        for size in SIZES:
+            blocks, connections = chain_graph(size)
+            for name, func in (('row-by-row', row_by_row), ('bulk', bulk)):
+                if func is row_by_row and size > ROW_BY_ROW_MAX:
+                    print(f'{size:>7} {name:>12} {"skipped":>9}')
+                    continue
+                with SessionLocal() as db, counter.measure():
+                    commits[0] = 0
+                    start = time.perf_counter()
+                    func(db, fields, blocks, connections)
+                    elapsed = time.perf_counter() - start
+                print(f'{size:>7} {name:>12} {elapsed * 1000:>9.1f} {counter.count:>8} {commits[0]:>8}')
+
+            payload = {'bot_id': bot_id, 'name': f'Flow {size}', 'blocks': blocks, 'connections': connections}
+            body = ndjson_body(bot_id, size)
+            requests = (
+                ('POST json', lambda: client.post('/api/v1/flows/import', json=payload, headers=headers)),
+                ('POST ndjson', lambda: client.post(
+                    '/api/v1/flows/import/ndjson', content=body,
+                    headers={**headers, 'Content-Type': 'application/x-ndjson'})),
+            )
+            for name, request in requests:
+                with counter.measure():
+                    start = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - start
+                assert response.status_code == 201, response.text
+                print(f"{size:>7} {name:>12} {elapsed * 1000:>9.1f} {counter.count:>8} {'':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Задержка чтения активного flow под одновременным трафиком ботов
+
+Для каждого хранилища flows (memory, SQLite, Redis - если задан
+REDIS_URL) clients одновременных клиентов читают get_active случайных
+ботов, пока писатель раз в WRITE_INTERVAL пересохраняет и переключает
+их flows (правки из редактора).
+Печатает чтений в секунду и p50 / p99 задержки чтения.
+
+    REDIS_URL=redis://localhost:6379/15 python bench/bench_flow_storage.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from storage import create_storage  # noqa: E402
+
+BOTS = 100
+FLOWS_PER_BOT = 5
+NODES = 50
+READS_PER_CLIENT = 200
+WRITE_INTERVAL = 0.005
+
+
+def make_flow(size: int):
+    nodes = [{'id': f'n{i}', 'type': 'textNode', 'position': {'x': 0, 'y': i}, 'data': {'text': f'step {i}'}}
+             for i in range(size)]
+    edges = [{'id': f'e{i}', 'source': f'n{i}', 'target': f'n{i + 1}'} for i in range(size - 1)]
+    return {'nodes': nodes, 'edges': edges, 'name': 'bench'}
+
+
+async def prepare(store):
+    flow = make_flow(NODES)
+    for bot_id in range(1, BOTS + 1):
+        for i in range(FLOWS_PER_BOT):
+            await store.save(bot_id, f'flow-{i}', flow, f'Flow {i}')
+
+
+async def measure(store, clients: int):
+    latencies = []
+    done = asyncio.Event()
+    writes = 0
+
+    async def reader():
+        for _ in range(READS_PER_CLIENT):
+            bot_id = random.randint(1, BOTS)
+            start = time.perf_counter()
+            assert await store.get_active(bot_id) is not None
+            latencies.append(time.perf_counter() - start)
+
+    async def writer():
+        nonlocal writes
+        flow = make_flow(NODES)
+        while not done.is_set():
+            bot_id = random.randint(1, BOTS)
+            flow_id = f'flow-{random.randrange(FLOWS_PER_BOT)}'
+            await store.save(bot_id, flow_id, flow, 'Updated')
+            await store.activate(bot_id, flow_id)
+            writes += 1
+            await asyncio.sleep(WRITE_INTERVAL)
+
+    writer_task = asyncio.create_task(writer())
+    start = time.perf_counter()
+    await asyncio.gather(*(reader() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await writer_task
+
+    latencies.sort()
+    return (len(latencies) / elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, writes / elapsed)
+
+
+async def main():
+    urls = {
+        'memory': 'memory://',
+        'sqlite': f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-flows-"), "flows.db")}',
+    }
+    if os.getenv('REDIS_URL'):
+        urls['redis'] = os.environ['REDIS_URL']
+
+    print(f"{'storage':>8} {'clients':>8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'writes/s':>9}")
+    for name, url in urls.items():
+        store = create_storage(url)
+        try:
+            if name == 'redis':
+                await store.redis.flushdb()
+            await prepare(store)
+            for clients in (1, 10, 100):
+                rate, p50, p99, writes = await measure(store, clients)
+                print(f'{name:>8} {clients:>8} {rate:>9.0f} {p50:>8.3f} {p99:>8.3f} {writes:>9.0f}')
+        finally:
+            await store.close()
+    if 'redis' not in urls:
+        print('redis: skipped (set REDIS_URL)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Создание flows из шаблона для многих ботов
+
+- loop: POST /flows/from-template на каждую копию для каждого бота,
+  событие на каждый flow;
+- bulk: один POST /flows/from-template/bulk - одна транзакция, пачки
+  insert().returning() и одно событие на бота.
+
+Печатает время, число SQL запросов и опубликованных событий.
+
+    python bench/bench_flow_templates.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup, QueryCounter, register, create_bot  # noqa: E402
+
+TEMPLATE = 'quiz'
+# (ботов, копий на бота)
+CASES = ((10, 1), (10, 10), (100, 1), (100, 10))
+
+
+def main():
+    app = setup()
+    from fastapi.testclient import TestClient
+    from app.api.v1 import flow_templates
+
+    counter = QueryCounter()
+    events = [0]
+    flow_templates.publish_flow_event = lambda *args, **kwargs: events.__setitem__(0, events[0] + 1)
+
+    with TestClient(app) as client:
+        headers = register(client)
+        bot_ids = [create_bot(client, headers, f'bot{i}', f'{i}:abc') for i in range(max(bots for bots, _ in CASES))]
+
+        def loop(bots, copies):
+            for bot_id in bot_ids[:bots]:
+                for copy in range(copies):
+                    response = client.post('/api/v1/flows/from-template', json={
+                        'bot_id': bot_id, 'template_id': TEMPLATE, 'flow_name': f'Copy {copy + 1}',
+                    }, headers=headers)
+                    assert response.status_code == 201, response.text
+
+        def bulk(bots, copies):
+            response = client.post('/api/v1/flows/from-template/bulk', json={
+                'bot_ids': bot_ids[:bots], 'template_id': TEMPLATE, 'copies': copies,
+            }, headers=headers)
+            assert response.status_code == 201, response.text
+
+        print(f"{'bots':>5} {'copies':>7} {'variant':>8} {'ms':>9} {'queries':>8} {'events':>7}")
+        for bots, copies in CASES:
+            for name, func in (('loop', loop), ('bulk', bulk)):
+                events[0] = 0
+                with counter.measure():
+                    start = time.perf_counter()
+                    func(bots, copies)
+                    elapsed = time.perf_counter() - start
+                print(f'{bots:>5} {copies:>7} {name:>8} {elapsed * 1000:>9.1f} {counter.count:>8} {events[0]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Итеративный интерпретатор: цепочка из 500 узлов и циклический граф
+
+Время одного прогона flow и шага, состояние - BufferedUserState
+(checkpoint) поверх SQLite во временном каталоге.
+
+    python bench/bench_interpreter.py
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'bot'))
+sys.path.insert(0, os.path.join(ROOT, 'tests', 'bot'))
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bot_users.db'))
+
+from flow_graphs import chain, make_flow, node, edge  # noqa: E402
+from handlers import flow_handler  # noqa: E402
+from models.buffered_state import BufferedUserState  # noqa: E402
+from models.user_state import UserState  # noqa: E402
+
+
+class NullBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        pass
+
+
+def cyclic(size: int):
+    """input -> 1 -> ... -> size-1 -> 1"""
+    flow_data = chain(size, 'cycle')
+    flow_data['flow']['edges'].append(edge(f'n{size - 1}', 'n1'))
+    return flow_data
+
+
+async def measure(flow_data, runs: int):
+    flow = flow_handler.executor.compile_flow(flow_data)
+    start_id = flow.start_node['id']
+    bot = NullBot()
+    start = time.perf_counter()
+    for user_id in range(runs):
+        state = {'flow_id': flow.flow_id, 'current_node_id': start_id, 'context': {}}
+        await flow_handler.user_state.set_state(1, user_id, flow.flow_id, start_id, {})
+        await flow_handler.execute_current_node(bot, 1, user_id, flow, state)
+        await flow_handler.user_state.checkpoint(1, user_id)
+    return (time.perf_counter() - start) / runs
+
+
+async def main():
+    # Цикл в графе - ожидаемое предупреждение на каждый прогон
+    logging.getLogger('handlers.flow_handler').setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        flow_handler.user_state = BufferedUserState(UserState(os.path.join(tmp, 'states.db')))
+        print(f"{'graph':>18} {'ms/run':>8} {'us/step':>8}")
+        for name, flow_data, steps in (
+            ('chain 500', chain(500), 500),
+            ('cycle 500', cyclic(500), 500),
+            ('chain + skip edges', make_flow(
+                [node('n0', 'input')] + [node(f'n{i}', text=str(i)) for i in range(1, 501)],
+                [edge(f'n{i}', f'n{i + 1}') for i in range(500)] +
+                [edge(f'n{i}', f'n{i + 2}') for i in range(0, 499, 5)],
+                'branching'), 501),
+        ):
+            per_run = await measure(flow_data, 50)
+            print(f"{name:>18} {per_run * 1e3:>8.2f} {per_run / steps * 1e6:>8.1f}")
+        await flow_handler.user_state.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Задержка входа под одновременными sign-in
+
+Клиенты параллельно шлют POST /auth/login (httpx + ASGITransport,
+один event loop, как у uvicorn воркера), а рядом идёт поток лёгких
+запросов GET /auth/me с уже выданным токеном. Варианты:
+
+- pool: bcrypt в пуле PASSWORD_HASH_WORKERS потоков (как в сервисе);
+- inline: bcrypt прямо в event loop, как было до пула.
+
+Печатает p50/p99 входа и p99 /auth/me: bcrypt в event loop задерживает
+и все остальные запросы процесса.
+
+    python bench/bench_login.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend_env import setup  # noqa: E402
+
+# Стоимость ниже продовой (12), чтобы прогон шёл секунды; соотношения те же
+ROUNDS = 8
+CONCURRENCY = (1, 10, 50)
+LOGINS = 100
+USERS = 10
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run(app, concurrency: int):
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        response = await client.post('/api/v1/auth/login', json={'username': 'user0', 'password': 'secret123'})
+        headers = {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+        logins = []
+        pings = []
+        pending = iter(range(LOGINS))
+        done = asyncio.Event()
+
+        async def signer():
+            for i in pending:
+                start = time.perf_counter()
+                response = await client.post('/api/v1/auth/login', json={
+                    'username': f'user{i % USERS}', 'password': 'secret123',
+                })
+                assert response.status_code == 200, response.text
+                logins.append(time.perf_counter() - start)
+
+        async def pinger():
+            while not done.is_set():
+                start = time.perf_counter()
+                response = await client.get('/api/v1/auth/me', headers=headers)
+                assert response.status_code == 200, response.text
+                pings.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        ping_task = asyncio.create_task(pinger())
+        start = time.perf_counter()
+        await asyncio.gather(*(signer() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ping_task
+    return elapsed, logins, pings
+
+
+def main():
+    app = setup(PASSWORD_BCRYPT_ROUNDS=ROUNDS)
+    from app.core import passwords
+    from app.core.database import SessionLocal
+    from app.models.user import User
+
+    with SessionLocal() as db:
+        password_hash = passwords.pwd_context.hash('secret123')
+        db.add_all(User(username=f'user{i}', email=f'user{i}@example.com', password_hash=password_hash)
+                   for i in range(USERS))
+        db.commit()
+
+    hasher = passwords.password_hasher
+    pool_run = hasher._run
+
+    async def inline_run(func, *args):
+        return func(*args)
+
+    print(f'bcrypt rounds={ROUNDS}, workers={hasher.max_workers}, cpus={os.cpu_count()}')
+    print(f"{'clients':>8} {'variant':>8} {'login/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'me p99 ms':>10}")
+    for concurrency in CONCURRENCY:
+        for name, runner in (('inline', inline_run), ('pool', pool_run)):
+            hasher._run = runner
+            elapsed, logins, pings = asyncio.run(run(app, concurrency))
+            print(f'{concurrency:>8} {name:>8} {len(logins) / elapsed:>8.1f} '
+                  f'{statistics.median(logins) * 1000:>8.1f} {percentile(logins, 0.99) * 1000:>8.1f} '
+                  f'{percentile(pings, 0.99) * 1000:>10.1f}')
+    hasher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Нагрузочный тест шардов: перенос состояний под потоком update
+
+Воркеры - отдельные процессы (ShardWorkerApp на uvicorn, свои базы
+SQLite), роутер - ShardRouter. Каждый пользователь шлёт сообщения
+одно за другим, обработчик считает их в контексте состояния. Посреди
+нагрузки к двум воркерам добавляется третий (POST /shards), update на
+время переноса получают 503 и отправляются повторно, как это делает
+Telegram. В конце счётчик каждого пользователя у его владельца должен
+совпасть с числом принятых сообщений: ничего не потеряно и не задвоено.
+Пауза переноса включает drain: воркер сначала дообрабатывает всё уже
+принятое из своей очереди.
+
+    python bench/bench_shards.py
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot')
+sys.path.insert(0, BOT_DIR)
+
+USERS = 200
+MESSAGES = 30
+REPLICAS = 50
+SECRET = 'inner'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_worker(port: int, db_dir: str):
+    """Процесс воркера: обработчик увеличивает context['count'] пользователя"""
+    import logging
+    import uvicorn
+    from aiogram import Bot, Dispatcher, Router
+    from aiogram.types import Message
+
+    from models.buffered_state import BufferedUserState
+    from models.timer_store import TimerStore
+    from models.user_state import UserState
+    from sharding import ShardWorkerApp
+    from utils.timer_wheel import TimerWheel
+    from webhook import WebhookApp
+
+    logging.basicConfig(level=logging.WARNING)
+
+    async def serve():
+        user_state = BufferedUserState(UserState(os.path.join(db_dir, f'{port}-users.db')))
+        timer_wheel = TimerWheel(TimerStore(os.path.join(db_dir, f'{port}-timers.db')))
+
+        router = Router()
+
+        @router.message()
+        async def on_message(message: Message):
+            user_id = message.from_user.id
+            state = await user_state.get_state(1, user_id)
+            count = state['context'].get('count', 0) if state else 0
+            await user_state.set_state(1, user_id, 'f1', 'n1', {'count': count + 1})
+            await user_state.checkpoint(1, user_id)
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        bot = Bot('123456:TEST')
+        webhook = WebhookApp(bot, dp, path='/hook', workers=8, queue_size=10000)
+        await webhook.start()
+        app = ShardWorkerApp(webhook, user_state, timer_wheel, self_url=f'http://127.0.0.1:{port}',
+                             shard_secret=SECRET, replicas=REPLICAS)
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port,
+                                               lifespan='off', log_level='warning'))
+        await server.serve()
+
+    asyncio.run(serve())
+
+
+def message_update(update_id: int, user_id: int) -> bytes:
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'U'},
+            'text': 'hi',
+        },
+    }).encode()
+
+
+async def wait_ready(session, url: str):
+    for _ in range(200):
+        try:
+            async with session.get(f'{url}/health'):
+                return
+        except Exception:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f'{url} did not start')
+
+
+def counts(db_dir: str, ports) -> dict:
+    """user_id -> [count у каждого воркера, где есть состояние]"""
+    result = {}
+    for port in ports:
+        conn = sqlite3.connect(os.path.join(db_dir, f'{port}-users.db'))
+        for user_id, context in conn.execute('SELECT user_id, context FROM user_states'):
+            result.setdefault(user_id, []).append(json.loads(context)['count'])
+        conn.close()
+    return result
+
+
+async def load(db_dir: str, ports):
+    import aiohttp
+    import uvicorn
+    from sharding import ShardRouter
+
+    workers = [f'http://127.0.0.1:{port}' for port in ports]
+    router = ShardRouter(workers[:2], path='/hook', shard_secret=SECRET, replicas=REPLICAS)
+    router_port = free_port()
+    server = uvicorn.Server(uvicorn.Config(router, host='127.0.0.1', port=router_port, log_level='warning'))
+    server_task = asyncio.create_task(server.serve())
+    router_url = f'http://127.0.0.1:{router_port}'
+
+    latencies = []
+    retries = 0
+    sent = [0]
+    update_ids = iter(range(1, 10 ** 9))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100)) as session:
+        for url in workers + [router_url]:
+            await wait_ready(session, url)
+
+        async def user(user_id: int):
+            nonlocal retries
+            for _ in range(MESSAGES):
+                body = message_update(next(update_ids), user_id)
+                while True:
+                    start = time.perf_counter()
+                    async with session.post(f'{router_url}/hook', data=body) as resp:
+                        status = resp.status
+                    if status == 200:
+                        latencies.append(time.perf_counter() - start)
+                        sent[0] += 1
+                        break
+                    # Telegram повторит доставку позже
+                    retries += 1
+                    await asyncio.sleep(0.05)
+
+        async def rebalance():
+            while sent[0] < USERS * MESSAGES // 2:
+                await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            async with session.post(f'{router_url}/shards', json={'workers': workers},
+                                    headers={'X-Shard-Secret': SECRET}) as resp:
+                body = await resp.json()
+                assert resp.status == 200, body
+            return time.perf_counter() - start, body['moved']
+
+        start = time.perf_counter()
+        results = await asyncio.gather(rebalance(), *(user(user_id) for user_id in range(1, USERS + 1)))
+        elapsed = time.perf_counter() - start
+        pause, moved = results[0]
+
+    server.should_exit = True
+    await server_task
+
+    # Обработка идёт после ответа 200 - ждём, пока счётчики сойдутся
+    expected = {user_id: [MESSAGES] for user_id in range(1, USERS + 1)}
+    for _ in range(100):
+        found = counts(db_dir, ports)
+        if found == expected:
+            break
+        await asyncio.sleep(0.1)
+
+    lost = sum(MESSAGES - sum(found.get(user_id, [0])) for user_id in expected
+               if sum(found.get(user_id, [0])) < MESSAGES)
+    duplicated = sum(len(found[user_id]) - 1 for user_id in found if len(found[user_id]) > 1)
+    copied = sum(worker['states'] for worker in moved['copied'].values())
+
+    latencies.sort()
+    print(f"{'updates':>8} {'upd/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'503':>6} "
+          f"{'pause ms':>9} {'moved':>6} {'lost':>5} {'dup':>4}")
+    print(f"{sent[0]:>8} {sent[0] / elapsed:>8.0f} {statistics.median(latencies) * 1000:>8.2f} "
+          f"{latencies[int(len(latencies) * 0.99)] * 1000:>8.2f} {retries:>6} "
+          f"{pause * 1000:>9.1f} {copied:>6} {lost:>5} {duplicated:>4}")
+    return lost == 0 and duplicated == 0
+
+
+def main():
+    db_dir = tempfile.mkdtemp(prefix='bench-shards-')
+    ports = [free_port() for _ in range(3)]
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=run_worker, args=(port, db_dir), daemon=True) for port in ports]
+    for process in processes:
+        process.start()
+    try:
+        ok = asyncio.run(load(db_dir, ports))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
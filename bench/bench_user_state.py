@@ -0,0 +1,74 @@
+"""Пропускная способность записи состояний: соединение на запрос против UserState
+
+Для 1k и 10k одновременных пользователей каждый делает set_state и
+advance. Старый вариант открывал соединение SQLite (rollback journal,
+synchronous=FULL) на каждый запрос прямо в event loop.
+
+    python bench/bench_user_state.py
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+from models.user_state import UserState, UPSERT_STATE_SQL, ADVANCE_SQL, register_functions  # noqa: E402
+
+
+class ConnectPerCall:
+    """Запись как до перехода на одно WAL соединение"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        register_functions(conn)
+        return conn
+
+    async def set_state(self, bot_id, user_id, flow_id, node_id, context):
+        conn = self._connect()
+        conn.execute(UPSERT_STATE_SQL, (bot_id, user_id, flow_id, node_id, json.dumps(context), 't', 't'))
+        conn.commit()
+        conn.close()
+
+    async def advance(self, bot_id, user_id, node_id, context):
+        conn = self._connect()
+        conn.execute(ADVANCE_SQL, (node_id, json.dumps(context), 't', bot_id, user_id)).fetchone()
+        conn.commit()
+        conn.close()
+
+
+async def user_session(store, user_id):
+    await store.set_state(1, user_id, 'f1', 'n1', {'step': 0})
+    await store.advance(1, user_id, 'n2', {'step': 1})
+
+
+async def measure(store, users: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(user_session(store, user_id) for user_id in range(users)))
+    return users * 2 / (time.perf_counter() - start)
+
+
+async def main():
+    print(f"{'users':>8} {'connect per call, upd/s':>24} {'UserState, upd/s':>18}")
+    for users in (1000, 10000):
+        with tempfile.TemporaryDirectory() as tmp:
+            old_path = os.path.join(tmp, 'old.db')
+            await UserState(old_path).close()  # схема
+            baseline = await measure(ConnectPerCall(old_path), users)
+            store = UserState(os.path.join(tmp, 'new.db'))
+            current = await measure(store, users)
+            await store.close()
+        print(f"{users:>8} {baseline:>24.0f} {current:>18.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
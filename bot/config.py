@@ -6,11 +6,70 @@ load_dotenv()
 # Telegram Bot
 BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 
+# Режим получения update: 'polling' | 'webhook' | 'multi' (все активные боты из базы) | 'router' | 'shard'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Шардирование: 'router' раздаёт update воркерам 'shard' по user_id (consistent hashing)
+SHARD_WORKERS = [url.strip() for url in os.getenv('SHARD_WORKERS', '').split(',') if url.strip()]
+SHARD_SELF_URL = os.getenv('SHARD_SELF_URL', '')
+SHARD_SECRET = os.getenv('SHARD_SECRET', '')
+SHARD_REPLICAS = int(os.getenv('SHARD_REPLICAS', '100'))
+
+# Мультибот: база backend с таблицей bots, период перечитывания списка (сек), long polling (сек)
+BOTS_DATABASE_URL = os.getenv('BOTS_DATABASE_URL', os.getenv('DATABASE_URL', 'sqlite:///../backend/bot_builder.db'))
+BOTS_REFRESH_INTERVAL = float(os.getenv('BOTS_REFRESH_INTERVAL', '30'))
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', '30'))
+
+# Webhook (публичный URL, адрес ASGI сервера, секрет, воркеры и очередь на воркер)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', os.getenv('TELEGRAM_WEBHOOK_URL', ''))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+
 # API
 API_URL = 'http://localhost:8000/api'
 
 # Database
-DB_PATH = 'bot_users.db'
+DB_PATH = os.getenv('DB_PATH', 'bot_users.db')
+
+# Запись состояний: 'sync' | 'checkpoint' | 'timer' и период фонового сброса (сек)
+STATE_DURABILITY = os.getenv('STATE_DURABILITY', 'checkpoint')
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '1'))
+
+# Максимум узлов, выполняемых подряд без ожидания ввода
+FLOW_MAX_STEPS = int(os.getenv('FLOW_MAX_STEPS', '1000'))
+
+# Окно (сек), в котором таймеры delayNode держатся в памяти
+TIMER_HORIZON = float(os.getenv('TIMER_HORIZON', '60'))
 
 # Bot ID в системе flows
 BOT_ID = 1
+
+# Кэш flows (секунды до перепроверки через If-None-Match / число версий в LRU)
+FLOW_CACHE_TTL = float(os.getenv('FLOW_CACHE_TTL', '30'))
+FLOW_CACHE_SIZE = int(os.getenv('FLOW_CACHE_SIZE', '128'))
+
+# События изменения flows: 'redis://...' или SSE 'http://.../api/flows/events' ('' - только TTL)
+# (FLOW_CACHE_TTL остаётся в силе и с подпиской - страховка от потерянных событий)
+FLOW_EVENTS_URL = os.getenv('FLOW_EVENTS_URL', '')
+
+# HTTP пул к API
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', '100'))
+API_POOL_SIZE_PER_HOST = int(os.getenv('API_POOL_SIZE_PER_HOST', '20'))
+API_KEEPALIVE_TIMEOUT = float(os.getenv('API_KEEPALIVE_TIMEOUT', '30'))
+API_REQUEST_TIMEOUT = float(os.getenv('API_REQUEST_TIMEOUT', '10'))
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '3'))
+API_RETRIES = int(os.getenv('API_RETRIES', '2'))
+API_BACKOFF = float(os.getenv('API_BACKOFF', '0.2'))
+API_BREAKER_THRESHOLD = int(os.getenv('API_BREAKER_THRESHOLD', '5'))
+API_BREAKER_RESET = float(os.getenv('API_BREAKER_RESET', '30'))
+
+# Лимиты отправки Telegram (сообщений/сек на бота, на чат, запас на чат)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = float(os.getenv('SEND_CHAT_BURST', '3'))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '8'))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
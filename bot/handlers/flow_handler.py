@@ -1,105 +1,196 @@
+import logging
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import CommandStart
 from models.user_state import UserState
+from models.buffered_state import BufferedUserState
+from models.timer_store import TimerStore
 from utils.flow_executor import FlowExecutor
+from utils.compiled_flow import CompiledFlow
+from utils.flow_cache import FlowCache
+from utils.flow_events import FlowEventListener
+from utils.circuit_breaker import CircuitBreaker
+from utils.send_scheduler import SendScheduler
+from utils.timer_wheel import TimerWheel
 import config
 
+logger = logging.getLogger(__name__)
+
 router = Router()
-user_state = UserState(config.DB_PATH)
-executor = FlowExecutor(config.API_URL, config.BOT_ID)
+user_state = BufferedUserState(
+    UserState(config.DB_PATH, legacy_bot_id=config.BOT_ID),
+    durability=config.STATE_DURABILITY,
+    flush_interval=config.STATE_FLUSH_INTERVAL,
+)
+timer_wheel = TimerWheel(TimerStore(config.DB_PATH, legacy_bot_id=config.BOT_ID), horizon=config.TIMER_HORIZON)
+send_scheduler = SendScheduler(
+    global_rate=config.SEND_GLOBAL_RATE,
+    chat_rate=config.SEND_CHAT_RATE,
+    chat_burst=config.SEND_CHAT_BURST,
+    workers=config.SEND_WORKERS,
+    max_retries=config.SEND_MAX_RETRIES,
+)
+flow_cache = FlowCache(config.FLOW_CACHE_TTL, config.FLOW_CACHE_SIZE)
+executor = FlowExecutor(
+    config.API_URL,
+    config.BOT_ID,
+    flow_cache,
+    pool_size=config.API_POOL_SIZE,
+    pool_size_per_host=config.API_POOL_SIZE_PER_HOST,
+    keepalive_timeout=config.API_KEEPALIVE_TIMEOUT,
+    request_timeout=config.API_REQUEST_TIMEOUT,
+    connect_timeout=config.API_CONNECT_TIMEOUT,
+    retries=config.API_RETRIES,
+    backoff=config.API_BACKOFF,
+    breaker=CircuitBreaker(config.API_BREAKER_THRESHOLD, config.API_BREAKER_RESET),
+    scheduler=send_scheduler,
+)
+flow_events = FlowEventListener(executor, config.FLOW_EVENTS_URL)
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
-    """Обработка команды /start - запуск активного flow"""
+async def cmd_start(message: Message, bot_id: int = config.BOT_ID):
+    """Обработка команды /start - запуск активного flow
+    
+    bot_id - ID бота в системе flows (передаётся диспетчером в workflow data)
+    """
     user_id = message.from_user.id
     
-    # Получаем активный flow
-    active_flow = await executor.get_active_flow()
+    # Получаем активный flow (тело целиком, одним запросом)
+    flow_data = await executor.get_active_flow(bot_id)
     
-    if not active_flow:
+    if not flow_data:
         await message.answer("⚠️ No active flow configured. Please set up a flow in the admin panel.")
         return
     
-    flow_id = active_flow['flow_id']
-    
-    # Получаем данные flow
-    flow_data = await executor.get_flow_data(flow_id)
-    
-    if not flow_data:
-        await message.answer("❌ Failed to load flow data.")
-        return
+    flow_id = flow_data['flow_id']
+    flow = executor.compile_flow(flow_data, bot_id)
     
-    # Находим стартовый узел (type: 'input')
-    nodes = flow_data.get('flow', {}).get('nodes', [])
-    start_node = None
-    for node in nodes:
-        if node.get('type') == 'input':
-            start_node = node
-            break
+    # Стартовый узел (type: 'input') вычислен при компиляции
+    start_node = flow.start_node
     
     if not start_node:
         await message.answer("❌ Flow has no start node.")
         return
     
     # Устанавливаем состояние пользователя
-    user_state.set_state(user_id, flow_id, start_node['id'], {})
+    state = {'flow_id': flow_id, 'current_node_id': start_node['id'], 'context': {}}
+    await user_state.set_state(bot_id, user_id, flow_id, start_node['id'], {})
     
     # Выполняем стартовый узел
-    await execute_current_node(message.bot, user_id, flow_data)
+    await execute_current_node(message.bot, bot_id, user_id, flow, state)
+    
+    # Flow ждёт ввода или закончился - сохраняем накопленные переходы
+    await user_state.checkpoint(bot_id, user_id)
 
 
-async def execute_current_node(bot, user_id: int, flow_data: dict = None):
-    """Выполнить текущий узел пользователя"""
-    state = user_state.get_state(user_id)
+async def execute_current_node(bot, bot_id: int, user_id: int, flow: CompiledFlow = None, state: dict = None):
+    """Выполнять узлы flow начиная с текущего, пока flow не остановится
+    
+    Цикл вместо рекурсии: состояние держится в памяти между шагами и
+    записывается один раз, когда flow ждёт ввода, закончился или прерван.
+    """
+    if state is None:
+        state = await user_state.get_state(bot_id, user_id)
     
     if not state:
         return
     
-    # Если flow_data не передан, загружаем
-    if not flow_data:
-        flow_data = await executor.get_flow_data(state['flow_id'])
+    # Если flow не передан, загружаем
+    if not flow:
+        flow_data = await executor.get_flow_data(state['flow_id'], bot_id)
+        
+        if not flow_data:
+            return
+        
+        flow = executor.compile_flow(flow_data, bot_id)
+    
+    node_id = state['current_node_id']
+    context = state['context']
+    visited = set()
+    finished = False
+    
+    try:
+        for _ in range(config.FLOW_MAX_STEPS):
+            # Повторный узел без ожидания ввода - бесконечный цикл в графе
+            if node_id in visited:
+                logger.warning(f"Cycle detected in flow {state['flow_id']} at node {node_id} (user {user_id})")
+                break
+            visited.add(node_id)
+            
+            current_node = flow.find_node(node_id)
+            
+            if not current_node:
+                break
+            
+            # Выполняем узел
+            result = await executor.execute_node(bot, user_id, current_node, context, flow)
+            
+            # Задержка - продолжение по таймеру, состояние остаётся на delayNode
+            if result.get('delay'):
+                await timer_wheel.schedule(bot_id, user_id, state['flow_id'], node_id, result['delay'])
+                break
+            
+            # Ошибка или ожидание ввода пользователя - останавливаемся
+            if not result['success'] or result['wait_for_input']:
+                break
+            
+            if result.get('finished'):
+                # Узел завершил flow (ветка условия никуда не ведёт)
+                finished = True
+                break
+            
+            if result['next_node_id'] == 'auto':
+                # Автоматический переход к следующему узлу
+                next_nodes = flow.get_next_nodes(node_id)
+                
+                if not next_nodes:
+                    # Достигнут конец flow
+                    finished = True
+                    break
+                
+                node_id = next_nodes[0]['id']  # Берём первый доступный
+            elif result['next_node_id']:
+                # Переход к конкретному узлу
+                node_id = result['next_node_id']
+            else:
+                break
+        else:
+            logger.warning(f"Step budget exceeded in flow {state['flow_id']} at node {node_id} (user {user_id})")
+    finally:
+        if finished:
+            await user_state.clear_state(bot_id, user_id)
+        elif node_id != state['current_node_id']:
+            await user_state.set_state(bot_id, user_id, state['flow_id'], node_id, context)
+
+
+async def resume_after_delay(bot, bot_id: int, user_id: int, flow_id: str, node_id: str):
+    """Продолжить flow после истечения delayNode"""
+    state = await user_state.get_state(bot_id, user_id)
     
-    if not flow_data:
+    # Пользователь уже ушёл с этого узла (например, /start заново)
+    if not state or state['flow_id'] != flow_id or state['current_node_id'] != node_id:
         return
     
-    current_node = executor.find_node(flow_data, state['current_node_id'])
+    flow_data = await executor.get_flow_data(flow_id, bot_id)
     
-    if not current_node:
+    if not flow_data:
         return
     
-    # Выполняем узел
-    result = await executor.execute_node(bot, user_id, current_node, state['context'])
+    flow = executor.compile_flow(flow_data, bot_id)
+    next_nodes = flow.get_next_nodes(node_id)
     
-    if not result['success']:
-        return
-    
-    # Если нужно ждать ввода пользователя - останавливаемся
-    if result['wait_for_input']:
-        return
+    if next_nodes:
+        state = await user_state.advance(bot_id, user_id, next_nodes[0]['id'])
+        await execute_current_node(bot, bot_id, user_id, flow, state)
+    else:
+        await user_state.clear_state(bot_id, user_id)
     
-    # Если указан следующий узел
-    if result['next_node_id'] == 'auto':
-        # Автоматический переход к следующему узлу
-        next_nodes = executor.get_next_nodes(flow_data, state['current_node_id'])
-        
-        if next_nodes:
-            next_node = next_nodes[0]  # Берём первый доступный
-            user_state.set_state(user_id, state['flow_id'], next_node['id'], state['context'])
-            # Рекурсивно выполняем следующий узел
-            await execute_current_node(bot, user_id, flow_data)
-        else:
-            # Достигнут конец flow
-            user_state.clear_state(user_id)
-    elif result['next_node_id']:
-        # Переход к конкретному узлу
-        user_state.set_state(user_id, state['flow_id'], result['next_node_id'], state['context'])
-        await execute_current_node(bot, user_id, flow_data)
+    await user_state.checkpoint(bot_id, user_id)
 
 
 @router.callback_query(F.data.startswith('btn:'))
-async def handle_button_callback(callback: CallbackQuery):
+async def handle_button_callback(callback: CallbackQuery, bot_id: int = config.BOT_ID):
     """Обработка нажатий на inline кнопки"""
     user_id = callback.from_user.id
     
@@ -112,21 +203,23 @@ async def handle_button_callback(callback: CallbackQuery):
     node_id = parts[1]
     button_index = int(parts[2])
     
-    state = user_state.get_state(user_id)
+    state = await user_state.get_state(bot_id, user_id)
     
     if not state or state['current_node_id'] != node_id:
         await callback.answer("⚠️ This button is no longer active")
         return
     
     # Получаем flow data
-    flow_data = await executor.get_flow_data(state['flow_id'])
+    flow_data = await executor.get_flow_data(state['flow_id'], bot_id)
     
     if not flow_data:
         await callback.answer("❌ Failed to load flow")
         return
     
+    flow = executor.compile_flow(flow_data, bot_id)
+    
     # Находим узел с кнопкой
-    button_node = executor.find_node(flow_data, node_id)
+    button_node = flow.find_node(node_id)
     
     if not button_node:
         await callback.answer("❌ Button node not found")
@@ -141,23 +234,23 @@ async def handle_button_callback(callback: CallbackQuery):
     
     button = buttons[button_index]
     
-    # Сохраняем выбор в контекст
-    context_update = {
-        'last_button': button.get('text', ''),
-        'last_button_value': button.get('value', '')
-    }
-    user_state.update_context(user_id, context_update)
-    
     await callback.answer(f"✅ {button.get('text', 'Selected')}")
     
     # Переходим к следующему узлу
-    next_nodes = executor.get_next_nodes(flow_data, node_id)
+    next_nodes = flow.get_next_nodes(node_id)
     
     if next_nodes:
         next_node = next_nodes[0]
-        user_state.set_state(user_id, state['flow_id'], next_node['id'], state['context'])
-        await execute_current_node(callback.bot, user_id, flow_data)
+        # Сохраняем выбор в контекст и переходим одной записью
+        context_update = {
+            'last_button': button.get('text', ''),
+            'last_button_value': button.get('value', '')
+        }
+        state = await user_state.advance(bot_id, user_id, next_node['id'], context_update)
+        await execute_current_node(callback.bot, bot_id, user_id, flow, state)
+        await user_state.checkpoint(bot_id, user_id)
     else:
         # Конец flow
-        user_state.clear_state(user_id)
+        await user_state.clear_state(bot_id, user_id)
+        await user_state.checkpoint(bot_id, user_id)
         await callback.message.answer("✅ Flow completed!")
@@ -3,12 +3,16 @@ warnings.filterwarnings('ignore', category=UserWarning, module='pydantic')
 
 import asyncio
 import logging
+from functools import partial
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
 import config
 from handlers import flow_handler
+from runtime import BotRuntime, make_bot_loader
+from sharding import ShardRouter, ShardWorkerApp
+from webhook import WebhookApp
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,28 +22,190 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    """Запуск бота"""
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Приём update через webhook (ASGI сервер + пул воркеров)"""
+    import uvicorn
+    
+    app = WebhookApp(
+        bot,
+        dp,
+        path=config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET,
+        workers=config.WEBHOOK_WORKERS,
+        queue_size=config.WEBHOOK_QUEUE_SIZE,
+    )
+    
+    await bot.set_webhook(
+        f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+        secret_token=config.WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host=config.WEBHOOK_HOST,
+        port=config.WEBHOOK_PORT,
+        log_level='warning',
+    ))
+    
+    logger.info(f"🌐 Webhook listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    
+    try:
+        await server.serve()
+    finally:
+        logger.info(f"📊 Webhook metrics: {app.metrics()}")
+
+
+async def serve(app, name: str):
+    """Запустить ASGI приложение на WEBHOOK_HOST:WEBHOOK_PORT"""
+    import uvicorn
+    
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host=config.WEBHOOK_HOST,
+        port=config.WEBHOOK_PORT,
+        log_level='warning',
+    ))
+    
+    logger.info(f"🌐 {name} listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    await server.serve()
+
+
+async def run_router(bot: Bot, dp: Dispatcher):
+    """Роутер шардов: принимает webhook и раздаёт update воркерам по user_id"""
+    app = ShardRouter(
+        config.SHARD_WORKERS,
+        path=config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET,
+        shard_secret=config.SHARD_SECRET,
+        replicas=config.SHARD_REPLICAS,
+    )
+    
+    await bot.set_webhook(
+        f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+        secret_token=config.WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
     
-    # Инициализация бота
-    bot = Bot(
-        token=config.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    try:
+        await serve(app, f"Shard router ({len(config.SHARD_WORKERS)} workers)")
+    finally:
+        logger.info(f"📊 Router metrics: {app.metrics()}")
+
+
+async def run_shard(bot: Bot, dp: Dispatcher):
+    """Воркер-шард: update приходят от роутера, webhook не регистрируется"""
+    webhook = WebhookApp(
+        bot,
+        dp,
+        path=config.WEBHOOK_PATH,
+        secret=config.WEBHOOK_SECRET,
+        workers=config.WEBHOOK_WORKERS,
+        queue_size=config.WEBHOOK_QUEUE_SIZE,
+    )
+    app = ShardWorkerApp(
+        webhook,
+        flow_handler.user_state,
+        flow_handler.timer_wheel,
+        self_url=config.SHARD_SELF_URL,
+        shard_secret=config.SHARD_SECRET,
+        replicas=config.SHARD_REPLICAS,
     )
     
+    try:
+        await serve(app, f"Shard {config.SHARD_SELF_URL}")
+    finally:
+        logger.info(f"📊 Webhook metrics: {webhook.metrics()}")
+
+
+async def main():
+    """Запуск бота (или всех активных ботов в режиме multi)"""
+    
     # Инициализация диспетчера
     dp = Dispatcher()
     
     # Регистрация роутеров
     dp.include_router(flow_handler.router)
     
+    if config.BOT_MODE == 'router':
+        # Роутеру шардов не нужны flows, состояния и отправка
+        bot = Bot(token=config.BOT_TOKEN)
+        try:
+            await run_router(bot, dp)
+        finally:
+            await bot.session.close()
+        return
+    
+    # Общий HTTP пул к API flows
+    await flow_handler.executor.start()
+    
+    # Подписка на изменения flows (сброс и прогрев кэша)
+    await flow_handler.flow_events.start()
+    
+    # Воркеры отправки сообщений
+    await flow_handler.send_scheduler.start()
+    
+    # Фоновый сброс буфера состояний
+    await flow_handler.user_state.start()
+    
+    bot = None
+    runtime = None
+    
+    if config.BOT_MODE == 'multi':
+        # Все активные боты из базы в одном процессе
+        runtime = BotRuntime(
+            dp,
+            make_bot_loader(config.BOTS_DATABASE_URL),
+            refresh_interval=config.BOTS_REFRESH_INTERVAL,
+            polling_timeout=config.POLLING_TIMEOUT,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        await runtime.start()
+        
+        async def resume(bot_id: int, user_id: int, flow_id: str, node_id: str):
+            tenant_bot = runtime.get_bot(bot_id)
+            if tenant_bot is None:
+                logger.warning(f"Delayed continuation for stopped bot {bot_id} dropped (user {user_id})")
+                return
+            await flow_handler.resume_after_delay(tenant_bot, bot_id, user_id, flow_id, node_id)
+    else:
+        # Инициализация бота
+        bot = Bot(
+            token=config.BOT_TOKEN,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+        )
+        # ID бота в системе flows для handler-ов
+        dp['bot_id'] = config.BOT_ID
+        resume = partial(flow_handler.resume_after_delay, bot)
+    
+    # Таймеры delayNode (продолжают flow после задержки)
+    await flow_handler.timer_wheel.start(resume)
+    
     logger.info("🚀 Bot started!")
     
     try:
-        # Запуск polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if runtime is not None:
+            await runtime.run()
+        elif config.BOT_MODE == 'webhook':
+            await run_webhook(bot, dp)
+        elif config.BOT_MODE == 'shard':
+            await run_shard(bot, dp)
+        else:
+            # Запуск polling
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
-        await bot.session.close()
+        logger.info(f"📊 Flow cache stats: {flow_handler.flow_cache.stats()}")
+        logger.info(f"📊 Send scheduler metrics: {flow_handler.send_scheduler.metrics()}")
+        if runtime is not None:
+            logger.info(f"📊 Runtime metrics: {runtime.metrics()}")
+            await runtime.close()
+        await flow_handler.flow_events.close()
+        await flow_handler.timer_wheel.close()
+        await flow_handler.send_scheduler.close()
+        await flow_handler.executor.close()
+        await flow_handler.user_state.close()
+        if bot is not None:
+            await bot.session.close()
 
 
 if __name__ == '__main__':
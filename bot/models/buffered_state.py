@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Tuple
+
+from models.user_state import UserState, merge_context
+
+logger = logging.getLogger(__name__)
+
+# Пометка "состояние удалено, но ещё не записано"
+_DELETED = object()
+
+
+class BufferedUserState:
+    """Write-behind слой поверх UserState
+
+    Промежуточные переходы пользователя держатся в памяти, схлопываются
+    в последнее состояние и записываются одной транзакцией.
+
+    Режимы durability:
+    - 'sync'       - без буфера, каждая запись сразу уходит в базу;
+    - 'checkpoint' - запись при checkpoint() (flow ждёт ввода или закончился)
+                     и по таймеру; при падении теряются только переходы
+                     текущего незавершённого шага flow;
+    - 'timer'      - запись только по таймеру; при падении теряется
+                     не больше flush_interval секунд переходов.
+    """
+
+    DURABILITY_MODES = ('sync', 'checkpoint', 'timer')
+
+    def __init__(self, store: UserState, durability: str = 'checkpoint', flush_interval: float = 1.0):
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+
+        self.store = store
+        self.durability = durability
+        self.flush_interval = flush_interval
+        # (bot_id, user_id) -> (flow_id, node_id, context) или _DELETED
+        self._pending: Dict[Tuple[int, int], Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запустить периодический сброс буфера"""
+        if self.durability != 'sync' and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"State flush failed: {e!r}")
+
+    async def get_state(self, bot_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получить состояние пользователя (с учётом незаписанных изменений)"""
+        pending = self._pending.get((bot_id, user_id))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            flow_id, node_id, context = pending
+            return {'flow_id': flow_id, 'current_node_id': node_id, 'context': dict(context)}
+        return await self.store.get_state(bot_id, user_id)
+
+    async def set_state(self, bot_id: int, user_id: int, flow_id: str, node_id: str, context: Dict = None):
+        """Установить состояние пользователя"""
+        if self.durability == 'sync':
+            await self.store.set_state(bot_id, user_id, flow_id, node_id, context)
+            return
+        self._pending[(bot_id, user_id)] = (flow_id, node_id, dict(context or {}))
+
+    async def update_context(self, bot_id: int, user_id: int, context: Dict):
+        """Обновить контекст пользователя"""
+        key = (bot_id, user_id)
+        pending = self._pending.get(key)
+        if pending is _DELETED:
+            return
+        if pending is not None:
+            flow_id, node_id, old_context = pending
+            self._pending[key] = (flow_id, node_id, merge_context(old_context, context))
+            return
+        await self.store.update_context(bot_id, user_id, context)
+
+    async def advance(self, bot_id: int, user_id: int, node_id: str,
+                      context: Dict = None) -> Optional[Dict[str, Any]]:
+        """Перейти к узлу и дополнить контекст"""
+        key = (bot_id, user_id)
+        pending = self._pending.get(key)
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            flow_id, _, old_context = pending
+            merged = merge_context(old_context, context or {})
+            self._pending[key] = (flow_id, node_id, merged)
+            return {'flow_id': flow_id, 'current_node_id': node_id, 'context': dict(merged)}
+        return await self.store.advance(bot_id, user_id, node_id, context)
+
+    async def clear_state(self, bot_id: int, user_id: int):
+        """Очистить состояние пользователя"""
+        if self.durability == 'sync':
+            await self.store.clear_state(bot_id, user_id)
+            return
+        self._pending[(bot_id, user_id)] = _DELETED
+
+    async def checkpoint(self, bot_id: int, user_id: int):
+        """Flow ждёт ввода или закончился - записать состояние пользователя"""
+        key = (bot_id, user_id)
+        if self.durability == 'checkpoint' and key in self._pending:
+            await self._write({key: self._pending.pop(key)})
+
+    async def flush(self):
+        """Записать все незаписанные состояния одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        await self._write(batch)
+
+    async def _write(self, batch: Dict[Tuple[int, int], Any]):
+        upserts = []
+        deletes = []
+        for key, pending in batch.items():
+            if pending is _DELETED:
+                deletes.append(key)
+            else:
+                upserts.append((*key, *pending))
+
+        try:
+            await self.store.write_batch(upserts, deletes)
+        except Exception:
+            # Возвращаем в буфер то, что не успели перезаписать новые переходы
+            for key, pending in batch.items():
+                self._pending.setdefault(key, pending)
+            raise
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def close(self):
+        """Остановить таймер, сбросить буфер и закрыть хранилище"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self.store.close()
@@ -0,0 +1,112 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+# Отложенное продолжение flow: одно на пользователя бота
+UPSERT_TIMER_SQL = '''
+    INSERT INTO timers (bot_id, user_id, flow_id, node_id, due_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(bot_id, user_id) DO UPDATE SET
+        flow_id = excluded.flow_id,
+        node_id = excluded.node_id,
+        due_at = excluded.due_at
+'''
+
+SELECT_RANGE_SQL = '''
+    SELECT bot_id, user_id, flow_id, node_id, due_at FROM timers
+    WHERE due_at > ? AND due_at <= ?
+    ORDER BY due_at
+'''
+
+DELETE_TIMER_SQL = 'DELETE FROM timers WHERE bot_id = ? AND user_id = ? AND due_at = ?'
+
+CANCEL_TIMER_SQL = 'DELETE FROM timers WHERE bot_id = ? AND user_id = ?'
+
+# (due_at, bot_id, user_id, flow_id, node_id)
+Timer = Tuple[float, int, int, str, str]
+
+
+class TimerStore:
+    """Долговременная таблица таймеров delayNode, индексированная по времени срабатывания"""
+
+    def __init__(self, db_path: str, legacy_bot_id: int = 1):
+        self.db_path = db_path
+        self.legacy_bot_id = legacy_bot_id
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='timer-store')
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.init_db()
+
+    def init_db(self):
+        """Создать таблицу таймеров"""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(timers)')]
+        legacy = bool(columns) and 'bot_id' not in columns
+
+        with self._conn:
+            if legacy:
+                self._conn.execute('DROP INDEX IF EXISTS ix_timers_due_at')
+                self._conn.execute('ALTER TABLE timers RENAME TO timers_legacy')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS timers (
+                    bot_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    flow_id TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    due_at REAL NOT NULL,
+                    PRIMARY KEY (bot_id, user_id)
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_timers_due_at ON timers (due_at)')
+            if legacy:
+                self._conn.execute(
+                    'INSERT INTO timers SELECT ?, user_id, flow_id, node_id, due_at FROM timers_legacy',
+                    (self.legacy_bot_id,),
+                )
+                self._conn.execute('DROP TABLE timers_legacy')
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _schedule(self, bot_id: int, user_id: int, flow_id: str, node_id: str, due_at: float):
+        self._conn.execute(UPSERT_TIMER_SQL, (bot_id, user_id, flow_id, node_id, due_at))
+        self._conn.commit()
+
+    def _load_range(self, after: float, until: float) -> List[Timer]:
+        rows = self._conn.execute(SELECT_RANGE_SQL, (after, until)).fetchall()
+        return [(due_at, bot_id, user_id, flow_id, node_id) for bot_id, user_id, flow_id, node_id, due_at in rows]
+
+    def _pop(self, timers: List[Timer]) -> List[Timer]:
+        popped = []
+        with self._conn:
+            for timer in timers:
+                due_at, bot_id, user_id = timer[:3]
+                if self._conn.execute(DELETE_TIMER_SQL, (bot_id, user_id, due_at)).rowcount:
+                    popped.append(timer)
+        return popped
+
+    def _cancel(self, bot_id: int, user_id: int):
+        self._conn.execute(CANCEL_TIMER_SQL, (bot_id, user_id))
+        self._conn.commit()
+
+    async def schedule(self, bot_id: int, user_id: int, flow_id: str, node_id: str, due_at: float):
+        """Сохранить таймер (заменяет предыдущий таймер пользователя)"""
+        await self._run(self._schedule, bot_id, user_id, flow_id, node_id, due_at)
+
+    async def load_range(self, after: float, until: float) -> List[Timer]:
+        """Таймеры со сроком в (after, until]"""
+        return await self._run(self._load_range, after, until)
+
+    async def pop(self, timers: List[Timer]) -> List[Timer]:
+        """Удалить сработавшие таймеры, вернуть те, что ещё не были заменены или отменены"""
+        return await self._run(self._pop, timers)
+
+    async def cancel(self, bot_id: int, user_id: int):
+        """Отменить таймер пользователя"""
+        await self._run(self._cancel, bot_id, user_id)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramUnauthorizedError
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Активные боты из базы backend
+SELECT_ACTIVE_BOTS_SQL = 'SELECT id, token FROM bots WHERE is_active = :active'
+
+
+def make_bot_loader(database_url: str) -> Callable[[], Awaitable[Dict[int, str]]]:
+    """Загрузчик активных ботов из базы backend: () -> {bot_id: token}"""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url, pool_pre_ping=True, pool_size=1)
+
+    def load() -> Dict[int, str]:
+        with engine.connect() as conn:
+            rows = conn.execute(text(SELECT_ACTIVE_BOTS_SQL), {'active': True})
+            return {row[0]: row[1] for row in rows}
+
+    async def load_bots() -> Dict[int, str]:
+        return await asyncio.to_thread(load)
+
+    return load_bots
+
+
+def get_rss_bytes() -> int:
+    """Текущий RSS процесса (на Linux из /proc, иначе пиковый)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class BotTenant:
+    """Один бот внутри общего процесса"""
+
+    __slots__ = ('bot_id', 'token', 'bot', 'task', 'started_at', 'updates', 'errors')
+
+    def __init__(self, bot_id: int, token: str, bot: Bot):
+        self.bot_id = bot_id
+        self.token = token
+        self.bot = bot
+        self.task: Optional[asyncio.Task] = None
+        self.started_at = time.time()
+        self.updates = 0
+        self.errors = 0
+
+
+class BotRuntime:
+    """Мультибот: все активные боты из базы в одном процессе
+
+    Боты делят event loop, диспетчер с роутерами, HTTP сессию к Telegram
+    (aiohttp пул), кэш flows и хранилище состояний. На каждого бота -
+    только объект Bot и задача long polling. Список ботов периодически
+    перечитывается: новые боты запускаются, выключенные и удалённые -
+    останавливаются, бот со сменённым токеном перезапускается.
+
+    Handler-ы получают ID бота в системе flows через workflow data (bot_id).
+    """
+
+    def __init__(self, dp: Dispatcher, load_bots: Callable[[], Awaitable[Dict[int, str]]],
+                 refresh_interval: float = 30.0, polling_timeout: int = 30,
+                 allowed_updates: Optional[List[str]] = None):
+        self.dp = dp
+        self.load_bots = load_bots
+        self.refresh_interval = refresh_interval
+        self.polling_timeout = polling_timeout
+        self.allowed_updates = allowed_updates
+
+        self.tenants: Dict[int, BotTenant] = {}
+        self._session: Optional[AiohttpSession] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._handlers: set = set()
+
+    def get_bot(self, bot_id: int) -> Optional[Bot]:
+        tenant = self.tenants.get(bot_id)
+        return tenant.bot if tenant else None
+
+    async def start(self):
+        """Загрузить ботов и запустить периодическое обновление списка"""
+        if self._session is None:
+            # Одна HTTP сессия (и пул соединений) на всех ботов
+            self._session = AiohttpSession()
+        await self.refresh()
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def run(self):
+        """Работать до отмены (остановка - close())"""
+        await self.start()
+        await asyncio.Event().wait()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Bots refresh failed: {e!r}")
+
+    async def refresh(self):
+        """Сверить запущенных ботов с базой"""
+        bots = await self.load_bots()
+        changed = False
+
+        for bot_id in [bot_id for bot_id in self.tenants if bot_id not in bots]:
+            await self.remove(bot_id)
+            changed = True
+
+        for bot_id, token in bots.items():
+            tenant = self.tenants.get(bot_id)
+            if tenant and tenant.token == token:
+                continue
+            if tenant:
+                await self.remove(bot_id)
+            await self.add(bot_id, token)
+            changed = True
+
+        if changed:
+            metrics = self.metrics()
+            logger.info(
+                f"📊 Bots running: {metrics['bots']}, RSS {metrics['rss_bytes'] // 1024} KiB, "
+                f"~{metrics['rss_per_bot_bytes'] // 1024} KiB per bot"
+            )
+
+    async def add(self, bot_id: int, token: str):
+        """Запустить бота"""
+        if bot_id in self.tenants:
+            return
+        try:
+            bot = Bot(
+                token=token,
+                session=self._session,
+                default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+            )
+        except Exception as e:
+            # Невалидный токен в базе не должен ронять остальных ботов
+            logger.error(f"Bot {bot_id} not started: {e!r}")
+            return
+
+        tenant = BotTenant(bot_id, token, bot)
+        tenant.task = asyncio.create_task(self._poll(tenant))
+        self.tenants[bot_id] = tenant
+        logger.info(f"🤖 Bot {bot_id} started ({len(self.tenants)} running)")
+
+    async def remove(self, bot_id: int):
+        """Остановить бота (сессия общая и не закрывается)"""
+        tenant = self.tenants.pop(bot_id, None)
+        if tenant is None:
+            return
+        if tenant.task is not None:
+            tenant.task.cancel()
+            await asyncio.gather(tenant.task, return_exceptions=True)
+        logger.info(f"🛑 Bot {bot_id} stopped ({len(self.tenants)} running)")
+
+    async def _poll(self, tenant: BotTenant):
+        """Long polling одного бота; update-ы обрабатываются задачами"""
+        offset = None
+        failures = 0
+        while True:
+            try:
+                updates = await tenant.bot.get_updates(
+                    offset=offset,
+                    timeout=self.polling_timeout,
+                    allowed_updates=self.allowed_updates,
+                    request_timeout=self.polling_timeout + 10,
+                )
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except TelegramUnauthorizedError:
+                # Токен отозван - бот остаётся выключенным до следующей смены токена
+                logger.error(f"Bot {tenant.bot_id} unauthorized, polling stopped")
+                return
+            except Exception as e:
+                tenant.errors += 1
+                failures += 1
+                logger.warning(f"Bot {tenant.bot_id} polling failed: {e!r}")
+                await asyncio.sleep(min(60, 2 ** failures))
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                task = asyncio.create_task(self._handle(tenant, update))
+                self._handlers.add(task)
+                task.add_done_callback(self._handlers.discard)
+
+    async def _handle(self, tenant: BotTenant, update: Update):
+        try:
+            await self.dp.feed_update(tenant.bot, update, bot_id=tenant.bot_id)
+            tenant.updates += 1
+        except Exception as e:
+            tenant.errors += 1
+            logger.error(f"Bot {tenant.bot_id} update {update.update_id} failed: {e!r}")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Число ботов, память процесса и в среднем на бота
+
+        RSS на конкретного бота не измерить: боты делят сессию, кэш и
+        handler-ы, а память растёт по ходу polling, а не при запуске.
+        """
+        rss = get_rss_bytes()
+        bots = len(self.tenants)
+        return {
+            'bots': bots,
+            'rss_bytes': rss,
+            'rss_per_bot_bytes': rss // bots if bots else 0,
+            'handlers': len(self._handlers),
+            'per_bot': {
+                bot_id: {
+                    'updates': tenant.updates,
+                    'errors': tenant.errors,
+                    'running': tenant.task is not None and not tenant.task.done(),
+                }
+                for bot_id, tenant in self.tenants.items()
+            },
+        }
+
+    async def close(self):
+        """Остановить всех ботов и закрыть общую сессию"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        for bot_id in list(self.tenants):
+            await self.remove(bot_id)
+        if self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
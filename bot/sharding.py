@@ -0,0 +1,422 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Iterable
+import aiohttp
+
+from models.buffered_state import BufferedUserState
+from models.timer_store import Timer
+from utils.timer_wheel import TimerWheel
+from webhook import WebhookApp, get_update_user_id
+
+logger = logging.getLogger(__name__)
+
+SHARD_SECRET_HEADER = b'x-shard-secret'
+
+
+class HashRing:
+    """Consistent hashing: user_id -> воркер
+
+    Каждый воркер занимает replicas виртуальных точек на кольце, поэтому
+    при добавлении или удалении воркера переезжает только ~1/N пользователей.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owners.values()))
+
+    def add_node(self, node: str):
+        for i in range(self.replicas):
+            key = self._hash(f'{node}#{i}')
+            if key not in self._owners:
+                bisect.insort(self._keys, key)
+                self._owners[key] = node
+
+    def remove_node(self, node: str):
+        self._keys = [key for key in self._keys if self._owners[key] != node]
+        self._owners = {key: owner for key, owner in self._owners.items() if owner != node}
+
+    def get_node(self, user_id: int) -> Optional[str]:
+        """Воркер, владеющий пользователем"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(str(user_id))) % len(self._keys)
+        return self._owners[self._keys[index]]
+
+
+class ShardRouter:
+    """ASGI роутер webhook-ов между воркерами-шардами
+
+    Принимает update от Telegram и пересылает его воркеру, которому по
+    кольцу принадлежит отправитель. Ответ воркера (200 / 503) уходит
+    Telegram как есть. POST /shards {"workers": [...]} меняет состав
+    воркеров: на время переноса состояний update получают 503, и Telegram
+    доставит их повторно уже новому владельцу.
+
+    Перенос двухфазный: сначала текущие воркеры копируют новым владельцам
+    чужие по новому кольцу состояния и таймеры, ничего не удаляя (copy).
+    Только если копирование прошло у всех, кольцо переключается и воркеры
+    удаляют уже не свои копии (commit). Если копирование не удалось,
+    abort по прежнему кольцу удаляет сделанные копии - всё как до переноса.
+    """
+
+    def __init__(self, workers: List[str], path: str = '/webhook', secret: str = '',
+                 shard_secret: str = '', replicas: int = 100, timeout: float = 10.0):
+        self.path = path
+        self.secret = secret
+        self.shard_secret = shard_secret
+        self.replicas = replicas
+        self.ring = HashRing(workers, replicas)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._rebalance_lock = asyncio.Lock()
+        self.rebalancing = False
+        # Пересылки в полёте: перенос начинается, только когда они дошли до воркеров
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.forwarded: Dict[str, int] = defaultdict(int)
+        self.rejected = 0
+
+    async def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _shard_headers(self) -> Dict[str, str]:
+        return {'X-Shard-Secret': self.shard_secret} if self.shard_secret else {}
+
+    async def forward(self, update: Dict[str, Any], body: bytes) -> int:
+        """Переслать update владельцу, вернуть HTTP статус для Telegram"""
+        worker = self.ring.get_node(get_update_user_id(update))
+        if worker is None or self.rebalancing:
+            self.rejected += 1
+            return 503
+        headers = {'Content-Type': 'application/json'}
+        if self.secret:
+            # Воркер проверяет тот же секрет, что и Telegram у роутера
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.secret
+        self._inflight += 1
+        self._idle.clear()
+        try:
+            async with self._session.post(f'{worker}{self.path}', data=body, headers=headers) as resp:
+                if resp.status == 200:
+                    self.forwarded[worker] += 1
+                else:
+                    self.rejected += 1
+                return resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Shard {worker} unavailable: {e!r}")
+            self.rejected += 1
+            return 503
+        finally:
+            self._inflight -= 1
+            if not self._inflight:
+                self._idle.set()
+
+    async def _call_worker(self, worker: str, action: str, workers: List[str]) -> Dict[str, Any]:
+        """POST /shard/{action} {"workers": [...]} на воркер"""
+        # Перенос может идти дольше обычного запроса
+        async with self._session.post(f'{worker}/shard/{action}', json={'workers': workers},
+                                      headers=self._shard_headers(),
+                                      timeout=aiohttp.ClientTimeout(total=None)) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def _settle(self, action: str, targets: List[str], workers: List[str]) -> Dict[str, Any]:
+        """commit / abort на всех воркерах: ошибка одного не останавливает остальных"""
+        results = {}
+        for worker in targets:
+            try:
+                results[worker] = await self._call_worker(worker, action, workers)
+            except Exception as e:
+                logger.error(f"Shard {worker} {action} failed: {e!r}")
+                results[worker] = {'error': str(e)}
+        return results
+
+    async def rebalance(self, workers: List[str]) -> Dict[str, Any]:
+        """Сменить состав воркеров, перенеся состояния к новым владельцам"""
+        async with self._rebalance_lock:
+            self.rebalancing = True
+            try:
+                # Update, уже отданный прежнему владельцу, должен попасть в его drain перед copy
+                await self._idle.wait()
+                old_workers = self.ring.nodes
+                # Принимают копии новые воркеры, удаляют - прежние: commit/abort нужен всем
+                everyone = sorted(set(old_workers) | set(workers))
+
+                copied = {}
+                try:
+                    # Отдают состояния все текущие воркеры (и уходящие тоже)
+                    for worker in old_workers:
+                        copied[worker] = await self._call_worker(worker, 'copy', workers)
+                except Exception as e:
+                    logger.error(f"Rebalance copy failed, rolling back: {e!r}")
+                    await self._settle('abort', everyone, old_workers)
+                    raise
+
+                self.ring = HashRing(workers, self.replicas)
+                removed = await self._settle('commit', everyone, workers)
+                moved = {'copied': copied, 'removed': removed}
+                logger.info(f"🔀 Shards rebalanced: {workers} ({moved})")
+                return moved
+            finally:
+                self.rebalancing = False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'workers': self.ring.nodes,
+            'rebalancing': self.rebalancing,
+            'forwarded': dict(self.forwarded),
+            'rejected': self.rejected,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await self.start()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await self.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        respond = WebhookApp._respond
+        headers = dict(scope.get('headers') or [])
+
+        if scope['method'] == 'GET' and scope['path'] == '/health':
+            await respond(send, 200, json.dumps(self.metrics()).encode())
+            return
+
+        if scope['method'] == 'POST' and scope['path'] == '/shards':
+            if self.shard_secret and headers.get(SHARD_SECRET_HEADER, b'').decode() != self.shard_secret:
+                await respond(send, 403, b'{"detail": "Forbidden"}')
+                return
+            try:
+                workers = json.loads(await WebhookApp._read_body(receive))['workers']
+            except (ValueError, KeyError, TypeError):
+                await respond(send, 400, b'{"detail": "Invalid body"}')
+                return
+            try:
+                moved = await self.rebalance(workers)
+            except Exception as e:
+                logger.error(f"Rebalance failed: {e!r}")
+                await respond(send, 502, json.dumps({'detail': f'Rebalance failed: {e}'}).encode())
+                return
+            await respond(send, 200, json.dumps({'workers': workers, 'moved': moved}).encode())
+            return
+
+        if scope['method'] != 'POST' or scope['path'] != self.path:
+            await respond(send, 404, b'{"detail": "Not found"}')
+            return
+
+        if self.secret and headers.get(b'x-telegram-bot-api-secret-token', b'').decode() != self.secret:
+            await respond(send, 403, b'{"detail": "Forbidden"}')
+            return
+
+        body = await WebhookApp._read_body(receive)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            await respond(send, 400, b'{"detail": "Invalid JSON"}')
+            return
+
+        status = await self.forward(update, body)
+        if status == 200:
+            await respond(send, 200, b'{"ok": true}')
+        else:
+            await respond(send, 503, b'{"detail": "Shard unavailable"}', [(b'retry-after', b'1')])
+
+
+class ShardWorkerApp:
+    """ASGI приложение воркера-шарда
+
+    Обычный WebhookApp (update приходят от роутера) плюс служебные
+    эндпоинты двухфазного переноса состояний:
+    - POST /shard/copy {"workers": [...]} - скопировать новым владельцам
+      состояния и таймеры пользователей, которые больше не наши; до commit /
+      abort их таймеры здесь не срабатывают, иначе изменения состояний после
+      копии потерялись бы, а таймер сработал бы второй раз у нового владельца;
+    - POST /shard/import {"states": [...], "timers": [...]} - принять их
+      (таймеры откладываются до commit, чтобы не сработать дважды);
+    - POST /shard/commit {"workers": [...]} - кольцо переключено: включить
+      принятые таймеры и удалить не свои состояния и таймеры;
+    - POST /shard/abort {"workers": [...]} - откат: забыть принятые таймеры
+      и удалить копии, не свои по прежнему кольцу.
+    """
+
+    def __init__(self, webhook: WebhookApp, user_state: BufferedUserState, timer_wheel: TimerWheel,
+                 self_url: str, shard_secret: str = '', replicas: int = 100,
+                 batch_size: int = 500, timeout: float = 30.0):
+        self.webhook = webhook
+        self.user_state = user_state
+        self.timer_wheel = timer_wheel
+        self.self_url = self_url
+        self.shard_secret = shard_secret
+        self.replicas = replicas
+        self.batch_size = batch_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # Таймеры, принятые при copy, до commit / abort
+        self._staged_timers: List[Timer] = []
+
+    async def _push(self, session: aiohttp.ClientSession, owner: str, payload: Dict[str, Any]):
+        headers = {'X-Shard-Secret': self.shard_secret} if self.shard_secret else {}
+        async with session.post(f'{owner}/shard/import', json=payload, headers=headers) as resp:
+            resp.raise_for_status()
+
+    async def copy(self, workers: List[str]) -> Dict[str, int]:
+        """Скопировать новым владельцам чужие по новому кольцу состояния и таймеры (ничего не удаляя)"""
+        ring = HashRing(workers, self.replicas)
+        store = self.user_state.store
+
+        # Переезжающих пользователей меняют только update (роутер их уже не
+        # пересылает) и таймеры: останавливаем их таймеры до commit / abort
+        await self.timer_wheel.hold(lambda user_id: ring.get_node(user_id) != self.self_url)
+
+        # Всё принятое до паузы роутера должно попасть в базу
+        await self.webhook.drain()
+        await self.user_state.flush()
+
+        copied_states = 0
+        copied_timers = 0
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            after = (-1, -1)
+            while True:
+                page = await store.load_page(after, self.batch_size)
+                if not page:
+                    break
+                after = page[-1][:2]
+
+                by_owner = defaultdict(list)
+                for row in page:
+                    owner = ring.get_node(row[1])
+                    if owner != self.self_url:
+                        by_owner[owner].append(row)
+
+                for owner, rows in by_owner.items():
+                    await self._push(session, owner, {'states': rows})
+                    copied_states += len(rows)
+
+            timers = await self.timer_wheel.store.load_range(0, float('inf'))
+            by_owner = defaultdict(list)
+            for timer in timers:
+                owner = ring.get_node(timer[2])
+                if owner != self.self_url:
+                    by_owner[owner].append(timer)
+
+            for owner, owner_timers in by_owner.items():
+                await self._push(session, owner, {'timers': owner_timers})
+                copied_timers += len(owner_timers)
+
+        return {'states': copied_states, 'timers': copied_timers}
+
+    async def _drop_foreign(self, ring: HashRing) -> Dict[str, int]:
+        """Удалить состояния и таймеры пользователей, которые по кольцу не наши"""
+        store = self.user_state.store
+        await self.user_state.flush()
+
+        removed_states = 0
+        after = (-1, -1)
+        while True:
+            page = await store.load_page(after, self.batch_size)
+            if not page:
+                break
+            after = page[-1][:2]
+            foreign = [(bot_id, user_id) for bot_id, user_id, *_ in page if ring.get_node(user_id) != self.self_url]
+            if foreign:
+                await store.write_batch([], foreign)
+                removed_states += len(foreign)
+
+        removed_timers = 0
+        for _, bot_id, user_id, _, _ in await self.timer_wheel.store.load_range(0, float('inf')):
+            if ring.get_node(user_id) != self.self_url:
+                await self.timer_wheel.cancel(bot_id, user_id)
+                removed_timers += 1
+
+        return {'states': removed_states, 'timers': removed_timers}
+
+    async def commit(self, workers: List[str]) -> Dict[str, int]:
+        """Кольцо переключено: включить принятые таймеры, удалить не свои копии"""
+        staged, self._staged_timers = self._staged_timers, []
+        if staged:
+            await self.timer_wheel.restore(staged)
+        # Задержанные таймеры скопированы новым владельцам и сработают там
+        self.timer_wheel.release(drop=True)
+        return await self._drop_foreign(HashRing(workers, self.replicas))
+
+    async def abort(self, workers: List[str]) -> Dict[str, int]:
+        """Откат переноса: workers - прежний состав, свои по нему данные не трогаются"""
+        self._staged_timers = []
+        self.timer_wheel.release()
+        return await self._drop_foreign(HashRing(workers, self.replicas))
+
+    async def import_rows(self, payload: Dict[str, Any]):
+        """Принять состояния и таймеры от другого шарда"""
+        states = [tuple(row) for row in payload.get('states') or []]
+        if states:
+            # Пока кольцо не переключено, update этих пользователей сюда не приходят
+            await self.user_state.store.write_batch(states, [])
+        self._staged_timers.extend(tuple(timer) for timer in payload.get('timers') or [])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith('/shard/'):
+            await self.webhook(scope, receive, send)
+            return
+
+        respond = WebhookApp._respond
+        headers = dict(scope.get('headers') or [])
+        if self.shard_secret and headers.get(SHARD_SECRET_HEADER, b'').decode() != self.shard_secret:
+            await respond(send, 403, b'{"detail": "Forbidden"}')
+            return
+        if scope['method'] != 'POST':
+            await respond(send, 404, b'{"detail": "Not found"}')
+            return
+
+        try:
+            payload = json.loads(await WebhookApp._read_body(receive))
+        except ValueError:
+            await respond(send, 400, b'{"detail": "Invalid JSON"}')
+            return
+
+        try:
+            if scope['path'] == '/shard/copy':
+                result = await self.copy(payload['workers'])
+            elif scope['path'] == '/shard/commit':
+                result = await self.commit(payload['workers'])
+            elif scope['path'] == '/shard/abort':
+                result = await self.abort(payload['workers'])
+            elif scope['path'] == '/shard/import':
+                await self.import_rows(payload)
+                result = {'ok': True}
+            else:
+                await respond(send, 404, b'{"detail": "Not found"}')
+                return
+        except Exception as e:
+            logger.error(f"Shard {scope['path']} failed: {e!r}")
+            await respond(send, 500, json.dumps({'detail': str(e)}).encode())
+            return
+
+        await respond(send, 200, json.dumps(result).encode())
@@ -0,0 +1,46 @@
+import time
+
+
+class CircuitBreaker:
+    """Circuit breaker для запросов к API
+
+    После failure_threshold подряд неудачных запросов цепь размыкается
+    и запросы сразу отклоняются в течение reset_timeout секунд. Затем
+    пропускается один пробный запрос (half-open): успех замыкает цепь,
+    неудача - снова размыкает. Если исход пробы так и не записан
+    (запрос отменён или упал необработанным исключением), через
+    reset_timeout пропускается следующая проба.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # Пропускаем один пробный запрос (в HALF_OPEN - если прежняя проба зависла)
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
@@ -0,0 +1,82 @@
+from typing import Optional, Dict, Any, List
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.conditions import Predicate, compile_condition
+
+
+def build_keyboard(node: Dict) -> Optional[InlineKeyboardMarkup]:
+    """Построить inline клавиатуру для узла с кнопками"""
+    buttons = node.get('data', {}).get('buttons', [])
+    if not buttons:
+        return None
+
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=btn.get('text', 'Button'),
+            callback_data=f"btn:{node['id']}:{i}"
+        )] for i, btn in enumerate(buttons)
+    ])
+
+
+class CompiledFlow:
+    """Скомпилированный flow - индексы узлов и переходов для O(1) доступа"""
+
+    __slots__ = ('flow_data', 'flow_id', 'version', 'nodes', 'adjacency', 'branches',
+                 'start_node', 'keyboards', 'conditions')
+
+    def __init__(self, flow_data: Dict[str, Any]):
+        self.flow_data = flow_data
+        self.flow_id = flow_data.get('flow_id')
+        self.version = flow_data.get('updated_at')
+
+        flow = flow_data.get('flow', {})
+
+        # node_id -> узел (при дубликатах побеждает первый, как в линейном поиске)
+        self.nodes: Dict[str, Dict] = {}
+        for node in flow.get('nodes', []):
+            self.nodes.setdefault(node['id'], node)
+
+        # source -> [целевые узлы] в порядке рёбер
+        self.adjacency: Dict[str, List[Dict]] = {}
+        # source -> {sourceHandle: целевой узел} для ветвлений (true/false у conditionNode)
+        self.branches: Dict[str, Dict[str, Dict]] = {}
+        for edge in flow.get('edges', []):
+            target = self.nodes.get(edge['target'])
+            if target:
+                self.adjacency.setdefault(edge['source'], []).append(target)
+                if edge.get('sourceHandle'):
+                    self.branches.setdefault(edge['source'], {}).setdefault(edge['sourceHandle'], target)
+
+        # Стартовый узел (type: 'input')
+        self.start_node: Optional[Dict] = next(
+            (node for node in self.nodes.values() if node.get('type') == 'input'),
+            None
+        )
+
+        # Готовые клавиатуры для узлов с кнопками и скомпилированные условия
+        self.keyboards: Dict[str, InlineKeyboardMarkup] = {}
+        self.conditions: Dict[str, Predicate] = {}
+        for node_id, node in self.nodes.items():
+            if node.get('type') == 'buttonNode':
+                keyboard = build_keyboard(node)
+                if keyboard:
+                    self.keyboards[node_id] = keyboard
+            elif node.get('type') == 'conditionNode':
+                predicate = compile_condition(node.get('data', {}))
+                if predicate:
+                    self.conditions[node_id] = predicate
+
+    def find_node(self, node_id: str) -> Optional[Dict]:
+        """Найти узел по ID"""
+        return self.nodes.get(node_id)
+
+    def get_next_nodes(self, node_id: str) -> List[Dict]:
+        """Получить следующие узлы после текущего"""
+        return self.adjacency.get(node_id, [])
+
+    def get_branch(self, node_id: str, handle: str) -> Optional[Dict]:
+        """Получить узел, в который ведёт ветка handle"""
+        return self.branches.get(node_id, {}).get(handle)
+
+    def get_keyboard(self, node_id: str) -> Optional[InlineKeyboardMarkup]:
+        """Получить клавиатуру узла с кнопками"""
+        return self.keyboards.get(node_id)
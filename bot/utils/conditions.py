@@ -0,0 +1,223 @@
+import ast
+import logging
+import operator
+import re
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Скомпилированное условие: context -> bool
+Predicate = Callable[[Dict[str, Any]], bool]
+
+# Максимальная длина строки/списка, получаемой умножением ("x" * n)
+MAX_SEQUENCE_LENGTH = 10000
+
+
+class ConditionError(ValueError):
+    """Некорректное выражение условия"""
+
+
+def _number(value: Any) -> Any:
+    """Привести строку с числом к числу (значения из context часто строки)"""
+    if isinstance(value, str):
+        try:
+            return float(value) if '.' in value else int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(value: Any, pattern: Any) -> bool:
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    return pattern.search(str(value if value is not None else '')) is not None
+
+
+def _equals(a: Any, b: Any) -> bool:
+    # "10" == 10 считаем равными: значения из context часто строки
+    return a == b or (a is not None and b is not None and _number(a) == _number(b))
+
+
+def _contains(container: Any, item: Any) -> bool:
+    if container is None:
+        return False
+    if isinstance(container, str):
+        return str(item) in container
+    return item in container
+
+
+def _multiply(a: Any, b: Any) -> Any:
+    # Повторение строки или списка - только до MAX_SEQUENCE_LENGTH элементов
+    for sequence, times in ((a, b), (b, a)):
+        if isinstance(sequence, (str, list, tuple)) and isinstance(times, int):
+            if len(sequence) * max(times, 0) > MAX_SEQUENCE_LENGTH:
+                raise ConditionError("Sequence repetition is too long")
+    return a * b
+
+
+def _modulo(a: Any, b: Any) -> Any:
+    # Для строки % - это форматирование ('%999999999d' % 1), разрешаем только числа
+    if isinstance(a, (str, bytes)):
+        raise ConditionError("String formatting is not supported")
+    return a % b
+
+
+# Разрешённые функции
+FUNCTIONS: Dict[str, Callable] = {
+    'matches': _matches,
+    'lower': lambda value: str(value).lower() if value is not None else '',
+    'upper': lambda value: str(value).upper() if value is not None else '',
+    'len': lambda value: len(value) if value is not None else 0,
+    'number': _number,
+    'str': lambda value: '' if value is None else str(value),
+}
+
+ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _multiply,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: _modulo,
+}
+
+COMPARISONS = {
+    ast.Eq: _equals,
+    ast.NotEq: lambda a, b: not _equals(a, b),
+    ast.Lt: lambda a, b: _number(a) < _number(b),
+    ast.LtE: lambda a, b: _number(a) <= _number(b),
+    ast.Gt: lambda a, b: _number(a) > _number(b),
+    ast.GtE: lambda a, b: _number(a) >= _number(b),
+    ast.In: lambda a, b: _contains(b, a),
+    ast.NotIn: lambda a, b: not _contains(b, a),
+}
+
+# Литералы в стиле JSON
+CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+# Условия старого формата из редактора (conditionType + conditionValue)
+LEGACY_CONDITIONS = {
+    'text_equals': 'str(last_button_value) == {value}',
+    'text_contains': '{value} in str(last_button_value)',
+    'has_photo': 'has_photo == True',
+    'has_video': 'has_video == True',
+}
+
+
+def _compile_node(node: ast.AST) -> Callable[[Dict[str, Any]], Any]:
+    """Превратить узел AST в замыкание над context"""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda ctx: value
+
+    if isinstance(node, ast.Name):
+        if node.id in CONSTANTS:
+            value = CONSTANTS[node.id]
+            return lambda ctx: value
+        key = node.id
+        return lambda ctx: ctx.get(key)
+
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        items = [_compile_node(item) for item in node.elts]
+        return lambda ctx: [item(ctx) for item in items]
+
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_node(value) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda ctx: all(value(ctx) for value in values)
+        return lambda ctx: any(value(ctx) for value in values)
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand)
+        if isinstance(node.op, ast.Not):
+            return lambda ctx: not operand(ctx)
+        if isinstance(node.op, ast.USub):
+            return lambda ctx: -_number(operand(ctx))
+        if isinstance(node.op, ast.UAdd):
+            return lambda ctx: _number(operand(ctx))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+        op = ARITHMETIC[type(node.op)]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda ctx: op(_number(left(ctx)), _number(right(ctx)))
+
+    if isinstance(node, ast.Compare):
+        if not all(type(op) in COMPARISONS for op in node.ops):
+            raise ConditionError("Unsupported comparison")
+        ops = [COMPARISONS[type(op)] for op in node.ops]
+        operands = [_compile_node(node.left)] + [_compile_node(c) for c in node.comparators]
+
+        if len(ops) == 1:
+            op, left, right = ops[0], operands[0], operands[1]
+            return lambda ctx: op(left(ctx), right(ctx))
+
+        def compare_chain(ctx):
+            left = operands[0](ctx)
+            for op, operand in zip(ops, operands[1:]):
+                right = operand(ctx)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+        return compare_chain
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name = node.func.id
+        if name not in FUNCTIONS:
+            raise ConditionError(f"Unknown function: {name}")
+
+        # Регулярное выражение-литерал компилируем один раз
+        if name == 'matches' and len(node.args) == 2 and isinstance(node.args[1], ast.Constant):
+            try:
+                pattern = re.compile(str(node.args[1].value))
+            except re.error as e:
+                raise ConditionError(f"Invalid regex: {e}")
+            subject = _compile_node(node.args[0])
+            return lambda ctx: _matches(subject(ctx), pattern)
+
+        func = FUNCTIONS[name]
+        args = [_compile_node(arg) for arg in node.args]
+        return lambda ctx: func(*(arg(ctx) for arg in args))
+
+    raise ConditionError(f"Unsupported expression: {type(node).__name__}")
+
+
+def compile_expression(expression: str) -> Predicate:
+    """Скомпилировать выражение условия в предикат над context
+
+    Поддерживаются литералы, переменные context, and/or/not, сравнения,
+    in / not in, арифметика и функции matches(), lower(), upper(), len(),
+    number(), str(). Ошибка при вычислении даёт False.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ConditionError(f"Invalid expression: {e.msg}")
+
+    evaluate = _compile_node(tree.body)
+
+    def predicate(context: Dict[str, Any]) -> bool:
+        try:
+            return bool(evaluate(context))
+        except Exception:
+            return False
+
+    return predicate
+
+
+def compile_condition(node_data: Dict[str, Any]) -> Optional[Predicate]:
+    """Скомпилировать условие conditionNode (expression или conditionType/conditionValue)"""
+    expression = node_data.get('expression')
+
+    if not expression:
+        template = LEGACY_CONDITIONS.get(node_data.get('conditionType', 'text_equals'))
+        if not template:
+            return None
+        # conditionValue подставляем строковым литералом
+        expression = template.format(value=repr(str(node_data.get('conditionValue', ''))))
+
+    try:
+        return compile_expression(expression)
+    except ConditionError as e:
+        logger.warning(f"Condition {expression!r} not compiled: {e}")
+        return None
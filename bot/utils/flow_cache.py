@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class CacheEntry:
+    """Запись кэша: данные, ETag и момент истечения TTL"""
+
+    __slots__ = ('data', 'etag', 'expires_at')
+
+    def __init__(self, data: Dict[str, Any], etag: Optional[str], expires_at: float):
+        self.data = data
+        self.etag = etag
+        self.expires_at = expires_at
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class FlowCache:
+    """In-process кэш активных flow ботов и тел flow
+
+    Тела хранятся по ключу (bot_id, flow_id, updated_at) с LRU вытеснением.
+    Пока запись свежая (TTL) - отдаётся без сети, после истечения TTL
+    перепроверяется запросом с If-None-Match.
+    """
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 128):
+        self.ttl = ttl
+        self.max_size = max_size
+        # bot_id -> активный flow (тело целиком)
+        self._active: Dict[int, CacheEntry] = {}
+        # (bot_id, flow_id, updated_at) -> тело flow
+        self._flows: 'OrderedDict[Tuple[int, str, Optional[str]], CacheEntry]' = OrderedDict()
+        # (bot_id, flow_id) -> ключ последней известной версии
+        self._latest: Dict[Tuple[int, str], Tuple[int, str, Optional[str]]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    # --- Активный flow бота ---
+
+    def get_active(self, bot_id: int) -> Optional[CacheEntry]:
+        """Получить запись активного flow (в том числе просроченную - для If-None-Match)"""
+        return self._active.get(bot_id)
+
+    def set_active(self, bot_id: int, flow_data: Dict[str, Any], etag: Optional[str]):
+        self._active[bot_id] = CacheEntry(flow_data, etag, time.monotonic() + self.ttl)
+
+    def invalidate_active(self, bot_id: int):
+        self._active.pop(bot_id, None)
+
+    # --- Тела flow ---
+
+    def get_flow(self, bot_id: int, flow_id: str) -> Optional[CacheEntry]:
+        """Получить запись последней версии flow (в том числе просроченную)"""
+        key = self._latest.get((bot_id, flow_id))
+        if key is None:
+            return None
+        entry = self._flows.get(key)
+        if entry is not None:
+            self._flows.move_to_end(key)
+        return entry
+
+    def set_flow(self, bot_id: int, flow_id: str, flow_data: Dict[str, Any], etag: Optional[str]):
+        key = (bot_id, flow_id, flow_data.get('updated_at'))
+        old_key = self._latest.get((bot_id, flow_id))
+        if old_key is not None and old_key != key:
+            self._flows.pop(old_key, None)
+
+        self._flows[key] = CacheEntry(flow_data, etag, time.monotonic() + self.ttl)
+        self._flows.move_to_end(key)
+        self._latest[(bot_id, flow_id)] = key
+
+        while len(self._flows) > self.max_size:
+            evicted_key, _ = self._flows.popitem(last=False)
+            self._latest.pop(evicted_key[:2], None)
+            self.evictions += 1
+
+    def invalidate_flow(self, bot_id: int, flow_id: str):
+        key = self._latest.pop((bot_id, flow_id), None)
+        if key is not None:
+            self._flows.pop(key, None)
+
+    def touch(self, entry: CacheEntry):
+        """Продлить TTL записи после ответа 304 Not Modified"""
+        entry.expires_at = time.monotonic() + self.ttl
+        self.revalidations += 1
+
+    def clear(self):
+        self._active.clear()
+        self._flows.clear()
+        self._latest.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий/промахов кэша"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+            'active_pointers': len(self._active),
+            'flows': len(self._flows),
+        }
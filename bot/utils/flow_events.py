@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+from typing import Optional, Dict, Any
+import aiohttp
+
+from utils.flow_cache import FlowCache
+from utils.flow_executor import FlowExecutor
+
+logger = logging.getLogger(__name__)
+
+FLOW_EVENTS_CHANNEL = 'flows:events'
+
+
+class FlowEventListener:
+    """Подписка бота на изменения flows
+
+    Источник - Redis pub/sub (url 'redis://...') или SSE поток API
+    (url 'http://.../flows/events'). По событию сбрасываются записи
+    кэша, а активный flow бота сразу загружается заново. TTL кэша при
+    этом не увеличивается: pub/sub доставляет не более одного раза, и
+    событие, потерянное издателем или в сети, исправит обычная
+    перепроверка с If-None-Match (дешёвый ответ 304). При обрыве
+    подписки кэш очищается.
+    """
+
+    def __init__(self, executor: FlowExecutor, url: str, channel: str = FLOW_EVENTS_CHANNEL,
+                 reconnect_delay: float = 1.0):
+        self.executor = executor
+        self.cache: FlowCache = executor.cache
+        self.url = url
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.received = 0
+
+    async def start(self):
+        if self.url and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._set_connected(False)
+
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            logger.info(f"📡 Subscribed to flow events ({self.url})")
+        else:
+            # События за время обрыва потеряны - не ждём TTL
+            self.cache.clear()
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                if self.url.startswith(('redis://', 'rediss://')):
+                    await self._listen_redis()
+                else:
+                    await self._listen_sse()
+                delay = self.reconnect_delay
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Flow events subscription lost: {e!r}")
+            self._set_connected(False)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def _listen_redis(self):
+        import redis.asyncio as redis
+
+        client = redis.from_url(self.url, decode_responses=True)
+        try:
+            pubsub = client.pubsub()
+            await pubsub.subscribe(self.channel)
+            self._set_connected(True)
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    await self.handle(message['data'])
+        finally:
+            await client.close()
+
+    async def _listen_sse(self):
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.url, headers={'Accept': 'text/event-stream'}) as resp:
+                resp.raise_for_status()
+                self._set_connected(True)
+                async for line in resp.content:
+                    line = line.decode().strip()
+                    if line.startswith('data:'):
+                        await self.handle(line[5:].strip())
+
+    async def handle(self, payload: str):
+        """Применить событие к кэшу"""
+        try:
+            event: Dict[str, Any] = json.loads(payload)
+            bot_id = int(event['bot_id'])
+            flow_id = str(event['flow_id'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Invalid flow event: {payload!r}")
+            return
+
+        self.received += 1
+        was_cached = self.cache.get_active(bot_id) is not None
+        self.cache.invalidate_flow(bot_id, flow_id)
+        # Любое изменение может сменить активный flow бота
+        self.cache.invalidate_active(bot_id)
+
+        if was_cached:
+            # Прогреваем, чтобы следующий /start не ждал API
+            await self.executor.get_active_flow(bot_id)
@@ -1,57 +1,197 @@
+import asyncio
+import logging
+import random
+from collections import OrderedDict
 import aiohttp
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.compiled_flow import CompiledFlow, build_keyboard
+from utils.flow_cache import FlowCache
+from utils.conditions import compile_condition
+from utils.circuit_breaker import CircuitBreaker
+from utils.send_scheduler import SendScheduler
+
+logger = logging.getLogger(__name__)
+
 
 class FlowExecutor:
-    """Исполнитель flow - обрабатывает узлы и переходы"""
+    """Исполнитель flow - обрабатывает узлы и переходы
+
+    bot_id - бот по умолчанию; один исполнитель (кэш, HTTP пул) может
+    обслуживать несколько ботов, если bot_id передавать явно.
+    """
     
-    def __init__(self, api_url: str, bot_id: int):
+    def __init__(self, api_url: str, bot_id: int, cache: Optional[FlowCache] = None,
+                 pool_size: int = 100, pool_size_per_host: int = 20,
+                 keepalive_timeout: float = 30.0, request_timeout: float = 10.0,
+                 connect_timeout: float = 3.0, retries: int = 2, backoff: float = 0.2,
+                 breaker: Optional[CircuitBreaker] = None,
+                 scheduler: Optional[SendScheduler] = None):
         self.api_url = api_url
         self.bot_id = bot_id
+        self.cache = cache or FlowCache()
+        # (bot_id, flow_id) -> скомпилированный flow последней версии, LRU размером с кэш flows
+        self._compiled: 'OrderedDict[Tuple[int, str], CompiledFlow]' = OrderedDict()
+        
+        # Настройки HTTP пула к API
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # Планировщик отправки с учётом лимитов Telegram
+        self.scheduler = scheduler
     
-    async def get_active_flow(self) -> Optional[Dict[str, Any]]:
-        """Получить активный flow из API"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'{self.api_url}/flows/{self.bot_id}') as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    flows = data.get('flows', [])
-                    # Найти активный flow
-                    for flow in flows:
-                        if flow.get('is_active'):
-                            return flow
-                return None
+    async def start(self):
+        """Открыть общую HTTP сессию (вызывается при старте бота)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
     
-    async def get_flow_data(self, flow_id: str) -> Optional[Dict[str, Any]]:
-        """Получить данные flow по ID"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'{self.api_url}/flows/{self.bot_id}/{flow_id}') as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return None
+    async def close(self):
+        """Закрыть общую HTTP сессию"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
-    def find_node(self, flow_data: Dict, node_id: str) -> Optional[Dict]:
-        """Найти узел по ID"""
-        nodes = flow_data.get('flow', {}).get('nodes', [])
-        for node in nodes:
-            if node['id'] == node_id:
-                return node
+    async def _get(self, path: str, headers: Dict[str, str]) -> Optional[Tuple[int, Optional[str], Any]]:
+        """GET к API с повторами и circuit breaker
+        
+        Возвращает (status, etag, json) или None, если API недоступен.
+        """
+        if not self.breaker.allow_request():
+            return None
+        
+        try:
+            response = await self._request(path, headers)
+        except BaseException:
+            # Отмена или непредвиденная ошибка - тоже неудача, иначе
+            # пробный запрос half-open не получит исхода
+            self.breaker.record_failure()
+            raise
+        
+        if response is None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+    
+    async def _request(self, path: str, headers: Dict[str, str]) -> Optional[Tuple[int, Optional[str], Any]]:
+        """GET с повторами; None - все попытки неудачны"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._session.get(f'{self.api_url}{path}', headers=headers) as resp:
+                    if resp.status < 500:
+                        data = await resp.json() if resp.status == 200 else None
+                        return resp.status, resp.headers.get('ETag'), data
+                    logger.warning(f"API {path} returned {resp.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                # ValueError - тело ответа не JSON
+                logger.warning(f"API {path} request failed: {e!r}")
+            
+            if attempt < self.retries:
+                # Экспоненциальная задержка с jitter
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        
+        return None
+    
+    async def get_active_flow(self, bot_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Получить активный flow целиком (из кэша или одним запросом к API)"""
+        if bot_id is None:
+            bot_id = self.bot_id
+        entry = self.cache.get_active(bot_id)
+        if entry and entry.is_fresh():
+            self.cache.hits += 1
+            return entry.data
+        
+        self.cache.misses += 1
+        headers = {'If-None-Match': entry.etag} if entry and entry.etag else {}
+        response = await self._get(f'/flows/{bot_id}/active', headers)
+        
+        if response is None:
+            # API недоступен - отдаём устаревшую запись, если она есть
+            return entry.data if entry else None
+        
+        status, etag, flow_data = response
+        if status == 304 and entry:
+            self.cache.touch(entry)
+            return entry.data
+        if status == 200:
+            self.cache.set_active(bot_id, flow_data, etag)
+            # То же тело - в кэш flows, для get_flow_data по flow_id
+            self.cache.set_flow(bot_id, flow_data['flow_id'], flow_data, etag)
+            return flow_data
+        self.cache.invalidate_active(bot_id)
         return None
     
-    def get_next_nodes(self, flow_data: Dict, current_node_id: str) -> List[Dict]:
+    async def get_flow_data(self, flow_id: str, bot_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Получить данные flow по ID (из кэша или API)"""
+        if bot_id is None:
+            bot_id = self.bot_id
+        entry = self.cache.get_flow(bot_id, flow_id)
+        if entry and entry.is_fresh():
+            self.cache.hits += 1
+            return entry.data
+        
+        self.cache.misses += 1
+        headers = {'If-None-Match': entry.etag} if entry and entry.etag else {}
+        response = await self._get(f'/flows/{bot_id}/{flow_id}', headers)
+        
+        if response is None:
+            return entry.data if entry else None
+        
+        status, etag, flow_data = response
+        if status == 304 and entry:
+            self.cache.touch(entry)
+            return entry.data
+        if status == 200:
+            self.cache.set_flow(bot_id, flow_id, flow_data, etag)
+            return flow_data
+        self.cache.invalidate_flow(bot_id, flow_id)
+        return None
+    
+    async def _send(self, method, chat_id: int, *args, **kwargs):
+        """Отправить через планировщик (если он задан) или напрямую"""
+        if self.scheduler is not None:
+            return await self.scheduler.send(method, chat_id, *args, **kwargs)
+        return await method(chat_id, *args, **kwargs)
+    
+    def compile_flow(self, flow_data: Dict, bot_id: Optional[int] = None) -> CompiledFlow:
+        """Получить скомпилированный flow (компилируется один раз на версию)"""
+        if bot_id is None:
+            bot_id = self.bot_id
+        key = (bot_id, flow_data.get('flow_id'))
+        compiled = self._compiled.get(key)
+        if compiled is None or compiled.version != flow_data.get('updated_at'):
+            compiled = CompiledFlow(flow_data)
+            self._compiled[key] = compiled
+        self._compiled.move_to_end(key)
+        while len(self._compiled) > self.cache.max_size:
+            self._compiled.popitem(last=False)
+        return compiled
+    
+    def find_node(self, flow_data: Dict, node_id: str, bot_id: Optional[int] = None) -> Optional[Dict]:
+        """Найти узел по ID"""
+        return self.compile_flow(flow_data, bot_id).find_node(node_id)
+    
+    def get_next_nodes(self, flow_data: Dict, current_node_id: str, bot_id: Optional[int] = None) -> List[Dict]:
         """Получить следующие узлы после текущего"""
-        edges = flow_data.get('flow', {}).get('edges', [])
-        next_node_ids = [edge['target'] for edge in edges if edge['source'] == current_node_id]
-        
-        nodes = []
-        for node_id in next_node_ids:
-            node = self.find_node(flow_data, node_id)
-            if node:
-                nodes.append(node)
-        return nodes
+        return self.compile_flow(flow_data, bot_id).get_next_nodes(current_node_id)
     
-    async def execute_node(self, bot: Bot, user_id: int, node: Dict, context: Dict) -> Dict[str, Any]:
+    async def execute_node(self, bot: Bot, user_id: int, node: Dict, context: Dict,
+                           flow: Optional[CompiledFlow] = None) -> Dict[str, Any]:
         """Выполнить узел и вернуть результат"""
         node_type = node.get('type')
         node_data = node.get('data', {})
@@ -69,25 +209,19 @@ class FlowExecutor:
         elif node_type == 'textNode':
             # Отправка текста
             text = node_data.get('text', node_data.get('label', 'No text'))
-            await bot.send_message(user_id, text)
+            await self._send(bot.send_message, user_id, text)
             result['next_node_id'] = 'auto'
         
         elif node_type == 'buttonNode':
             # Отправка кнопок
             text = node_data.get('text', 'Choose an option:')
-            buttons = node_data.get('buttons', [])
+            keyboard = flow.get_keyboard(node['id']) if flow else build_keyboard(node)
             
-            if buttons:
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text=btn.get('text', 'Button'),
-                        callback_data=f"btn:{node['id']}:{i}"
-                    )] for i, btn in enumerate(buttons)
-                ])
-                await bot.send_message(user_id, text, reply_markup=keyboard)
+            if keyboard:
+                await self._send(bot.send_message, user_id, text, reply_markup=keyboard)
                 result['wait_for_input'] = True  # Ждём нажатия кнопки
             else:
-                await bot.send_message(user_id, text)
+                await self._send(bot.send_message, user_id, text)
                 result['next_node_id'] = 'auto'
         
         elif node_type == 'imageNode':
@@ -95,7 +229,7 @@ class FlowExecutor:
             image_url = node_data.get('imageUrl', '')
             caption = node_data.get('caption', '')
             if image_url:
-                await bot.send_photo(user_id, image_url, caption=caption)
+                await self._send(bot.send_photo, user_id, image_url, caption=caption)
             result['next_node_id'] = 'auto'
         
         elif node_type == 'videoNode':
@@ -103,18 +237,32 @@ class FlowExecutor:
             video_url = node_data.get('videoUrl', '')
             caption = node_data.get('caption', '')
             if video_url:
-                await bot.send_video(user_id, video_url, caption=caption)
+                await self._send(bot.send_video, user_id, video_url, caption=caption)
             result['next_node_id'] = 'auto'
         
         elif node_type == 'conditionNode':
-            # Условный переход
-            # TODO: реализовать логику проверки условий
-            result['next_node_id'] = 'auto'
+            # Условный переход по ветке 'true' / 'false'
+            predicate = flow.conditions.get(node['id']) if flow else compile_condition(node_data)
+            branch = 'true' if predicate and predicate(context) else 'false'
+            if flow is None or not flow.branches.get(node['id']):
+                # Без размеченных веток - первый доступный узел
+                result['next_node_id'] = 'auto'
+            else:
+                target = flow.get_branch(node['id'], branch)
+                if target:
+                    result['next_node_id'] = target['id']
+                else:
+                    # Для выбранной ветки нет ребра - flow заканчивается
+                    result['finished'] = True
         
         elif node_type == 'delayNode':
-            # Задержка
-            # TODO: реализовать отложенную отправку
-            result['next_node_id'] = 'auto'
+            # Задержка - flow продолжит планировщик таймеров
+            delay = float(node_data.get('delay') or 0)
+            if delay > 0:
+                result['delay'] = delay
+                result['wait_for_input'] = True
+            else:
+                result['next_node_id'] = 'auto'
         
         else:
             # Неизвестный тип узла
@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: меньше - раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего токена (0 - можно сейчас)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Заблокировать bucket (например, по retry_after от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and self.blocked_until <= time.monotonic()
+
+
+class SendJob:
+    """Отложенный вызов метода Bot API"""
+
+    __slots__ = ('priority', 'seq', 'chat_id', 'method', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, priority: int, seq: int, chat_id: int, method: Callable[..., Awaitable],
+                 args: tuple, kwargs: Dict[str, Any], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class SendScheduler:
+    """Планировщик исходящих сообщений с учётом лимитов Telegram
+
+    Token bucket на каждого бота (~30 msg/s) и на каждый чат бота (~1 msg/s),
+    очередь с приоритетами и повтор после 429 с учётом retry_after.
+    Один планировщик может обслуживать несколько ботов процесса.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 workers: int = 8, max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+
+        # Лимиты Telegram считаются на бота: bot_key -> bucket, (bot_key, chat_id) -> bucket
+        self._bots: Dict[int, TokenBucket] = {}
+        self._chats: Dict[Tuple[int, int], TokenBucket] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        # seq -> (таймер возврата в очередь, задание) для отложенных отправок
+        self._delayed: Dict[int, Tuple[asyncio.TimerHandle, SendJob]] = {}
+
+        self.sent = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    async def start(self):
+        """Запустить воркеры отправки"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Остановить воркеры, незавершённые отправки отменяются"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for handle, job in self._delayed.values():
+            handle.cancel()
+            job.future.cancel()
+        self._delayed.clear()
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, _, job = self._queue.get_nowait()
+                job.future.cancel()
+            self._queue = None
+
+    async def send(self, method: Callable[..., Awaitable], chat_id: int, *args,
+                   priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Any:
+        """Поставить вызов метода Bot API в очередь и дождаться результата"""
+        if not self._tasks:
+            # Планировщик не запущен - отправляем напрямую
+            return await method(chat_id, *args, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        job = SendJob(priority, next(self._seq), chat_id, method, args, kwargs, future)
+        self._queue.put_nowait((job.priority, job.seq, job))
+        return await future
+
+    @staticmethod
+    def _bot_key(method: Callable[..., Awaitable]) -> int:
+        """ID бота, которому принадлежит метод Bot API (0 - не метод бота)"""
+        return getattr(getattr(method, '__self__', None), 'id', 0)
+
+    def _bot_bucket(self, bot_key: int) -> TokenBucket:
+        bucket = self._bots.get(bot_key)
+        if bucket is None:
+            bucket = TokenBucket(self.global_rate, self.global_rate)
+            self._bots[bot_key] = bucket
+        return bucket
+
+    def _chat_bucket(self, bot_key: int, chat_id: int) -> TokenBucket:
+        key = (bot_key, chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                # Убираем bucket-ы чатов, которые давно ничего не отправляли
+                self._chats = {k: b for k, b in self._chats.items() if not b.is_idle()}
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[key] = bucket
+        return bucket
+
+    def _requeue_later(self, job: SendJob, delay: float):
+        def requeue():
+            self._delayed.pop(job.seq, None)
+            if self._queue is not None:
+                self._queue.put_nowait((job.priority, job.seq, job))
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._delayed[job.seq] = (handle, job)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Send scheduler error: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: SendJob):
+        if job.future.done():
+            # Отправитель уже не ждёт результат
+            return
+
+        bot_key = self._bot_key(job.method)
+        bot_bucket = self._bot_bucket(bot_key)
+        chat_bucket = self._chat_bucket(bot_key, job.chat_id)
+        while True:
+            chat_delay = chat_bucket.delay()
+            if chat_delay > 0:
+                # Чат упёрся в лимит - откладываем, не блокируя воркер
+                self._requeue_later(job, chat_delay)
+                return
+
+            global_delay = bot_bucket.delay()
+            if global_delay <= 0:
+                break
+            await asyncio.sleep(global_delay)
+
+        chat_bucket.consume()
+        bot_bucket.consume()
+
+        try:
+            result = await job.method(job.chat_id, *job.args, **job.kwargs)
+        except TelegramRetryAfter as e:
+            self.flood_waits += 1
+            logger.warning(f"Flood wait {e.retry_after}s for chat {job.chat_id}")
+            # Лимит упёрся в этот чат - остальные чаты бота отправляют дальше,
+            # общий темп бота и так держит bot_bucket
+            chat_bucket.pause(e.retry_after)
+
+            if job.attempts < self.max_retries:
+                job.attempts += 1
+                self.retries += 1
+                self._requeue_later(job, e.retry_after)
+            else:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            return
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        self.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def metrics(self) -> Dict[str, int]:
+        """Глубина очереди и счётчики отправки"""
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'delayed': len(self._delayed),
+            'sent': self.sent,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'failed': self.failed,
+            'bots': len(self._bots),
+            'chats': len(self._chats),
+        }
@@ -0,0 +1,151 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Optional, List, Set, Callable, Awaitable
+
+from models.timer_store import TimerStore, Timer
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """Планировщик отложенных продолжений flow
+
+    Двухуровневая схема: все таймеры лежат в TimerStore (индекс по due_at),
+    а в памяти в куче держатся только те, что сработают в ближайшие horizon
+    секунд. Поэтому миллионы ожидающих пользователей не стоят ни корутин,
+    ни памяти, а после перезапуска просроченные таймеры подхватываются
+    при первой загрузке окна.
+    """
+
+    def __init__(self, store: TimerStore, horizon: float = 60.0):
+        self.store = store
+        self.horizon = horizon
+        self._heap: List[Timer] = []
+        # Окно [.., _loaded_until] прочитано из store; новые таймеры до _window_until
+        # кладутся в кучу сразу (граница сдвигается на время чтения окна)
+        self._loaded_until = 0.0
+        self._window_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._callback: Optional[Callable[[int, int, str, str], Awaitable]] = None
+        self._task: Optional[asyncio.Task] = None
+        # Запущенные callback-и и задержанные на время переноса шардов таймеры
+        self._firing: Set[asyncio.Task] = set()
+        self._hold: Optional[Callable[[int], bool]] = None
+        self._held: List[Timer] = []
+        self.fired = 0
+
+    async def start(self, callback: Callable[[int, int, str, str], Awaitable]):
+        """Запустить цикл; callback(bot_id, user_id, flow_id, node_id) вызывается по срабатыванию"""
+        self._callback = callback
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def schedule(self, bot_id: int, user_id: int, flow_id: str, node_id: str, delay: float):
+        """Продолжить flow пользователя с узла node_id через delay секунд"""
+        due_at = time.time() + delay
+        await self.store.schedule(bot_id, user_id, flow_id, node_id, due_at)
+
+        # Таймеры в уже загруженном окне сразу кладём в кучу
+        if due_at <= self._window_until:
+            heapq.heappush(self._heap, (due_at, bot_id, user_id, flow_id, node_id))
+            self._wakeup.set()
+
+    async def restore(self, timers: List[Timer]):
+        """Принять таймеры с исходным сроком (перенос с другого шарда)"""
+        for due_at, bot_id, user_id, flow_id, node_id in timers:
+            await self.store.schedule(bot_id, user_id, flow_id, node_id, due_at)
+            if due_at <= self._window_until:
+                heapq.heappush(self._heap, (due_at, bot_id, user_id, flow_id, node_id))
+        self._wakeup.set()
+
+    async def cancel(self, bot_id: int, user_id: int):
+        await self.store.cancel(bot_id, user_id)
+
+    async def hold(self, predicate: Callable[[int], bool]):
+        """Не запускать таймеры пользователей, для которых predicate(user_id) истинно
+
+        Наступившие таймеры остаются в store и в памяти до release. Возвращает
+        управление, когда уже запущенные callback-и завершились - после этого
+        состояния задержанных пользователей не меняются.
+        """
+        self._hold = predicate
+        if self._firing:
+            await asyncio.gather(*self._firing, return_exceptions=True)
+
+    def release(self, drop: bool = False):
+        """Снять hold: задержанные таймеры сработают, а с drop=True - забываются"""
+        held, self._held, self._hold = self._held, [], None
+        if not drop:
+            for timer in held:
+                heapq.heappush(self._heap, timer)
+        self._wakeup.set()
+
+    async def _load_window(self, now: float):
+        after, until = self._loaded_until, now + self.horizon
+        # Таймеры, поставленные во время запроса, сразу идут в кучу -
+        # возможные дубликаты отсеет pop() по (bot_id, user_id, due_at)
+        self._window_until = max(self._window_until, until)
+        timers = await self.store.load_range(after, until)
+        for timer in timers:
+            heapq.heappush(self._heap, timer)
+        # Окно считается загруженным только после успешного чтения:
+        # при ошибке следующая попытка перечитает его с прежней границы
+        self._loaded_until = until
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.time()
+                if now + self.horizon / 2 >= self._loaded_until:
+                    await self._load_window(now)
+
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    timer = heapq.heappop(self._heap)
+                    if self._hold is not None and self._hold(timer[2]):
+                        self._held.append(timer)
+                    else:
+                        due.append(timer)
+
+                if due:
+                    for _, bot_id, user_id, flow_id, node_id in await self.store.pop(due):
+                        self.fired += 1
+                        task = asyncio.create_task(self._fire(bot_id, user_id, flow_id, node_id))
+                        self._firing.add(task)
+                        task.add_done_callback(self._firing.discard)
+
+                # Спим до ближайшего таймера или следующей подгрузки окна
+                next_at = self._loaded_until - self.horizon / 2
+                if self._heap:
+                    next_at = min(next_at, self._heap[0][0])
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_at - time.time()))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Timer wheel error: {e!r}")
+                await asyncio.sleep(1)
+
+    async def _fire(self, bot_id: int, user_id: int, flow_id: str, node_id: str):
+        try:
+            await self._callback(bot_id, user_id, flow_id, node_id)
+        except Exception as e:
+            logger.error(f"Delayed continuation failed for user {user_id} (bot {bot_id}): {e!r}")
+
+    def pending_in_memory(self) -> int:
+        return len(self._heap)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.store.close()
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+from typing import Optional, Dict, Any, List
+from aiogram import Bot, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Где в update лежит отправитель
+UPDATE_SENDER_KEYS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+def get_update_user_id(update: Dict[str, Any]) -> int:
+    """ID пользователя update (0, если update без отправителя)"""
+    for key in UPDATE_SENDER_KEYS:
+        payload = update.get(key)
+        if payload:
+            sender = payload.get('from') or payload.get('chat') or {}
+            return sender.get('id', 0)
+    return 0
+
+
+class WebhookApp:
+    """ASGI приложение для приёма webhook от Telegram
+
+    Update сразу кладётся в ограниченную очередь воркера и запрос получает
+    200. Воркер выбирается по user_id, поэтому update одного пользователя
+    обрабатываются строго по порядку. Если очередь воркера заполнена,
+    отвечаем 503 - Telegram повторит доставку позже (load shedding).
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, path: str = '/webhook', secret: str = '',
+                 workers: int = 8, queue_size: int = 1000):
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.secret = secret
+        self.workers = workers
+        self.queue_size = queue_size
+
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+        self.accepted = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self):
+        """Запустить воркеры обработки update"""
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def close(self, drain: bool = True):
+        """Остановить воркеры (по умолчанию дождавшись уже принятых update)"""
+        if drain:
+            await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+
+    async def drain(self):
+        """Дождаться обработки всех принятых update"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Update {update.get('update_id')} failed: {e!r}")
+            finally:
+                queue.task_done()
+
+    def enqueue(self, update: Dict[str, Any]) -> bool:
+        """Поставить update в очередь воркера пользователя; False - очередь заполнена"""
+        queue = self._queues[get_update_user_id(update) % len(self._queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.shed += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'accepted': self.accepted,
+            'shed': self.shed,
+            'processed': self.processed,
+            'failed': self.failed,
+            'queued': [queue.qsize() for queue in self._queues],
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] == 'GET' and scope['path'] == '/health':
+            await self._respond(send, 200, json.dumps(self.metrics()).encode())
+            return
+
+        if scope['method'] != 'POST' or scope['path'] != self.path:
+            await self._respond(send, 404, b'{"detail": "Not found"}')
+            return
+
+        headers = dict(scope.get('headers') or [])
+        if self.secret and headers.get(b'x-telegram-bot-api-secret-token', b'').decode() != self.secret:
+            await self._respond(send, 403, b'{"detail": "Forbidden"}')
+            return
+
+        body = await self._read_body(receive)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            await self._respond(send, 400, b'{"detail": "Invalid JSON"}')
+            return
+
+        if not self._queues:
+            await self._respond(send, 503, b'{"detail": "Not started"}')
+            return
+
+        if self.enqueue(update):
+            await self._respond(send, 200, b'{"ok": true}')
+        else:
+            await self._respond(send, 503, b'{"detail": "Overloaded"}', [(b'retry-after', b'1')])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, extra_headers: Optional[list] = None):
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers + (extra_headers or [])})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+# API запускается из каталога api/ с плоскими импортами (storage, events, flows)
+API_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'api')
+sys.path.insert(0, os.path.abspath(API_DIR))
+
+from storage import create_storage  # noqa: E402
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """redis.asyncio.from_url -> общий fakeredis сервер в памяти"""
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.asyncio, 'from_url',
+        lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs),
+    )
+    return server
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+async def storage(request, tmp_path):
+    """Каждое хранилище flows: контракт у всех одинаковый"""
+    if request.param == 'redis':
+        request.getfixturevalue('fake_redis')
+        url = 'redis://flows'
+    elif request.param == 'sqlite':
+        url = f'sqlite:///{tmp_path / "flows.db"}'
+    else:
+        url = 'memory://'
+    store = create_storage(url)
+    yield store
+    await store.close()
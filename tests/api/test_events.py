@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+from events import FlowEventBus, FLOW_SAVED, FLOW_DELETED
+
+
+async def next_event(queue):
+    return json.loads(await asyncio.wait_for(queue.get(), 1))
+
+
+async def test_without_redis_events_go_to_local_subscribers():
+    bus = FlowEventBus()
+    await bus.start()
+    async with bus.subscribe() as queue:
+        bus.publish(FLOW_SAVED, 1, 'f1', '2024-01-01')
+        assert (await next_event(queue))['event'] == FLOW_SAVED
+    await bus.close()
+
+
+async def test_events_are_relayed_through_redis(fake_redis):
+    bus = FlowEventBus('redis://events')
+    await bus.start()
+    try:
+        async with bus.subscribe() as queue:
+            # Подписка relay на канал устанавливается в фоне
+            for _ in range(100):
+                if await bus._redis.pubsub_numsub(bus.channel) == [(bus.channel, 1)]:
+                    break
+                await asyncio.sleep(0.01)
+            bus.publish(FLOW_SAVED, 1, 'f1')
+            bus.publish(FLOW_DELETED, 1, 'f1')
+            assert [(await next_event(queue))['event'] for _ in range(2)] == [FLOW_SAVED, FLOW_DELETED]
+        assert bus.published == 2
+    finally:
+        await bus.close()
+
+
+async def test_publish_client_has_socket_timeouts(fake_redis, monkeypatch):
+    import redis.asyncio
+
+    clients = []
+    from_url = redis.asyncio.from_url
+    monkeypatch.setattr(
+        redis.asyncio, 'from_url', lambda url, **kwargs: clients.append(kwargs) or from_url(url, **kwargs),
+    )
+
+    bus = FlowEventBus('redis://events', publish_timeout=0.5)
+    await bus.start()
+    await bus.close()
+
+    publisher, subscriber = clients
+    assert (publisher['socket_timeout'], publisher['socket_connect_timeout']) == (0.5, 0.5)
+    # Соединение подписки простаивает между событиями - без таймаута чтения
+    assert 'socket_timeout' not in subscriber
+    assert subscriber['socket_connect_timeout'] == 0.5
+
+
+async def test_hanging_redis_does_not_block_publish(fake_redis, monkeypatch):
+    bus = FlowEventBus('redis://events', outbox_size=3)
+    await bus.start()
+    hang = asyncio.Event()
+
+    async def stuck_publish(channel, payload):
+        await hang.wait()
+
+    monkeypatch.setattr(bus._redis, 'publish', stuck_publish)
+    async with bus.subscribe() as queue:
+        # Первое событие ушло в задачу публикации, три ждут в очереди, остальные теряются
+        for i in range(6):
+            bus.publish(FLOW_SAVED, 1, f'f{i}')
+            await asyncio.sleep(0)
+        assert bus.dropped == 2
+        assert queue.empty()
+
+    await bus.close(timeout=0.05)
+    assert bus._publish_task is None
+
+
+async def test_redis_error_falls_back_to_local_subscribers(fake_redis, monkeypatch):
+    bus = FlowEventBus('redis://events')
+    await bus.start()
+
+    async def broken_publish(channel, payload):
+        raise ConnectionError('redis is down')
+
+    monkeypatch.setattr(bus._redis, 'publish', broken_publish)
+    try:
+        async with bus.subscribe() as queue:
+            bus.publish(FLOW_SAVED, 1, 'f1')
+            assert (await next_event(queue))['flow_id'] == 'f1'
+        assert bus.published == 0
+    finally:
+        await bus.close()
@@ -0,0 +1,197 @@
+import asyncio
+import random
+import time
+
+import pytest
+import sqlalchemy
+from sqlalchemy.exc import IntegrityError
+
+from storage import FlowStorage, MemoryFlowStorage, SQLFlowStorage
+
+FLOW = {'nodes': [], 'edges': []}
+
+
+async def active_id(storage, bot_id=1):
+    active = await storage.get_active(bot_id)
+    return active['flow_id'] if active else None
+
+
+async def test_first_saved_flow_becomes_active(storage):
+    first = await storage.save(1, 'a', FLOW, 'A')
+    second = await storage.save(1, 'b', FLOW, 'B')
+
+    assert first['is_active'] and not second['is_active']
+    assert await active_id(storage) == 'a'
+    assert {flow['flow_id']: flow['is_active'] for flow in await storage.list(1)} == {'a': True, 'b': False}
+
+
+async def test_deleting_active_flow_does_not_activate_another(storage):
+    await storage.save(1, 'a', FLOW, 'A')
+    await storage.save(1, 'b', FLOW, 'B')
+
+    assert await storage.delete(1, 'a')
+    assert await active_id(storage) is None
+    assert not (await storage.get(1, 'b'))['is_active']
+
+
+async def test_next_save_after_deleting_active_becomes_active(storage):
+    await storage.save(1, 'a', FLOW, 'A')
+    await storage.save(1, 'b', FLOW, 'B')
+    await storage.delete(1, 'a')
+
+    # Пересохранение существующего flow тоже занимает пустое место
+    record = await storage.save(1, 'b', FLOW, 'B2')
+    assert record['is_active']
+    assert await active_id(storage) == 'b'
+
+    assert not (await storage.save(1, 'c', FLOW, 'C'))['is_active']
+    assert await active_id(storage) == 'b'
+
+
+async def test_activate_switches_the_single_active_flow(storage):
+    await storage.save(1, 'a', FLOW, 'A')
+    await storage.save(1, 'b', FLOW, 'B')
+
+    assert await storage.activate(1, 'b')
+    assert await active_id(storage) == 'b'
+    assert [flow['flow_id'] for flow in await storage.list(1) if flow['is_active']] == ['b']
+    assert not await storage.activate(1, 'missing')
+    assert await active_id(storage) == 'b'
+
+
+async def test_resaving_active_flow_keeps_it_active_and_created_at(storage):
+    first = await storage.save(1, 'a', FLOW, 'A')
+    await asyncio.sleep(0.001)
+    second = await storage.save(1, 'a', {'nodes': [{'id': 'n'}], 'edges': []}, 'A2')
+
+    assert second['is_active']
+    assert second['created_at'] == first['created_at']
+    assert second['updated_at'] != first['updated_at']
+    assert (await storage.get_active(1))['flow'] == {'nodes': [{'id': 'n'}], 'edges': []}
+
+
+async def test_bots_are_isolated(storage):
+    await storage.save(1, 'a', FLOW, 'A')
+    await storage.save(2, 'b', FLOW, 'B')
+
+    assert await active_id(storage, 1) == 'a'
+    assert await active_id(storage, 2) == 'b'
+    assert not await storage.delete(2, 'a')
+    assert not await storage.activate(1, 'b')
+
+
+def test_backend_must_implement_every_method():
+    class Partial(FlowStorage):
+        async def save(self, bot_id, flow_id, flow, name):
+            return {}
+
+    with pytest.raises(TypeError, match='abstract'):
+        Partial()
+    with pytest.raises(TypeError):
+        FlowStorage()
+    assert isinstance(MemoryFlowStorage(), FlowStorage)
+
+
+async def test_concurrent_delete_and_activate_never_leave_dangling_pointer(storage, monkeypatch):
+    redis = getattr(storage, 'redis', None)
+    if redis is not None:
+        # Сетевые задержки перемешивают команды параллельных запросов - fakeredis отвечает сразу
+        execute_command = redis.execute_command
+        rng = random.Random(0)
+
+        async def yielding_execute_command(*args, **kwargs):
+            await asyncio.sleep(rng.random() / 1000)
+            return await execute_command(*args, **kwargs)
+
+        monkeypatch.setattr(redis, 'execute_command', yielding_execute_command)
+
+    for round_ in range(50):
+        await storage.save(1, 'keep', FLOW, 'Keep')
+        await storage.save(1, 'gone', FLOW, 'Gone')
+        await asyncio.gather(storage.activate(1, 'gone'), storage.delete(1, 'gone'), storage.activate(1, 'gone'))
+
+        assert await storage.get(1, 'gone') is None
+        active = await active_id(storage)
+        assert active in (None, 'keep'), round_
+        if active is None:
+            # Указатель на удалённый flow не даёт следующему сохранению стать активным
+            assert (await storage.save(1, 'keep', FLOW, 'Keep'))['is_active'], round_
+        await storage.activate(1, 'keep')
+
+
+@pytest.fixture
+def sql_storage(tmp_path):
+    store = SQLFlowStorage(f'sqlite:///{tmp_path / "flows.db"}')
+    yield store
+    store.engine.dispose()
+
+
+def active_rows(store, bot_id=1):
+    t = store.flows
+    with store.engine.connect() as conn:
+        return conn.execute(
+            sqlalchemy.select(t.c.flow_id).where(t.c.bot_id == bot_id, t.c.is_active.is_(True))
+        ).scalars().all()
+
+
+async def test_sql_concurrent_saves_and_activates_keep_one_active_flow(sql_storage):
+    # Запросы идут в пуле потоков: задержка перед каждым SQL перемешивает транзакции
+    rng = random.Random(0)
+
+    @sqlalchemy.event.listens_for(sql_storage.engine, 'before_cursor_execute')
+    def jitter(*args):
+        time.sleep(rng.random() / 1000)
+
+    for round_ in range(20):
+        bot_id = 100 + round_
+        # Первые сохранения бота наперегонки: активным становится ровно один
+        saved = await asyncio.gather(*(sql_storage.save(bot_id, f'f{i}', FLOW, 'F') for i in range(5)))
+        assert [record['is_active'] for record in saved].count(True) == 1, round_
+
+        results = await asyncio.gather(
+            *(sql_storage.activate(bot_id, f'f{i}') for i in range(5)),
+            *(sql_storage.save(bot_id, f'f{i}', FLOW, 'F2') for i in range(5)),
+            sql_storage.activate(bot_id, 'missing'),
+        )
+        assert results[:5] == [True] * 5 and results[-1] is False
+        assert len(active_rows(sql_storage, bot_id)) == 1, round_
+        assert (await sql_storage.get_active(bot_id))['name'] == 'F2'
+
+
+def test_sql_index_rejects_second_active_flow(sql_storage):
+    t = sql_storage.flows
+    row = {'bot_id': 1, 'name': 'F', 'flow': '{}', 'is_active': True, 'created_at': '', 'updated_at': ''}
+    with sql_storage.engine.begin() as conn:
+        conn.execute(t.insert().values(flow_id='a', **row))
+    with pytest.raises(IntegrityError):
+        with sql_storage.engine.begin() as conn:
+            conn.execute(t.insert().values(flow_id='b', **row))
+    with sql_storage.engine.begin() as conn:
+        conn.execute(t.insert().values(flow_id='b', **{**row, 'bot_id': 2}))
+
+
+def test_sql_existing_table_keeps_latest_active_flow(tmp_path):
+    url = f'sqlite:///{tmp_path / "flows.db"}'
+    engine = sqlalchemy.create_engine(url)
+    with engine.begin() as conn:
+        # Таблица прежней версии: без уникального индекса и с двумя активными flows
+        conn.exec_driver_sql(
+            'CREATE TABLE flows (bot_id INTEGER, flow_id VARCHAR(36), name VARCHAR(200) NOT NULL, '
+            'flow TEXT NOT NULL, is_active BOOLEAN NOT NULL, created_at VARCHAR(32) NOT NULL, '
+            'updated_at VARCHAR(32) NOT NULL, PRIMARY KEY (bot_id, flow_id))'
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO flows VALUES (1, 'old', 'F', '{}', 1, '1', '1'), (1, 'new', 'F', '{}', 1, '1', '2'), "
+            "(2, 'only', 'F', '{}', 1, '1', '1')"
+        )
+    engine.dispose()
+
+    store = SQLFlowStorage(url)
+    try:
+        assert active_rows(store, 1) == ['new']
+        assert active_rows(store, 2) == ['only']
+        assert store.active_index.name in {
+            index['name'] for index in sqlalchemy.inspect(store.engine).get_indexes('flows')
+        }
+    finally:
+        store.engine.dispose()
@@ -0,0 +1,102 @@
+import contextlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Настройки backend читаются из окружения при импорте app
+_TMP = tempfile.mkdtemp(prefix='backend-tests-')
+os.environ.setdefault('DB_NAME', os.path.join(_TMP, 'test.db'))
+os.environ.setdefault('DEBUG', 'false')
+os.environ.setdefault('LOG_DIR', os.path.join(_TMP, 'logs'))
+os.environ.setdefault('FLOW_EVENTS_ENABLED', 'false')
+os.environ.setdefault('PASSWORD_BCRYPT_ROUNDS', '4')
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'backend')
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+# Порядок импорта как у uvicorn: app.core раньше app.models
+import app.main  # noqa: E402,F401
+
+
+@pytest.fixture(autouse=True)
+async def database():
+    """Чистые таблицы на каждый тест"""
+    from app.core.database import Base, engine, async_engine
+    from app.core.security import token_cache, principal_cache
+    import app.models  # noqa: F401 - регистрация моделей
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # id пользователей повторяются между тестами
+    token_cache.clear()
+    principal_cache.clear()
+    yield
+    # Соединения aiosqlite привязаны к event loop теста
+    await async_engine.dispose()
+
+
+@pytest.fixture
+async def db():
+    from app.core.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def register(client, username='alice'):
+    response = client.post('/api/v1/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'secret123'
+    })
+    assert response.status_code == 201, response.text
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    return register(client)
+
+
+@pytest.fixture
+def count_queries():
+    """with count_queries() as statements: - SQL запросы обработчиков за блок"""
+    from sqlalchemy import event
+    from app.core.database import async_engine
+
+    @contextlib.contextmanager
+    def counter():
+        statements = []
+
+        def on_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, 'before_cursor_execute', on_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(async_engine.sync_engine, 'before_cursor_execute', on_execute)
+
+    return counter
+
+
+@pytest.fixture
+def register_user(client):
+    """Зарегистрировать ещё одного пользователя: register_user('bob') -> заголовки"""
+    return lambda username: register(client, username)
+
+
+@pytest.fixture
+def bot_id(client, auth_headers):
+    response = client.post('/api/v1/bots', json={'name': 'bot', 'token': '123:abc'}, headers=auth_headers)
+    assert response.status_code in (200, 201), response.text
+    return response.json()['id']
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from app.core import auth_cache
+from app.core.auth_cache import TTLCache
+from app.core.security import create_access_token, decode_token, invalidate_user, principal_cache, token_cache
+from app.models.bot import Bot
+from app.models.user import User
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое time.monotonic кэша: clock[0] += секунды"""
+    now = [1000.0]
+    monkeypatch.setattr(auth_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(ttl=10)
+    cache.set('a', 1)
+    clock[0] += 9.9
+    assert cache.get('a') == 1
+    clock[0] += 0.1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_is_clamped_to_default(clock):
+    cache = TTLCache(ttl=10)
+    cache.set('long', 1, ttl=3600)
+    cache.set('short', 2, ttl=5)
+    # Уже истёкший JWT в кэш не попадает
+    cache.set('expired', 3, ttl=-1)
+    assert 'expired' not in cache._data
+
+    clock[0] += 5
+    assert cache.get('short') is None
+    assert cache.get('long') == 1
+    clock[0] += 5
+    assert cache.get('long') is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+    cache.pop('a')
+    cache.pop('missing')
+    assert cache.get('a') is None
+
+
+def test_decoded_token_is_cached_until_exp():
+    token = create_access_token({'sub': '1'}, expires_delta=timedelta(seconds=30))
+    payload = decode_token(token)
+    assert token_cache.get(token) is payload
+    assert decode_token(token) is payload
+    # Срок токена меньше AUTH_CACHE_TTL - запись живёт не дольше токена
+    assert token_cache._data[token][0] - auth_cache.time.monotonic() <= 30
+
+
+def test_expired_or_forged_token_is_rejected():
+    expired = create_access_token({'sub': '1'}, expires_delta=timedelta(seconds=-1))
+    forged = create_access_token({'sub': '1'})[:-2] + 'xx'
+    for token in (expired, forged):
+        with pytest.raises(HTTPException) as error:
+            decode_token(token)
+        assert error.value.status_code == 401
+        assert token_cache.get(token) is None
+
+
+async def test_cached_principal_skips_user_queries(client, auth_headers, count_queries):
+    assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 200
+    with count_queries() as statements:
+        assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 200
+    assert statements == []
+    assert principal_cache.hits >= 1
+
+
+async def test_created_bot_is_in_cached_principal(client, auth_headers, bot_id, count_queries):
+    # Создание бота сбрасывает кэш, следующий запрос загружает его заново
+    assert principal_cache.get(1) is None
+    assert client.get('/api/v1/flows', params={'bot_id': bot_id}, headers=auth_headers).status_code == 200
+    assert bot_id in principal_cache.get(1)['bot_ids']
+
+    # Владение проверяется по кэшу: остаётся один запрос - список flows
+    with count_queries() as statements:
+        assert client.get('/api/v1/flows', params={'bot_id': bot_id}, headers=auth_headers).status_code == 200
+    assert len(statements) == 1
+
+
+async def test_deleted_bot_is_dropped_from_principal(client, auth_headers, bot_id):
+    assert client.get('/api/v1/flows', params={'bot_id': bot_id}, headers=auth_headers).status_code == 200
+    assert client.delete(f'/api/v1/bots/{bot_id}', headers=auth_headers).status_code == 204
+
+    assert client.get('/api/v1/flows', params={'bot_id': bot_id}, headers=auth_headers).status_code == 404
+    assert bot_id not in principal_cache.get(1)['bot_ids']
+
+
+async def test_bot_created_elsewhere_is_found_in_database(client, auth_headers, db):
+    assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 200
+    # Бот создан в другом воркере: кэш этого процесса о нём не знает
+    bot = Bot(user_id=1, name='elsewhere', token='777:abc')
+    db.add(bot)
+    await db.commit()
+    assert bot.id not in principal_cache.get(1)['bot_ids']
+
+    assert client.get('/api/v1/flows', params={'bot_id': bot.id}, headers=auth_headers).status_code == 200
+    assert principal_cache.get(1) is None
+    assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 200
+    assert bot.id in principal_cache.get(1)['bot_ids']
+
+
+async def test_deactivated_user_is_rejected_after_invalidation(client, auth_headers, db):
+    assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 200
+    await db.execute(update(User).where(User.id == 1).values(is_active=False))
+    await db.commit()
+    invalidate_user(1)
+
+    assert client.post('/api/v1/auth/logout', headers=auth_headers).status_code == 403
@@ -0,0 +1,190 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models import User, Bot, BotUser, Broadcast
+from app.services.broadcast import TelegramSender, SENT, BLOCKED
+from app.tasks import broadcast as tasks
+
+
+@pytest.fixture
+async def audience(db):
+    """Бот с 5 получателями и рассылка в статусе running"""
+    user = User(username='owner', email='owner@example.com', password_hash='x')
+    db.add(user)
+    await db.flush()
+    bot = Bot(user_id=user.id, name='bot', token='1:t')
+    db.add(bot)
+    await db.flush()
+    db.add_all([BotUser(bot_id=bot.id, telegram_user_id=100 + i) for i in range(5)])
+    broadcast = Broadcast(bot_id=bot.id, text='hi', status='running')
+    db.add(broadcast)
+    await db.commit()
+    return broadcast.id
+
+
+class FakeSender:
+    """TelegramSender без сети: 103 заблокировал бота"""
+
+    sent = []
+
+    def __init__(self, token, rate, concurrency):
+        pass
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        FakeSender.sent.append(chat_id)
+        return BLOCKED if chat_id == 103 else SENT
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_sender(monkeypatch):
+    FakeSender.sent = []
+    monkeypatch.setattr(tasks, 'TelegramSender', FakeSender)
+    monkeypatch.setattr(tasks.settings, 'BROADCAST_BATCH_SIZE', 2)
+    return FakeSender
+
+
+async def test_only_one_worker_claims(db, audience, monkeypatch):
+    monkeypatch.setattr(tasks, 'WORKER_ID', 'worker-a')
+    assert await tasks.claim_broadcast(db, audience)
+
+    monkeypatch.setattr(tasks, 'WORKER_ID', 'worker-b')
+    assert not await tasks.claim_broadcast(db, audience)
+
+    # Воркер a перестал обновлять heartbeat
+    broadcast = await db.get(Broadcast, audience)
+    broadcast.heartbeat_at = datetime.utcnow() - timedelta(seconds=tasks.settings.BROADCAST_HEARTBEAT_TIMEOUT + 1)
+    await db.commit()
+    assert await tasks.claim_broadcast(db, audience)
+    await db.refresh(broadcast)
+    assert broadcast.owner == 'worker-b'
+
+
+async def test_concurrent_claims_have_one_winner(audience, monkeypatch):
+    async def claim_as(worker_id):
+        async with AsyncSessionLocal() as session:
+            # WORKER_ID читается до первого await внутри claim_broadcast
+            monkeypatch.setattr(tasks, 'WORKER_ID', worker_id)
+            return await tasks.claim_broadcast(session, audience)
+
+    claims = await asyncio.gather(*(claim_as(f'worker-{i}') for i in range(5)))
+    assert claims.count(True) == 1
+
+
+async def test_run_broadcast_checkpoints_and_releases(db, audience, fake_sender):
+    await tasks.run_broadcast(audience)
+
+    broadcast = await db.get(Broadcast, audience)
+    await db.refresh(broadcast)
+    assert broadcast.status == 'completed'
+    assert (broadcast.sent_count, broadcast.blocked_count, broadcast.failed_count) == (4, 1, 0)
+    assert broadcast.owner is None
+    assert fake_sender.sent == [100, 101, 102, 103, 104]
+    blocked = (await db.scalars(select(BotUser.telegram_user_id).where(BotUser.is_blocked == True))).all()  # noqa: E712
+    assert blocked == [103]
+
+
+async def test_run_broadcast_skips_job_owned_by_live_worker(db, audience, fake_sender):
+    broadcast = await db.get(Broadcast, audience)
+    broadcast.owner = 'other-worker'
+    broadcast.heartbeat_at = datetime.utcnow()
+    await db.commit()
+
+    await tasks.run_broadcast(audience)
+
+    assert fake_sender.sent == []
+    await db.refresh(broadcast)
+    assert broadcast.owner == 'other-worker'
+
+
+async def test_resume_continues_from_checkpoint(db, audience, fake_sender):
+    broadcast = await db.get(Broadcast, audience)
+    broadcast.last_bot_user_id = (await db.scalars(select(BotUser.id).order_by(BotUser.id))).all()[2]
+    await db.commit()
+
+    await tasks.resume_broadcasts()
+    await asyncio.gather(*tasks.running_broadcasts.values())
+
+    assert fake_sender.sent == [103, 104]
+
+
+async def test_sweeper_reclaims_job_after_heartbeat_expires(db, audience, fake_sender, monkeypatch):
+    # Воркер перезапустился сразу после падения: heartbeat прежнего процесса ещё свежий
+    monkeypatch.setattr(tasks.settings, 'BROADCAST_HEARTBEAT_TIMEOUT', 0.2)
+    monkeypatch.setattr(tasks.settings, 'BROADCAST_SWEEP_INTERVAL', 0.05)
+    broadcast = await db.get(Broadcast, audience)
+    broadcast.owner = 'crashed-worker'
+    broadcast.heartbeat_at = datetime.utcnow()
+    await db.commit()
+
+    assert await tasks.resume_broadcasts() == []
+    tasks.start_sweeper()
+    try:
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            await db.refresh(broadcast)
+            if broadcast.status == 'completed':
+                break
+    finally:
+        await tasks.stop_sweeper()
+        await asyncio.gather(*tasks.running_broadcasts.values())
+
+    assert broadcast.status == 'completed'
+    assert fake_sender.sent == [100, 101, 102, 103, 104]
+
+
+async def test_cancel_after_last_batch_is_not_overwritten(db, audience, fake_sender, monkeypatch):
+    fetch = tasks.fetch_recipient_batch
+
+    async def cancel_before_end(session, bot_id, after_id, limit):
+        batch = await fetch(session, bot_id, after_id, limit)
+        if not batch:
+            # Отмена через API приходит, когда отправлять уже некому
+            async with AsyncSessionLocal() as other:
+                cancelled = await other.get(Broadcast, audience)
+                cancelled.status = 'cancelled'
+                await other.commit()
+        return batch
+
+    monkeypatch.setattr(tasks, 'fetch_recipient_batch', cancel_before_end)
+    await tasks.run_broadcast(audience)
+
+    broadcast = await db.get(Broadcast, audience)
+    await db.refresh(broadcast)
+    assert broadcast.status == 'cancelled'
+    assert broadcast.finished_at is None
+    assert broadcast.owner is None
+
+
+def mock_sender(responses):
+    sender = TelegramSender('1:t', rate=1000)
+    replies = iter(responses)
+    sender._client = httpx.AsyncClient(
+        base_url='https://api.telegram.invalid', transport=httpx.MockTransport(lambda request: next(replies))
+    )
+    return sender
+
+
+async def test_429_with_non_json_body_is_retried():
+    sender = mock_sender([
+        httpx.Response(429, text='<html>Too Many Requests</html>', headers={'Retry-After': '0'}),
+        httpx.Response(200, json={'ok': True}),
+    ])
+    try:
+        assert await sender.send_message(1, 'hi') == SENT
+    finally:
+        await sender.close()
+
+
+def test_retry_after_parsing():
+    assert TelegramSender._retry_after(httpx.Response(429, json={'parameters': {'retry_after': 7}})) == 7
+    assert TelegramSender._retry_after(httpx.Response(429, text='oops', headers={'Retry-After': '3'})) == 3
+    assert TelegramSender._retry_after(httpx.Response(429, text='oops')) == 1
+    assert TelegramSender._retry_after(httpx.Response(429, json=['unexpected'])) == 1
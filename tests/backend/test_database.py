@@ -0,0 +1,19 @@
+from sqlalchemy import event
+
+from app.core.database import async_engine
+
+
+def test_requests_reuse_pooled_connections(client, auth_headers):
+    connects = []
+
+    def on_connect(dbapi_connection, connection_record):
+        connects.append(dbapi_connection)
+
+    event.listen(async_engine.sync_engine, 'connect', on_connect)
+    try:
+        for _ in range(5):
+            assert client.get('/api/v1/bots', headers=auth_headers).status_code == 200
+    finally:
+        event.remove(async_engine.sync_engine, 'connect', on_connect)
+    # Без пула каждый запрос открывал бы новое соединение aiosqlite со своим потоком
+    assert len(connects) <= 1
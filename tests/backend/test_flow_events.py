@@ -0,0 +1,90 @@
+import asyncio
+import json
+import time
+
+import fakeredis
+import pytest
+
+from app.services import flow_events
+from app.services.flow_events import FlowEventPublisher, FLOW_SAVED
+
+
+class SlowRedis:
+    """Redis, отвечающий на PUBLISH с задержкой"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.messages = []
+
+    async def publish(self, channel, payload):
+        await asyncio.sleep(self.delay)
+        self.messages.append((channel, payload))
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, 'from_url',
+                        lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs))
+    publisher = FlowEventPublisher('redis://events', 'flows:events')
+    monkeypatch.setattr(flow_events, 'publisher', publisher)
+    monkeypatch.setattr(flow_events.settings, 'FLOW_EVENTS_ENABLED', True)
+    return publisher
+
+
+async def test_events_reach_subscribers_in_order(publisher):
+    await publisher.start()
+    pubsub = publisher._redis.pubsub()
+    await pubsub.subscribe('flows:events')
+    await pubsub.get_message(timeout=1)
+
+    for flow_id in range(5):
+        flow_events.publish_flow_event(FLOW_SAVED, 1, flow_id)
+    await publisher.close()
+
+    received = []
+    while len(received) < 5:
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+        assert message is not None
+        received.append(json.loads(message['data'])['flow_id'])
+    assert received == ['0', '1', '2', '3', '4']
+    assert publisher.published == 5
+
+
+async def test_slow_redis_does_not_delay_the_caller(publisher):
+    await publisher.start()
+    await publisher._redis.close()
+    slow = publisher._redis = SlowRedis(delay=0.2)
+
+    start = time.perf_counter()
+    for flow_id in range(10):
+        flow_events.publish_flow_event(FLOW_SAVED, 1, flow_id)
+    assert time.perf_counter() - start < 0.05
+
+    await publisher.close(timeout=5)
+    assert [json.loads(payload)['flow_id'] for _, payload in slow.messages] == [str(i) for i in range(10)]
+
+
+async def test_full_queue_drops_instead_of_blocking(publisher):
+    publisher.queue_size = 2
+    await publisher.start()
+    await publisher._redis.close()
+    publisher._redis = SlowRedis(delay=10)
+
+    for flow_id in range(10):
+        flow_events.publish_flow_event(FLOW_SAVED, 1, flow_id)
+    # Одно событие уже взято задачей, два ждут в очереди
+    await asyncio.sleep(0)
+    assert publisher.dropped >= 7
+    await publisher.close(timeout=0.01)
+
+
+def test_disabled_events_are_not_queued(publisher, monkeypatch):
+    monkeypatch.setattr(flow_events.settings, 'FLOW_EVENTS_ENABLED', False)
+    flow_events.publish_flow_event(FLOW_SAVED, 1, 1)
+    assert publisher._queue is None
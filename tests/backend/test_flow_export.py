@@ -0,0 +1,125 @@
+import asyncio
+import gzip
+import json
+import tracemalloc
+
+import httpx
+import pytest
+
+from app.core.security import create_access_token
+from app.main import app
+from app.models import User, Bot
+from app.services.flow_import import bulk_import_flow
+
+
+# Пик памяти экспорта flow из 10k блоков (~4 МБ JSON)
+MEMORY_CEILING = 2 * 1024 * 1024
+
+
+async def make_flow(db, blocks_count, user_id=None):
+    if user_id is None:
+        user = User(username='alice', email='alice@example.com', password_hash='x')
+        db.add(user)
+        await db.flush()
+        bot = Bot(user_id=user.id, name='bot', token='123:abc')
+        db.add(bot)
+        await db.commit()
+        user_id, bot_id = user.id, bot.id
+    else:
+        bot_id = await db.scalar(Bot.__table__.select().with_only_columns(Bot.id).where(Bot.user_id == user_id))
+    blocks = [{'title': f'B{i}', 'type': 'text', 'content': {'text': 'x' * 200, 'i': i}} for i in range(blocks_count)]
+    connections = [(i, i + 1, None) for i in range(blocks_count - 1)]
+    flow = await db.run_sync(bulk_import_flow, {'bot_id': bot_id, 'name': 'Big'}, blocks, connections)
+    return user_id, flow.id
+
+
+async def stream_export(flow_id, user_id, query=''):
+    """Вызвать ASGI приложение напрямую: TestClient и httpx собирают тело ответа в память
+
+    Чанки тела только считаются и сразу отбрасываются.
+    """
+    token = create_access_token({'sub': str(user_id)})
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': f'/api/v1/flows/{flow_id}/export', 'raw_path': b'',
+        'query_string': query.encode(), 'root_path': '', 'server': ('test', 80), 'client': ('test', 1),
+        'headers': [(b'authorization', f'Bearer {token}'.encode()), (b'host', b'test')],
+    }
+    result = {'status': None, 'size': 0, 'chunks': 0}
+    requested = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # StreamingResponse ждёт отключения клиента параллельно с выдачей
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            result['status'] = message['status']
+        elif message['type'] == 'http.response.body' and message.get('body'):
+            result['size'] += len(message['body'])
+            result['chunks'] += 1
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return result
+
+
+async def peak_memory(flow_id, user_id, query=''):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = await stream_export(flow_id, user_id, query)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    assert result['status'] == 200
+    return peak, result
+
+
+@pytest.mark.parametrize('query', ['', 'compress=gzip'])
+async def test_export_memory_does_not_grow_with_flow_size(db, query):
+    user_id, small = await make_flow(db, 1000)
+    _, large = await make_flow(db, 10000, user_id)
+
+    # Первый вызов прогревает кэши запросов SQLAlchemy и импорты
+    await stream_export(small, user_id, query)
+    small_peak, small_result = await peak_memory(small, user_id, query)
+    large_peak, large_result = await peak_memory(large, user_id, query)
+
+    # Тело в 10 раз больше, а пик памяти - нет: выдача идёт пачками курсора
+    assert large_result['size'] > 8 * small_result['size']
+    assert large_peak < 1.5 * small_peak + 256 * 1024, (small_peak, large_peak)
+    assert large_peak < MEMORY_CEILING, large_peak
+    if not query:
+        # По чанку на строку; несжатый экспорт (~4 МБ) больше потолка
+        assert large_result['chunks'] > 10000
+        assert large_result['size'] > 1.5 * MEMORY_CEILING
+
+
+async def test_exported_json_is_complete(db):
+    user_id, flow_id = await make_flow(db, 1200)
+    token = create_access_token({'sub': str(user_id)})
+    body = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        for query in ('', '?compress=gzip'):
+            response = await client.get(f'/api/v1/flows/{flow_id}/export{query}',
+                                        headers={'Authorization': f'Bearer {token}'})
+            content = gzip.decompress(response.content) if query else response.content
+            body.append(json.loads(content))
+
+    plain, unzipped = body
+    assert plain == unzipped
+    assert [block['title'] for block in plain['blocks']] == [f'B{i}' for i in range(1200)]
+    ids = [block['id'] for block in plain['blocks']]
+    assert [(c['from_block_id'], c['to_block_id']) for c in plain['connections']] == list(zip(ids, ids[1:]))
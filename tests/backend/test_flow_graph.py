@@ -0,0 +1,32 @@
+def import_chain(client, headers, bot_id, size):
+    response = client.post('/api/v1/flows/import', json={
+        'bot_id': bot_id,
+        'name': 'Chain',
+        'blocks': [{'title': f'B{i}', 'type': 'text', 'content': {'i': i}} for i in range(size)],
+        'connections': [{'from_index': i, 'to_index': i + 1} for i in range(size - 1)],
+    }, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()['flow_id']
+
+
+def test_graph_loads_large_flow_in_three_queries(client, auth_headers, bot_id, count_queries):
+    flow_id = import_chain(client, auth_headers, bot_id, 1000)
+    # Прогрев кэша авторизации
+    client.get(f'/api/v1/flows/{flow_id}', headers=auth_headers)
+
+    with count_queries() as statements:
+        response = client.get(f'/api/v1/flows/{flow_id}/graph', headers=auth_headers)
+
+    assert response.status_code == 200
+    graph = response.json()
+    assert graph['flow']['id'] == flow_id
+    assert [block['content']['i'] for block in graph['blocks']] == list(range(1000))
+    ids = [block['id'] for block in graph['blocks']]
+    assert [(c['from_block_id'], c['to_block_id']) for c in graph['connections']] == list(zip(ids, ids[1:]))
+    assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 3
+
+
+def test_graph_of_foreign_flow_is_forbidden(client, auth_headers, bot_id, register_user):
+    flow_id = import_chain(client, auth_headers, bot_id, 2)
+    other = register_user('mallory')
+    assert client.get(f'/api/v1/flows/{flow_id}/graph', headers=other).status_code == 403
@@ -0,0 +1,127 @@
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import Flow
+from app.models.block import Block
+from app.models.connection import Connection
+from app.services import flow_import
+
+
+def chain(bot_id, size, **extra):
+    return {
+        'bot_id': bot_id,
+        'name': 'Imported',
+        'blocks': [{'title': f'B{i}', 'type': 'text', 'content': {'i': i}, 'position_y': i} for i in range(size)],
+        'connections': [{'from_index': i, 'to_index': i + 1, 'label': f'L{i}'} for i in range(size - 1)],
+        **extra,
+    }
+
+
+def ndjson(payload):
+    header = {key: value for key, value in payload.items() if key not in ('blocks', 'connections')}
+    lines = [header]
+    lines += [{'block': block} for block in payload['blocks']]
+    lines += [{'connection': conn} for conn in payload['connections']]
+    return '\n'.join(json.dumps(line) for line in lines).encode()
+
+
+async def counts(db):
+    return (
+        await db.scalar(select(func.count()).select_from(Flow)),
+        await db.scalar(select(func.count()).select_from(Block)),
+        await db.scalar(select(func.count()).select_from(Connection)),
+    )
+
+
+async def imported_graph(db, flow_id):
+    blocks = (await db.execute(select(Block.id, Block.content).where(Block.flow_id == flow_id)
+                               .order_by(Block.id))).all()
+    index = {row.id: row.content['i'] for row in blocks}
+    connections = (await db.execute(select(Connection.from_block_id, Connection.to_block_id, Connection.label)
+                                    .where(Connection.from_block_id.in_(index)).order_by(Connection.id))).all()
+    return [row.content['i'] for row in blocks], [(index[a], index[b], label) for a, b, label in connections]
+
+
+@pytest.mark.parametrize('batch_size', [3, 1000])
+async def test_import_maps_connection_indexes_to_block_ids(client, auth_headers, bot_id, db, monkeypatch, batch_size):
+    # Пачки меньше числа блоков: id из нескольких insert().returning() должны идти по порядку
+    monkeypatch.setattr(flow_import.bulk_import_flow, '__defaults__', (batch_size,))
+    response = client.post('/api/v1/flows/import', json=chain(bot_id, 10), headers=auth_headers)
+    assert response.status_code == 201, response.text
+    body = response.json()
+    assert (body['blocks_created'], body['connections_created']) == (10, 9)
+
+    blocks, connections = await imported_graph(db, body['flow_id'])
+    assert blocks == list(range(10))
+    assert connections == [(i, i + 1, f'L{i}') for i in range(9)]
+
+
+def test_import_query_count_does_not_grow_with_blocks(client, auth_headers, bot_id, count_queries):
+    client.get('/api/v1/bots', headers=auth_headers)
+    with count_queries() as statements:
+        response = client.post('/api/v1/flows/import', json=chain(bot_id, 2500), headers=auth_headers)
+    assert response.status_code == 201, response.text
+    # Бот, flow, 3 пачки блоков, 3 пачки связей, refresh
+    assert len(statements) <= 10
+
+
+async def test_invalid_index_rejects_whole_import(client, auth_headers, bot_id, db):
+    payload = chain(bot_id, 5)
+    payload['connections'].append({'from_index': 4, 'to_index': 5})
+
+    response = client.post('/api/v1/flows/import', json=payload, headers=auth_headers)
+    assert response.status_code == 400
+    assert 'connection #4' in response.json()['detail']
+    assert await counts(db) == (0, 0, 0)
+
+
+async def test_failure_mid_import_rolls_back(client, auth_headers, bot_id, db, monkeypatch):
+    real_insert_graphs = flow_import.insert_graphs
+
+    def insert_blocks_then_fail(db, flow_ids, blocks, connections, batch_size=1000):
+        # Flow и блоки уже вставлены в транзакции
+        real_insert_graphs(db, flow_ids, blocks, [], batch_size)
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(flow_import, 'insert_graphs', insert_blocks_then_fail)
+    with pytest.raises(RuntimeError):
+        client.post('/api/v1/flows/import', json=chain(bot_id, 5), headers=auth_headers)
+    assert await counts(db) == (0, 0, 0)
+
+
+async def test_ndjson_import_matches_json_import(client, auth_headers, bot_id, db):
+    payload = chain(bot_id, 50)
+    response = client.post('/api/v1/flows/import/ndjson', content=ndjson(payload),
+                           headers={**auth_headers, 'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 201, response.text
+
+    blocks, connections = await imported_graph(db, response.json()['flow_id'])
+    assert blocks == list(range(50))
+    assert connections == [(i, i + 1, f'L{i}') for i in range(49)]
+
+
+async def test_ndjson_reports_bad_line(client, auth_headers, bot_id, db):
+    body = ndjson(chain(bot_id, 3)) + b'\n{"block": {"title": "no type"}}'
+    response = client.post('/api/v1/flows/import/ndjson', content=body,
+                           headers={**auth_headers, 'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 400
+    assert 'line 7' in response.json()['detail']
+    assert await counts(db) == (0, 0, 0)
+
+
+async def test_export_round_trips_through_ndjson_import(client, auth_headers, bot_id, db):
+    flow_id = client.post('/api/v1/flows/import', json=chain(bot_id, 20), headers=auth_headers).json()['flow_id']
+    exported = client.get(f'/api/v1/flows/{flow_id}/export?format=ndjson', headers=auth_headers).content
+
+    response = client.post('/api/v1/flows/import/ndjson', content=exported,
+                           headers={**auth_headers, 'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 201, response.text
+    assert await imported_graph(db, response.json()['flow_id']) == await imported_graph(db, flow_id)
+
+
+def test_import_into_foreign_bot_is_not_found(client, bot_id, register_user):
+    other = register_user('mallory')
+    response = client.post('/api/v1/flows/import', json=chain(bot_id, 2), headers=other)
+    assert response.status_code == 404
@@ -0,0 +1,99 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.api.v1 import flow_templates
+from app.models import Flow
+from app.models.block import Block
+from app.models.connection import Connection
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Опубликованные события flows: (bot_id, flow_id)"""
+    published = []
+    monkeypatch.setattr(flow_templates, 'publish_flow_event',
+                        lambda event, bot_id, flow_id, updated_at=None: published.append((bot_id, flow_id)))
+    return published
+
+
+@pytest.fixture
+def bot_ids(client, auth_headers):
+    ids = []
+    for i in range(3):
+        response = client.post('/api/v1/bots', json={'name': f'bot{i}', 'token': f'{i}:abc'}, headers=auth_headers)
+        assert response.status_code in (200, 201), response.text
+        ids.append(response.json()['id'])
+    return ids
+
+
+async def counts(db):
+    return (
+        await db.scalar(select(func.count()).select_from(Flow)),
+        await db.scalar(select(func.count()).select_from(Block)),
+        await db.scalar(select(func.count()).select_from(Connection)),
+    )
+
+
+def bulk(client, headers, bot_ids, copies=1, template_id='quiz'):
+    return client.post('/api/v1/flows/from-template/bulk', json={
+        'bot_ids': bot_ids, 'template_id': template_id, 'copies': copies,
+    }, headers=headers)
+
+
+async def test_bulk_creates_copies_for_every_bot(client, auth_headers, bot_ids, db):
+    response = bulk(client, auth_headers, bot_ids + bot_ids[:1], copies=2)
+    assert response.status_code == 201, response.text
+    body = response.json()
+
+    # quiz: 4 блока и 3 связи, повторный bot_id не создаёт лишних копий
+    assert body['flows_created'] == 6
+    assert (body['blocks_created'], body['connections_created']) == (24, 18)
+    assert await counts(db) == (6, 24, 18)
+    flows = (await db.execute(select(Flow.bot_id, Flow.name).order_by(Flow.id))).all()
+    assert [flow.bot_id for flow in flows] == [bot_id for bot_id in bot_ids for _ in range(2)]
+    assert flows[0].name == 'Quiz Flow #1' and flows[1].name == 'Quiz Flow #2'
+
+
+async def test_bulk_query_count_does_not_depend_on_copies(client, auth_headers, bot_ids, count_queries):
+    # Первый запрос ещё загружает пользователя в кэш авторизации
+    assert bulk(client, auth_headers, bot_ids[:1]).status_code == 201
+    with count_queries() as small:
+        assert bulk(client, auth_headers, bot_ids[:1]).status_code == 201
+    with count_queries() as large:
+        assert bulk(client, auth_headers, bot_ids, copies=20).status_code == 201
+    assert len(large) == len(small)
+
+
+async def test_bulk_publishes_one_event_per_bot(client, auth_headers, bot_ids, events):
+    response = bulk(client, auth_headers, bot_ids, copies=5)
+    assert response.status_code == 201, response.text
+
+    flow_ids = response.json()['flow_ids']
+    assert sorted(bot_id for bot_id, _ in events) == sorted(bot_ids)
+    assert all(flow_id in flow_ids for _, flow_id in events)
+
+
+async def test_bulk_over_row_limit_is_rejected(client, auth_headers, bot_ids, db, events, monkeypatch):
+    # 3 бота x 2 копии x (1 flow + 4 блока + 3 связи) = 48 строк
+    monkeypatch.setattr(flow_templates.settings, 'FLOW_TEMPLATES_BULK_MAX_ROWS', 47)
+    response = bulk(client, auth_headers, bot_ids, copies=2)
+    assert response.status_code == 413
+    assert '48' in response.json()['detail']
+    assert await counts(db) == (0, 0, 0)
+    assert events == []
+
+    monkeypatch.setattr(flow_templates.settings, 'FLOW_TEMPLATES_BULK_MAX_ROWS', 48)
+    assert bulk(client, auth_headers, bot_ids, copies=2).status_code == 201
+
+
+async def test_bulk_with_foreign_bot_creates_nothing(client, auth_headers, bot_ids, db, register_user):
+    other = client.post('/api/v1/bots', json={'name': 'other', 'token': '99:abc'},
+                        headers=register_user('bob')).json()['id']
+    response = bulk(client, auth_headers, bot_ids + [other])
+    assert response.status_code == 404
+    assert str(other) in response.json()['detail']
+    assert await counts(db) == (0, 0, 0)
+
+
+async def test_bulk_unknown_template(client, auth_headers, bot_ids):
+    assert bulk(client, auth_headers, bot_ids, template_id='missing').status_code == 404
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+
+import pytest
+from sqlalchemy import select
+
+from app.core import passwords
+from app.core.passwords import PasswordHasher, create_context
+from app.models.user import User
+
+
+async def add_user(db, password_hash, username='legacy'):
+    user = User(username=username, email=f'{username}@example.com', password_hash=password_hash)
+    db.add(user)
+    await db.commit()
+    return user.id
+
+
+async def stored_hash(db, user_id):
+    db.expire_all()
+    return await db.scalar(select(User.password_hash).where(User.id == user_id))
+
+
+def login(client, password, username='legacy'):
+    return client.post('/api/v1/auth/login', json={'username': username, 'password': password})
+
+
+async def test_legacy_sha256_hash_is_upgraded_on_login(client, db):
+    user_id = await add_user(db, hashlib.sha256(b'secret123').hexdigest())
+
+    assert login(client, 'secret123').status_code == 200
+    upgraded = await stored_hash(db, user_id)
+    assert upgraded.startswith('$2b$')
+    assert passwords.pwd_context.verify('secret123', upgraded)
+
+    # Второй вход - уже по bcrypt, без повторного перехеширования
+    assert login(client, 'secret123').status_code == 200
+    assert await stored_hash(db, user_id) == upgraded
+
+
+async def test_wrong_password_keeps_legacy_hash(client, db):
+    legacy = hashlib.sha256(b'secret123').hexdigest()
+    user_id = await add_user(db, legacy)
+
+    assert login(client, 'wrong').status_code == 401
+    assert await stored_hash(db, user_id) == legacy
+
+
+async def test_cheaper_bcrypt_hash_is_upgraded(client, db, monkeypatch):
+    # Стоимость подняли с 4 до 5: старые хеши пересчитываются при входе
+    monkeypatch.setattr(passwords.password_hasher, 'context', create_context('bcrypt', 5))
+    user_id = await add_user(db, create_context('bcrypt', 4).hash('secret123'))
+
+    assert login(client, 'secret123').status_code == 200
+    assert (await stored_hash(db, user_id)).startswith('$2b$05$')
+
+
+async def test_argon2_scheme_upgrades_bcrypt_hash(client, db, monkeypatch):
+    pytest.importorskip('argon2')
+    monkeypatch.setattr(passwords.password_hasher, 'context', create_context('argon2', 4))
+    user_id = await add_user(db, create_context('bcrypt', 4).hash('secret123'))
+
+    assert login(client, 'secret123').status_code == 200
+    assert (await stored_hash(db, user_id)).startswith('$argon2')
+
+
+async def test_unknown_hash_format_is_rejected(client, db):
+    user_id = await add_user(db, 'not-a-hash')
+
+    assert login(client, 'not-a-hash').status_code == 401
+    assert await stored_hash(db, user_id) == 'not-a-hash'
+
+
+async def test_missing_user_still_verifies_a_hash(client, monkeypatch):
+    hasher = PasswordHasher(create_context('bcrypt', 4))
+    monkeypatch.setattr('app.core.security.password_hasher', hasher)
+    verified = []
+    verify = hasher.context.verify
+    monkeypatch.setattr(hasher.context, 'verify', lambda *args: verified.append(args) or verify(*args))
+
+    assert login(client, 'secret123', username='nobody').status_code == 401
+    assert login(client, 'secret123', username='nobody').status_code == 401
+    # Время ответа как у существующего логина: проверяется фиктивный хеш, созданный один раз
+    assert [hash_ for _, hash_ in verified] == [hasher._dummy_hash] * 2
+    hasher.close()
+
+
+async def test_hashing_does_not_block_event_loop():
+    hasher = PasswordHasher(create_context('bcrypt', 10), max_workers=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.002)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        password_hash = await hasher.hash('secret123')
+        assert await hasher.verify_and_update('secret123', password_hash) == (True, None)
+    finally:
+        task.cancel()
+        hasher.close()
+    # bcrypt с 2^10 раундов - десятки мс, event loop всё это время обслуживает другие задачи
+    assert ticks >= 5
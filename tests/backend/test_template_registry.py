@@ -0,0 +1,169 @@
+import json
+import os
+
+import pytest
+
+from app.api.v1 import flow_templates
+from app.services.flow_templates import TemplateRegistry, TemplateError
+
+
+def template(template_id, name=None, blocks=2, connections=((0, 1),)):
+    return {
+        'id': template_id,
+        'name': name or template_id.title(),
+        'blocks': [{'title': f'Block {i}', 'type': 'message'} for i in range(blocks)],
+        'connections': [{'from_index': a, 'to_index': b} for a, b in connections],
+    }
+
+
+def write(path, data, mtime=None):
+    """Записать JSON; mtime задаётся явно - запись в ту же секунду не всегда меняет его"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data) if not isinstance(data, str) else data, encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def templates_dir(tmp_path):
+    root = tmp_path / 'templates'
+    write(root / 'quiz.json', template('quiz'), mtime=1000)
+    write(root / 'sales' / 'set.json', {'lead': template('lead'), 'promo': template('promo', blocks=1, connections=())},
+          mtime=1000)
+    write(root / 'README.md', 'not a template')
+    return root
+
+
+def test_directory_is_loaded_with_nested_files(templates_dir):
+    catalog = TemplateRegistry(str(templates_dir)).catalog()
+
+    assert sorted(catalog.plans) == ['lead', 'promo', 'quiz']
+    assert sorted(os.path.basename(path) for path in catalog.versions) == ['quiz.json', 'set.json']
+    plan = catalog.get('quiz')
+    assert plan.connections == [(0, 1, None)]
+    assert json.loads(plan.detail)['name'] == 'Quiz'
+    summary = {item['id']: item for item in json.loads(catalog.summary)}
+    assert summary['promo']['blocks_count'] == 1 and summary['promo']['connections_count'] == 0
+    assert catalog.get('missing') is None
+
+
+def test_single_file_with_a_list_of_templates(tmp_path):
+    path = tmp_path / 'templates.json'
+    write(path, [template('a'), template('b')])
+
+    assert sorted(TemplateRegistry(str(path)).catalog().plans) == ['a', 'b']
+
+
+@pytest.mark.parametrize('data, error', [
+    ({'id': 'bad', 'name': 'Bad'}, 'blocks'),
+    (template('bad', connections=((0, 5),)), 'Invalid block index'),
+    ({'other': template('bad')}, "does not match its id"),
+    ([template('ok'), 'not an object'], 'must be an object'),
+    ('{"id": ', 'invalid JSON'),
+])
+def test_invalid_template_is_rejected(tmp_path, data, error):
+    write(tmp_path / 'broken.json', data)
+
+    with pytest.raises(TemplateError, match=error):
+        TemplateRegistry(str(tmp_path)).reload()
+
+
+def test_duplicate_template_ids_are_rejected(templates_dir):
+    write(templates_dir / 'copy.json', template('quiz', name='Quiz copy'))
+
+    with pytest.raises(TemplateError, match="duplicate template id 'quiz'"):
+        TemplateRegistry(str(templates_dir)).reload()
+
+
+def test_missing_path_is_an_error(tmp_path):
+    with pytest.raises(TemplateError, match='not found'):
+        TemplateRegistry(str(tmp_path / 'missing')).catalog()
+
+
+def test_changed_files_are_reloaded_by_mtime(templates_dir):
+    registry = TemplateRegistry(str(templates_dir), check_interval=0)
+    first = registry.catalog()
+    assert registry.catalog() is first
+
+    write(templates_dir / 'quiz.json', template('quiz', name='Quiz v2'), mtime=2000)
+    second = registry.catalog()
+    assert second is not first
+    assert second.get('quiz').name == 'Quiz v2'
+
+    # Новый файл и удалённый файл тоже меняют набор версий
+    write(templates_dir / 'extra.json', template('extra'), mtime=2000)
+    assert 'extra' in registry.catalog().plans
+    (templates_dir / 'sales' / 'set.json').unlink()
+    assert sorted(registry.catalog().plans) == ['extra', 'quiz']
+
+
+def test_files_are_not_checked_before_interval(templates_dir):
+    registry = TemplateRegistry(str(templates_dir), check_interval=3600)
+    first = registry.catalog()
+    write(templates_dir / 'quiz.json', template('quiz', name='Quiz v2'), mtime=2000)
+
+    assert registry.catalog() is first
+    # reload перечитывает сразу, не дожидаясь интервала
+    assert registry.reload().get('quiz').name == 'Quiz v2'
+
+
+def test_broken_file_keeps_previous_snapshot(templates_dir):
+    registry = TemplateRegistry(str(templates_dir), check_interval=0)
+    first = registry.catalog()
+
+    write(templates_dir / 'quiz.json', '{"id": "quiz", ', mtime=2000)
+    assert registry.catalog() is first
+    with pytest.raises(TemplateError):
+        registry.reload()
+    assert registry.catalog() is first
+
+    # Исправленный файл подхватывается следующей проверкой
+    write(templates_dir / 'quiz.json', template('quiz', name='Quiz fixed'), mtime=3000)
+    assert registry.catalog().get('quiz').name == 'Quiz fixed'
+
+
+@pytest.fixture
+def registry(templates_dir, monkeypatch):
+    registry = TemplateRegistry(str(templates_dir), check_interval=3600)
+    monkeypatch.setattr(flow_templates, 'registry', registry)
+    return registry
+
+
+def reload(client, token=None):
+    headers = {'X-Admin-Token': token} if token is not None else {}
+    return client.post('/api/v1/flow-templates/reload', headers=headers)
+
+
+def test_reload_requires_configured_admin_token(client, registry, monkeypatch):
+    monkeypatch.setattr(flow_templates.settings, 'FLOW_TEMPLATES_ADMIN_TOKEN', '')
+    # Без настроенного токена reload закрыт, в том числе с пустым заголовком
+    assert reload(client).status_code == 403
+    assert reload(client, '').status_code == 403
+    assert registry._catalog is None
+
+
+def test_reload_checks_admin_token(client, registry, templates_dir, monkeypatch):
+    monkeypatch.setattr(flow_templates.settings, 'FLOW_TEMPLATES_ADMIN_TOKEN', 'admin-secret')
+    assert len(client.get('/api/v1/flow-templates').json()) == 3
+    write(templates_dir / 'extra.json', template('extra'), mtime=2000)
+
+    assert reload(client).status_code == 403
+    assert reload(client, 'wrong').status_code == 403
+    assert len(client.get('/api/v1/flow-templates').json()) == 3
+
+    response = reload(client, 'admin-secret')
+    assert response.status_code == 200
+    assert response.json() == {'templates': 4}
+    assert len(client.get('/api/v1/flow-templates').json()) == 4
+
+
+def test_reload_of_broken_templates_returns_400_and_keeps_catalog(client, registry, templates_dir, monkeypatch):
+    monkeypatch.setattr(flow_templates.settings, 'FLOW_TEMPLATES_ADMIN_TOKEN', 'admin-secret')
+    first = registry.catalog()
+    write(templates_dir / 'quiz.json', {'id': 'quiz'}, mtime=2000)
+
+    response = reload(client, 'admin-secret')
+    assert response.status_code == 400
+    assert 'quiz' in response.json()['detail']
+    assert registry.catalog() is first
+    assert client.get('/api/v1/flow-templates/quiz').json()['name'] == 'Quiz'
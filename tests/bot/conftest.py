@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# Бот запускается из каталога bot/ с плоскими импортами (utils.*, models.*, config)
+BOT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'bot')
+sys.path.insert(0, os.path.abspath(BOT_DIR))
+# Общие построители графов (flow_graphs)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Синглтоны handlers открывают базу по config.DB_PATH при импорте
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'bot_users.db'))
+
+
+class FakeBot:
+    """Bot API в памяти: запоминает отправленные сообщения
+
+    flood[chat_id] - очередь retry_after: пока она не пуста, отправка
+    в чат отвечает 429 (TelegramRetryAfter).
+    """
+
+    def __init__(self, bot_id: int = 1):
+        self.id = bot_id
+        self.sent = []
+        self.sent_at = []
+        self.flood = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        waits = self.flood.get(chat_id)
+        if waits:
+            from aiogram.exceptions import TelegramRetryAfter
+            from aiogram.methods import SendMessage
+            retry_after = waits.pop(0)
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), 'Too Many Requests', retry_after)
+        self.sent.append((chat_id, text))
+        self.sent_at.append(time.monotonic())
+        return len(self.sent)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append((chat_id, photo))
+
+    async def send_video(self, chat_id, video, **kwargs):
+        self.sent.append((chat_id, video))
+
+
+@pytest.fixture
+def fake_bot():
+    return FakeBot()
+
+
+@pytest.fixture
+async def flow_handler(tmp_path, monkeypatch):
+    """handlers.flow_handler с отдельной базой состояний и исполнителем без сети"""
+    from handlers import flow_handler
+    from models.buffered_state import BufferedUserState
+    from models.user_state import UserState
+    from utils.flow_executor import FlowExecutor
+
+    states = BufferedUserState(UserState(str(tmp_path / 'states.db')), durability='checkpoint')
+    monkeypatch.setattr(flow_handler, 'user_state', states)
+    monkeypatch.setattr(flow_handler, 'executor', FlowExecutor('http://api.invalid', bot_id=1))
+    yield flow_handler
+    await states.close()
@@ -0,0 +1,23 @@
+"""Построение графов flow для тестов и бенчмарков"""
+
+
+def make_flow(nodes, edges, flow_id='f1'):
+    return {'flow_id': flow_id, 'updated_at': '2024-01-01T00:00:00', 'flow': {'nodes': nodes, 'edges': edges}}
+
+
+def node(node_id, node_type='textNode', **data):
+    return {'id': node_id, 'type': node_type, 'data': data}
+
+
+def edge(source, target, handle=None):
+    result = {'source': source, 'target': target}
+    if handle:
+        result['sourceHandle'] = handle
+    return result
+
+
+def chain(size, flow_id='chain'):
+    """input -> text 1 -> ... -> text size-1"""
+    nodes = [node('n0', 'input')] + [node(f'n{i}', text=f'step {i}') for i in range(1, size)]
+    edges = [edge(f'n{i}', f'n{i + 1}') for i in range(size - 1)]
+    return make_flow(nodes, edges, flow_id)
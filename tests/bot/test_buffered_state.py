@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from models.buffered_state import BufferedUserState
+from models.user_state import UserState, merge_context
+
+PATCHES = [
+    {'profile': {'name': 'Ann', 'age': 30}, 'tags': ['a']},
+    {'profile': {'age': None, 'city': 'Riga'}, 'tags': ['b']},
+    {'tags': None, 'score': 1},
+]
+
+
+def test_merge_context_follows_rfc7396():
+    assert merge_context({'a': {'b': 1, 'c': 2}}, {'a': {'b': None, 'd': 3}}) == {'a': {'c': 2, 'd': 3}}
+    assert merge_context({'a': 1}, {'a': {'b': None}}) == {'a': {}}
+    assert merge_context({'a': [1, 2]}, {'a': [3]}) == {'a': [3]}
+    assert merge_context({'a': 1}, {'missing': None}) == {'a': 1}
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = UserState(str(tmp_path / 'states.db'))
+    yield store
+    await store.close()
+
+
+async def test_merge_matches_sqlite_json_patch(store):
+    context = {}
+    for patch in PATCHES:
+        context = merge_context(context, patch)
+
+    expected = await store._run(lambda: store._conn.execute(
+        "SELECT json_patch(json_patch(json_patch('{}', ?), ?), ?)",
+        tuple(json.dumps(patch) for patch in PATCHES)
+    ).fetchone()[0])
+    assert json.loads(expected) == context
+
+
+@pytest.mark.parametrize('durability', BufferedUserState.DURABILITY_MODES)
+async def test_buffer_and_store_merge_identically(store, durability):
+    buffered = BufferedUserState(store, durability=durability)
+
+    await store.set_state(1, 10, 'f1', 'n1', {})
+    await buffered.set_state(1, 20, 'f1', 'n1', {})
+    for patch in PATCHES:
+        await store.advance(1, 10, 'n2', patch)
+        await buffered.advance(1, 20, 'n2', patch)
+    await store.update_context(1, 10, {'profile': {'city': None}})
+    await buffered.update_context(1, 20, {'profile': {'city': None}})
+
+    direct = await store.get_state(1, 10)
+    assert direct['context'] == {'profile': {'name': 'Ann'}, 'score': 1}
+    assert (await buffered.get_state(1, 20))['context'] == direct['context']
+
+    await buffered.flush()
+    assert (await store.get_state(1, 20))['context'] == direct['context']
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.flow_executor import FlowExecutor
+
+
+def test_opens_after_threshold_and_probes_after_timeout(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.circuit_breaker.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    now[0] += 10
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Одна проба за раз
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_stuck_half_open_lets_next_probe_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.circuit_breaker.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 10
+    assert breaker.allow_request()
+
+    # Исход пробы не записан
+    now[0] += 9
+    assert not breaker.allow_request()
+    now[0] += 1
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.fixture
+async def api():
+    handlers = {}
+
+    async def dispatch(request):
+        return await handlers['active'](request)
+
+    app = web.Application()
+    app.router.add_get('/flows/{bot_id}/active', dispatch)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, handlers
+    await server.close()
+
+
+def half_open_executor(server):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    return FlowExecutor(str(server.make_url('')), bot_id=1, retries=0, breaker=breaker), breaker
+
+
+async def test_invalid_json_probe_reopens_breaker(api):
+    server, handlers = api
+
+    async def bad_json(request):
+        return web.Response(text='<html>oops</html>', content_type='application/json')
+
+    handlers['active'] = bad_json
+    executor, breaker = half_open_executor(server)
+    try:
+        assert await executor.get_active_flow() is None
+        assert breaker.state == CircuitBreaker.OPEN
+    finally:
+        await executor.close()
+
+
+async def test_cancelled_probe_reopens_breaker(api):
+    server, handlers = api
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(10)
+        return web.json_response({})
+
+    handlers['active'] = hang
+    executor, breaker = half_open_executor(server)
+    try:
+        task = asyncio.create_task(executor.get_active_flow())
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.state == CircuitBreaker.OPEN
+    finally:
+        await executor.close()
+
+
+async def test_successful_probe_closes_breaker(api):
+    server, handlers = api
+
+    async def ok(request):
+        return web.json_response({'flow_id': 'f1', 'flow': {}}, headers={'ETag': '"v1"'})
+
+    handlers['active'] = ok
+    executor, breaker = half_open_executor(server)
+    try:
+        flow = await executor.get_active_flow()
+        assert flow['flow_id'] == 'f1'
+        assert breaker.state == CircuitBreaker.CLOSED
+    finally:
+        await executor.close()
@@ -0,0 +1,69 @@
+from flow_graphs import make_flow, node, edge
+from utils.compiled_flow import CompiledFlow
+
+
+def test_indexes_nodes_and_edges_in_order():
+    flow = CompiledFlow(make_flow(
+        [node('start', 'input'), node('a'), node('b'), node('c')],
+        [edge('start', 'a'), edge('a', 'b'), edge('a', 'c'), edge('a', 'missing')],
+    ))
+
+    assert flow.flow_id == 'f1'
+    assert flow.start_node['id'] == 'start'
+    assert flow.find_node('b')['id'] == 'b'
+    assert flow.find_node('missing') is None
+    assert [n['id'] for n in flow.get_next_nodes('a')] == ['b', 'c']
+    assert flow.get_next_nodes('c') == []
+
+
+def test_duplicate_node_ids_keep_first():
+    flow = CompiledFlow(make_flow([node('a', text='first'), node('a', text='second')], []))
+
+    assert flow.find_node('a')['data']['text'] == 'first'
+
+
+def test_branches_by_source_handle():
+    flow = CompiledFlow(make_flow(
+        [node('cond', 'conditionNode', condition='x > 1'), node('yes'), node('no')],
+        [edge('cond', 'yes', 'true'), edge('cond', 'no', 'false')],
+    ))
+
+    assert flow.get_branch('cond', 'true')['id'] == 'yes'
+    assert flow.get_branch('cond', 'false')['id'] == 'no'
+    assert flow.get_branch('yes', 'true') is None
+    assert flow.conditions['cond']({'x': 2}) is True
+
+
+def test_keyboards_prebuilt_for_button_nodes():
+    flow = CompiledFlow(make_flow(
+        [node('menu', 'buttonNode', buttons=[{'text': 'One'}, {'text': 'Two'}]), node('empty', 'buttonNode')],
+        [],
+    ))
+
+    keyboard = flow.get_keyboard('menu')
+    assert [row[0].text for row in keyboard.inline_keyboard] == ['One', 'Two']
+    assert keyboard.inline_keyboard[1][0].callback_data == 'btn:menu:1'
+    assert flow.get_keyboard('empty') is None
+
+
+def test_flow_without_start_node():
+    flow = CompiledFlow(make_flow([node('a')], []))
+
+    assert flow.start_node is None
+
+
+def test_executor_compiles_per_bot_and_bounds_cache():
+    from utils.flow_cache import FlowCache
+    from utils.flow_executor import FlowExecutor
+
+    executor = FlowExecutor('http://api.invalid', bot_id=1, cache=FlowCache(max_size=2))
+    first = make_flow([node('start', 'input'), node('a')], [edge('start', 'a')], flow_id='shared')
+    second = make_flow([node('start', 'input'), node('b')], [edge('start', 'b')], flow_id='shared')
+
+    # Один flow_id у разных ботов - разные графы
+    assert executor.compile_flow(first, bot_id=1).find_node('a')
+    assert executor.compile_flow(second, bot_id=2).find_node('b')
+    assert executor.compile_flow(first, bot_id=1) is executor.compile_flow(first)
+
+    executor.compile_flow(make_flow([], [], flow_id='other'), bot_id=3)
+    assert list(executor._compiled) == [(1, 'shared'), (3, 'other')]
@@ -0,0 +1,98 @@
+import pytest
+
+from flow_graphs import make_flow, node, edge
+from utils.conditions import compile_expression, compile_condition, ConditionError, MAX_SEQUENCE_LENGTH
+
+
+@pytest.mark.parametrize('expression, context, expected', [
+    ('age >= 18', {'age': '21'}, True),
+    ('age >= 18', {'age': 17}, False),
+    ('city == "Riga" and not vip', {'city': 'Riga', 'vip': False}, True),
+    ('"10" == 10', {}, True),
+    ('0 < score <= 100', {'score': 50}, True),
+    ('tag in ["a", "b"]', {'tag': 'b'}, True),
+    ('matches(phone, "^\\\\+7")', {'phone': '+79990000000'}, True),
+    ('lower(name) == "ann"', {'name': 'ANN'}, True),
+    ('len(items) > 2', {'items': [1, 2, 3]}, True),
+    ('price * qty > 100', {'price': '20', 'qty': 6}, True),
+    ('missing > 1', {}, False),
+    ('total % 2 == 0', {'total': 4}, True),
+])
+def test_expressions(expression, context, expected):
+    assert compile_expression(expression)(context) is expected
+
+
+@pytest.mark.parametrize('expression', [
+    '__import__("os")',
+    'x.__class__',
+    'x ** 2',
+    'lambda: 1',
+    'eval("1")',
+    '[x for x in y]',
+])
+def test_rejects_unsupported_syntax(expression):
+    with pytest.raises(ConditionError):
+        compile_expression(expression)
+
+
+def test_sequence_repetition_is_capped():
+    assert compile_expression('len("ab" * 10) == 20')({})
+    # Огромная строка не строится - условие ложно
+    assert compile_expression('len(s * 10000000000) > 0')({'s': 'x'}) is False
+    assert compile_expression('len(10000000000 * [1]) > 0')({}) is False
+    assert compile_expression(f'len(s * {MAX_SEQUENCE_LENGTH}) > 0')({'s': 'x'}) is True
+
+
+def test_string_formatting_is_rejected():
+    assert compile_expression('len("%999999999d" % 1) > 0')({}) is False
+
+
+def test_legacy_condition():
+    predicate = compile_condition({'conditionType': 'text_equals', 'conditionValue': 'yes'})
+    assert predicate({'last_button_value': 'yes'})
+    assert not predicate({'last_button_value': 'no'})
+    assert compile_condition({'expression': 'a ==='}) is None
+
+
+def condition_flow(edges):
+    return make_flow(
+        [node('start', 'input'), node('cond', 'conditionNode', expression='vip == true'),
+         node('yes', text='yes'), node('no', text='no')],
+        [edge('start', 'cond')] + edges,
+    )
+
+
+async def run(flow_handler, bot, flow_data, context):
+    flow = flow_handler.executor.compile_flow(flow_data)
+    state = {'flow_id': flow.flow_id, 'current_node_id': 'start', 'context': context}
+    await flow_handler.user_state.set_state(1, 1, flow.flow_id, 'start', context)
+    await flow_handler.execute_current_node(bot, 1, 1, flow, state)
+    await flow_handler.user_state.checkpoint(1, 1)
+    return await flow_handler.user_state.store.get_state(1, 1)
+
+
+@pytest.mark.parametrize('vip, expected', [(True, 'yes'), (False, 'no')])
+async def test_branches_on_labelled_edges(flow_handler, fake_bot, vip, expected):
+    flow_data = condition_flow([edge('cond', 'yes', 'true'), edge('cond', 'no', 'false')])
+
+    await run(flow_handler, fake_bot, flow_data, {'vip': vip})
+
+    assert fake_bot.sent == [(1, expected)]
+
+
+async def test_missing_branch_ends_flow(flow_handler, fake_bot):
+    # Ребро только для 'true' - ложное условие не уходит в первое попавшееся ребро
+    flow_data = condition_flow([edge('cond', 'yes', 'true'), edge('cond', 'no')])
+
+    state = await run(flow_handler, fake_bot, flow_data, {'vip': False})
+
+    assert fake_bot.sent == []
+    assert state is None
+
+
+async def test_unlabelled_edges_fall_back_to_first(flow_handler, fake_bot):
+    flow_data = condition_flow([edge('cond', 'no'), edge('cond', 'yes')])
+
+    await run(flow_handler, fake_bot, flow_data, {'vip': True})
+
+    assert fake_bot.sent == [(1, 'no')]
@@ -0,0 +1,150 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils import flow_cache
+from utils.flow_cache import FlowCache
+from utils.flow_executor import FlowExecutor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое time.monotonic кэша: clock[0] += секунды"""
+    now = [1000.0]
+    monkeypatch.setattr(flow_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def body(flow_id, updated_at):
+    return {'flow_id': flow_id, 'updated_at': updated_at, 'flow': {}}
+
+
+def test_entry_is_fresh_until_ttl(clock):
+    cache = FlowCache(ttl=30)
+    cache.set_active(1, body('f1', '1'), '"v1"')
+    cache.set_flow(1, 'f1', body('f1', '1'), '"v1"')
+
+    clock[0] += 29.9
+    assert cache.get_active(1).is_fresh()
+    assert cache.get_flow(1, 'f1').is_fresh()
+    clock[0] += 0.1
+    # Просроченная запись остаётся - её ETag нужен для If-None-Match
+    assert not cache.get_active(1).is_fresh()
+    assert cache.get_flow(1, 'f1').etag == '"v1"'
+
+
+def test_least_recently_used_flow_is_evicted():
+    cache = FlowCache(max_size=2)
+    cache.set_flow(1, 'a', body('a', '1'), None)
+    cache.set_flow(1, 'b', body('b', '1'), None)
+    cache.get_flow(1, 'a')
+    cache.set_flow(2, 'c', body('c', '1'), None)
+
+    assert cache.get_flow(1, 'b') is None
+    assert cache.get_flow(1, 'a') is not None
+    assert cache.get_flow(2, 'c') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['flows'] == 2
+
+
+def test_new_version_replaces_the_old_one():
+    cache = FlowCache(max_size=2)
+    cache.set_flow(1, 'a', body('a', '1'), '"v1"')
+    cache.set_flow(1, 'a', body('a', '2'), '"v2"')
+    cache.set_flow(1, 'b', body('b', '1'), None)
+
+    # Старая версия удалена сразу и не вытесняет другие flows
+    assert list(cache._flows) == [(1, 'a', '2'), (1, 'b', '1')]
+    assert cache.get_flow(1, 'a').etag == '"v2"'
+    assert cache.stats()['evictions'] == 0
+
+
+def test_same_flow_id_of_different_bots_is_cached_separately():
+    cache = FlowCache()
+    cache.set_flow(1, 'f', body('f', '1'), '"bot1"')
+    cache.set_flow(2, 'f', body('f', '1'), '"bot2"')
+    cache.invalidate_flow(1, 'f')
+
+    assert cache.get_flow(1, 'f') is None
+    assert cache.get_flow(2, 'f').etag == '"bot2"'
+
+
+def test_touch_extends_ttl(clock):
+    cache = FlowCache(ttl=30)
+    cache.set_flow(1, 'f', body('f', '1'), '"v1"')
+    clock[0] += 31
+    entry = cache.get_flow(1, 'f')
+    assert not entry.is_fresh()
+
+    cache.touch(entry)
+    assert entry.is_fresh()
+    clock[0] += 29
+    assert entry.is_fresh()
+    assert cache.stats()['revalidations'] == 1
+
+
+@pytest.fixture
+async def api():
+    """API с активным flow бота 1: отвечает 304 на If-None-Match с текущим ETag"""
+    state = {'version': 1, 'requests': [], 'up': True}
+
+    async def active(request):
+        state['requests'].append(request.headers.get('If-None-Match'))
+        if not state['up']:
+            return web.Response(status=503)
+        etag = f'"v{state["version"]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.json_response(body('f1', str(state['version'])), headers={'ETag': etag})
+
+    app = web.Application()
+    app.router.add_get('/flows/{bot_id}/active', active)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, state
+    await server.close()
+
+
+@pytest.fixture
+async def executor(api):
+    server, _ = api
+    executor = FlowExecutor(str(server.make_url('')), bot_id=1, cache=FlowCache(ttl=30), retries=0)
+    yield executor
+    await executor.close()
+
+
+async def test_expired_entry_is_revalidated_with_etag(api, executor, clock):
+    _, state = api
+    cache = executor.cache
+    first = await executor.get_active_flow()
+    assert await executor.get_active_flow() is first
+    assert state['requests'] == [None]
+
+    # TTL истёк, flow не менялся: 304, тело то же, TTL продлён
+    clock[0] += 31
+    assert await executor.get_active_flow() is first
+    assert state['requests'] == [None, '"v1"']
+    assert cache.get_active(1).is_fresh()
+    assert cache.stats()['revalidations'] == 1
+
+    # Flow изменился: новое тело и новая версия в кэше flows
+    state['version'] = 2
+    clock[0] += 31
+    second = await executor.get_active_flow()
+    assert second['updated_at'] == '2'
+    assert cache.get_flow(1, 'f1').data is second
+    assert list(cache._flows) == [(1, 'f1', '2')]
+
+    assert cache.stats() == {
+        'hits': 1, 'misses': 3, 'revalidations': 1, 'evictions': 0, 'active_pointers': 1, 'flows': 1,
+    }
+
+
+async def test_stale_entry_is_served_while_api_is_down(api, executor, clock):
+    _, state = api
+    first = await executor.get_active_flow()
+    state['up'] = False
+    clock[0] += 31
+
+    assert await executor.get_active_flow() is first
+    assert not executor.cache.get_active(1).is_fresh()
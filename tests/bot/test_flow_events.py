@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utils.flow_cache import FlowCache
+from utils.flow_events import FlowEventListener
+from utils.flow_executor import FlowExecutor
+
+
+@pytest.fixture
+async def api():
+    """API с одной версией активного flow бота 1, отвечает 304 по ETag"""
+    state = {'version': 1, 'requests': 0}
+
+    async def active(request):
+        state['requests'] += 1
+        etag = f'"v{state["version"]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        body = {'flow_id': 'f1', 'updated_at': str(state['version']), 'flow': {}}
+        return web.json_response(body, headers={'ETag': etag})
+
+    app = web.Application()
+    app.router.add_get('/flows/{bot_id}/active', active)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, state
+    await server.close()
+
+
+@pytest.fixture
+async def listener(api):
+    server, _ = api
+    executor = FlowExecutor(str(server.make_url('')), bot_id=1, cache=FlowCache(ttl=0.05), retries=0)
+    listener = FlowEventListener(executor, 'redis://unused')
+    # Подписка считается живой, без Redis
+    listener._set_connected(True)
+    yield listener
+    await executor.close()
+
+
+async def test_subscription_keeps_short_revalidation_ttl(listener):
+    assert listener.cache.ttl == 0.05
+
+
+async def test_event_reloads_active_flow_immediately(api, listener):
+    _, state = api
+    executor = listener.executor
+    assert (await executor.get_active_flow(1))['updated_at'] == '1'
+
+    state['version'] = 2
+    await listener.handle(json.dumps({'event': 'saved', 'bot_id': 1, 'flow_id': 'f1'}))
+    requests = state['requests']
+    assert (await executor.get_active_flow(1))['updated_at'] == '2'
+    # Прогрето обработчиком события
+    assert state['requests'] == requests
+
+
+async def test_lost_event_is_caught_by_revalidation(api, listener):
+    _, state = api
+    executor = listener.executor
+    assert (await executor.get_active_flow(1))['updated_at'] == '1'
+
+    # Событие об изменении не дошло
+    state['version'] = 2
+    assert (await executor.get_active_flow(1))['updated_at'] == '1'
+    await asyncio.sleep(0.06)
+    assert (await executor.get_active_flow(1))['updated_at'] == '2'
+
+
+async def test_revalidation_without_changes_is_not_modified(api, listener):
+    _, state = api
+    executor = listener.executor
+    await executor.get_active_flow(1)
+    await asyncio.sleep(0.06)
+    await executor.get_active_flow(1)
+    assert listener.cache.revalidations == 1
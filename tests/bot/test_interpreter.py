@@ -0,0 +1,54 @@
+from flow_graphs import chain, make_flow, node, edge
+
+
+async def run(flow_handler, bot, flow_data, user_id=1):
+    flow = flow_handler.executor.compile_flow(flow_data)
+    start = flow.start_node['id']
+    state = {'flow_id': flow.flow_id, 'current_node_id': start, 'context': {}}
+    await flow_handler.user_state.set_state(1, user_id, flow.flow_id, start, {})
+    await flow_handler.execute_current_node(bot, 1, user_id, flow, state)
+    await flow_handler.user_state.checkpoint(1, user_id)
+    return await flow_handler.user_state.store.get_state(1, user_id)
+
+
+async def test_long_chain_runs_iteratively_and_clears_state(flow_handler, fake_bot):
+    state = await run(flow_handler, fake_bot, chain(500))
+
+    assert len(fake_bot.sent) == 499
+    assert fake_bot.sent[0] == (1, 'step 1') and fake_bot.sent[-1] == (1, 'step 499')
+    assert state is None
+
+
+async def test_stops_and_persists_at_button_node(flow_handler, fake_bot):
+    flow_data = make_flow(
+        [node('start', 'input'), node('hello', text='Hi'),
+         node('menu', 'buttonNode', text='Pick', buttons=[{'text': 'A'}]), node('after', text='never')],
+        [edge('start', 'hello'), edge('hello', 'menu'), edge('menu', 'after')],
+    )
+
+    state = await run(flow_handler, fake_bot, flow_data)
+
+    assert fake_bot.sent == [(1, 'Hi'), (1, 'Pick')]
+    assert state['current_node_id'] == 'menu'
+
+
+async def test_cycle_is_detected(flow_handler, fake_bot):
+    flow_data = make_flow(
+        [node('start', 'input'), node('a', text='a'), node('b', text='b')],
+        [edge('start', 'a'), edge('a', 'b'), edge('b', 'a')],
+    )
+
+    state = await run(flow_handler, fake_bot, flow_data)
+
+    assert fake_bot.sent == [(1, 'a'), (1, 'b')]
+    # Flow остановлен на узле, замыкающем цикл
+    assert state['current_node_id'] == 'a'
+
+
+async def test_step_budget(flow_handler, fake_bot, monkeypatch):
+    monkeypatch.setattr(flow_handler.config, 'FLOW_MAX_STEPS', 10)
+
+    state = await run(flow_handler, fake_bot, chain(50))
+
+    assert len(fake_bot.sent) == 9
+    assert state['current_node_id'] == 'n10'
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from aiogram import Dispatcher
+
+from runtime import BotRuntime
+
+
+@pytest.fixture
+async def runtime(monkeypatch):
+    bots = {1: '111:aaa', 2: '222:bbb'}
+
+    async def load_bots():
+        return dict(bots)
+
+    async def idle_poll(self, tenant):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(BotRuntime, '_poll', idle_poll)
+    runtime = BotRuntime(Dispatcher(), load_bots, refresh_interval=3600)
+    yield runtime, bots
+    await runtime.close()
+
+
+async def test_refresh_starts_stops_and_restarts_bots(runtime):
+    runtime, bots = runtime
+    await runtime.start()
+    assert set(runtime.tenants) == {1, 2}
+    first_bot = runtime.get_bot(1)
+
+    bots.pop(2)
+    bots[1] = '111:new'
+    bots[3] = '333:ccc'
+    await runtime.refresh()
+
+    assert set(runtime.tenants) == {1, 3}
+    assert runtime.get_bot(1) is not first_bot
+    assert runtime.get_bot(1).session is runtime.get_bot(3).session
+
+
+async def test_invalid_token_does_not_stop_others(runtime):
+    runtime, bots = runtime
+    bots[4] = 'not-a-token'
+    await runtime.start()
+
+    assert set(runtime.tenants) == {1, 2}
+
+
+async def test_metrics_report_process_memory_per_bot_on_average(runtime):
+    runtime, _ = runtime
+    await runtime.start()
+
+    metrics = runtime.metrics()
+    assert metrics['bots'] == 2
+    assert metrics['rss_per_bot_bytes'] == metrics['rss_bytes'] // 2
+    assert metrics['per_bot'][1] == {'updates': 0, 'errors': 0, 'running': True}
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+
+from utils.send_scheduler import SendScheduler
+
+
+@pytest.fixture
+async def scheduler():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=10, chat_burst=1, workers=4, max_retries=2)
+    await scheduler.start()
+    yield scheduler
+    await scheduler.close()
+
+
+async def test_chat_rate_is_enforced_per_chat(scheduler, fake_bot):
+    start = time.monotonic()
+    await asyncio.gather(*(scheduler.send(fake_bot.send_message, chat_id, str(i))
+                           for i in range(3) for chat_id in (1, 2)))
+
+    # 3 сообщения в чат при 10/s и запасе 1 - не быстрее 0.2 с, чаты идут параллельно
+    assert 0.18 <= time.monotonic() - start < 0.5
+    assert [text for chat_id, text in fake_bot.sent if chat_id == 1] == ['0', '1', '2']
+    assert scheduler.metrics()['sent'] == 6
+
+
+async def test_chat_flood_wait_does_not_pause_other_chats(scheduler, fake_bot):
+    fake_bot.flood[1] = [0.3]
+    start = time.monotonic()
+
+    flooded = asyncio.create_task(scheduler.send(fake_bot.send_message, 1, 'late'))
+    await asyncio.sleep(0.01)
+    await scheduler.send(fake_bot.send_message, 2, 'now')
+    assert time.monotonic() - start < 0.1
+
+    assert await flooded == 2
+    assert time.monotonic() - start >= 0.3
+    assert fake_bot.sent == [(2, 'now'), (1, 'late')]
+    assert scheduler.metrics()['flood_waits'] == 1
+    assert scheduler._bot_bucket(fake_bot.id).blocked_until == 0
+
+
+async def test_gives_up_after_max_retries(scheduler, fake_bot):
+    fake_bot.flood[1] = [0.01, 0.01, 0.01]
+
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler.send(fake_bot.send_message, 1, 'x')
+    assert scheduler.metrics()['failed'] == 1
+
+
+async def test_close_cancels_delayed_jobs(fake_bot):
+    scheduler = SendScheduler(global_rate=1000, chat_rate=10, chat_burst=1, workers=1)
+    await scheduler.start()
+    fake_bot.flood[1] = [60]
+
+    pending = asyncio.create_task(scheduler.send(fake_bot.send_message, 1, 'x'))
+    while not scheduler.metrics()['delayed']:
+        await asyncio.sleep(0.01)
+
+    await scheduler.close()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(pending, 1)
+    assert scheduler.metrics()['delayed'] == 0
@@ -0,0 +1,200 @@
+import asyncio
+import contextlib
+import socket
+from collections import Counter
+
+import aiohttp
+import pytest
+import uvicorn
+from aiogram import Bot, Dispatcher
+
+from models.buffered_state import BufferedUserState
+from models.timer_store import TimerStore
+from models.user_state import UserState
+from sharding import HashRing, ShardRouter, ShardWorkerApp
+from utils.timer_wheel import TimerWheel
+from webhook import WebhookApp
+
+USERS = range(1, 301)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Shard:
+    """Воркер-шард на uvicorn в этом же процессе, со своими базами"""
+
+    def __init__(self, tmp_path, port: int):
+        self.url = f'http://127.0.0.1:{port}'
+        self.port = port
+        self.user_state = BufferedUserState(UserState(str(tmp_path / f'{port}-users.db')))
+        self.timer_wheel = TimerWheel(TimerStore(str(tmp_path / f'{port}-timers.db')))
+        self.bot = Bot('123456:TEST')
+        self.webhook = WebhookApp(self.bot, Dispatcher(), path='/hook', workers=1)
+        self.app = ShardWorkerApp(self.webhook, self.user_state, self.timer_wheel,
+                                  self_url=self.url, shard_secret='inner', replicas=50)
+        self.server = None
+        self._task = None
+
+    async def start(self):
+        await self.webhook.start()
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=self.port,
+                                                    lifespan='off', log_level='warning'))
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        self.server.should_exit = True
+        await self._task
+        await self.webhook.close()
+        await self.user_state.close()
+        await self.timer_wheel.close()
+        await self.bot.session.close()
+
+    async def users(self):
+        rows = await self.user_state.store.load_page((-1, -1), 10000)
+        return {user_id: context for _, user_id, _, _, context in rows}
+
+    async def timer_users(self):
+        return {timer[2] for timer in await self.timer_wheel.store.load_range(0, float('inf'))}
+
+
+@contextlib.asynccontextmanager
+async def cluster(tmp_path, size: int):
+    shards = [Shard(tmp_path, free_port()) for _ in range(size)]
+    for shard in shards:
+        await shard.start()
+    router = ShardRouter([shard.url for shard in shards], path='/hook', shard_secret='inner', replicas=50)
+    await router.start()
+    try:
+        yield router, shards
+    finally:
+        await router.close()
+        for shard in shards:
+            await shard.close()
+
+
+async def seed(router, shards):
+    """Раздать состояния и таймеры пользователей их владельцам по кольцу"""
+    by_url = {shard.url: shard for shard in shards}
+    for user_id in USERS:
+        shard = by_url[router.ring.get_node(user_id)]
+        await shard.user_state.store.write_batch([(1, user_id, 'f1', 'n1', {'user': user_id})], [])
+        await shard.timer_wheel.store.schedule(1, user_id, 'f1', 'n2', 4e9 + user_id)
+
+
+async def test_rebalance_moves_every_state_to_its_new_owner(tmp_path):
+    async with cluster(tmp_path, 2) as (router, shards):
+        await seed(router, shards)
+        extra = Shard(tmp_path, free_port())
+        await extra.start()
+        try:
+            workers = [shard.url for shard in shards + [extra]]
+            result = await router.rebalance(workers)
+
+            ring = HashRing(workers, replicas=50)
+            assert router.ring.nodes == sorted(workers)
+            moved = sum(copied['states'] for copied in result['copied'].values())
+            assert moved == sum(removed['states'] for removed in result['removed'].values())
+            assert 0 < moved < len(USERS)
+
+            seen = {}
+            for shard in shards + [extra]:
+                for user_id, context in (await shard.users()).items():
+                    assert ring.get_node(user_id) == shard.url
+                    assert context == {'user': user_id}
+                    seen[user_id] = shard.url
+                # Принятые таймеры включаются только на commit
+                assert all(ring.get_node(user_id) == shard.url for user_id in await shard.timer_users())
+                assert shard.app._staged_timers == []
+            assert sorted(seen) == list(USERS)
+            assert len(await extra.timer_users()) == len(await extra.users()) > 0
+        finally:
+            await extra.close()
+
+
+async def test_failed_copy_rolls_back_and_keeps_the_ring(tmp_path):
+    async with cluster(tmp_path, 2) as (router, shards):
+        await seed(router, shards)
+        before = {shard.url: (await shard.users(), await shard.timer_users()) for shard in shards}
+        old_ring = router.ring
+
+        extra = Shard(tmp_path, free_port())
+        await extra.start()
+        # Третий воркер не отвечает: копирование ему падает посреди переноса
+        unreachable = f'http://127.0.0.1:{free_port()}'
+        try:
+            with pytest.raises(aiohttp.ClientError):
+                await router.rebalance([shard.url for shard in shards] + [extra.url, unreachable])
+
+            assert router.ring is old_ring
+            assert not router.rebalancing
+            for shard in shards:
+                assert (await shard.users(), await shard.timer_users()) == before[shard.url]
+            # Копии, успевшие дойти до нового воркера, удалены
+            assert await extra.users() == {}
+            assert extra.app._staged_timers == []
+        finally:
+            await extra.close()
+
+
+async def test_timer_due_mid_rebalance_fires_once_on_new_owner(tmp_path):
+    async with cluster(tmp_path, 2) as (router, shards):
+        await seed(router, shards)
+        extra = Shard(tmp_path, free_port())
+        await extra.start()
+        fired = []
+
+        for shard in shards + [extra]:
+            async def resume(bot_id, user_id, flow_id, node_id, shard=shard):
+                # Как resume_after_delay: сдвинуть flow и записать состояние
+                fired.append((shard.url, user_id))
+                await shard.user_state.advance(bot_id, user_id, node_id, {'resumed': True})
+                await shard.user_state.checkpoint(bot_id, user_id)
+            await shard.timer_wheel.start(resume)
+
+        # Таймеры наступают, когда копии уже сделаны, а commit ещё не пришёл
+        settle = router._settle
+
+        async def slow_settle(action, targets, workers):
+            if action == 'commit':
+                await asyncio.sleep(1)
+            return await settle(action, targets, workers)
+
+        router._settle = slow_settle
+        try:
+            for shard in shards:
+                for user_id in await shard.timer_users():
+                    await shard.timer_wheel.schedule(1, user_id, 'f1', 'n2', 0.3)
+
+            workers = [shard.url for shard in shards + [extra]]
+            await router.rebalance(workers)
+            for _ in range(100):
+                if len(fired) >= len(USERS):
+                    break
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+
+            ring = HashRing(workers, replicas=50)
+            assert Counter(user_id for _, user_id in fired) == Counter(USERS)
+            # Таймеры переехавших пользователей сработали у нового владельца
+            assert any(url == extra.url for url, _ in fired)
+            for shard in shards + [extra]:
+                for user_id, context in (await shard.users()).items():
+                    assert ring.get_node(user_id) == shard.url
+                    assert context == {'user': user_id, 'resumed': True}
+                assert await shard.timer_users() == set()
+        finally:
+            await extra.close()
+
+
+async def test_shard_endpoints_require_secret(tmp_path):
+    async with cluster(tmp_path, 1) as (router, shards):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f'{shards[0].url}/shard/abort', json={'workers': []}) as resp:
+                assert resp.status == 403
+        assert len(await shards[0].users()) == 0
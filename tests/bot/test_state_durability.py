@@ -0,0 +1,70 @@
+import asyncio
+
+from models.buffered_state import BufferedUserState
+from models.user_state import UserState
+
+
+async def run_until_crash(path, durability):
+    """Два пользователя: первый дошёл до ожидания ввода (checkpoint), второй - в середине шага"""
+    store = UserState(path)
+    states = BufferedUserState(store, durability=durability, flush_interval=3600)
+
+    await states.set_state(1, 1, 'f1', 'n1', {'step': 1})
+    await states.advance(1, 1, 'n2', {'step': 2})
+    await states.checkpoint(1, 1)
+
+    await states.set_state(1, 2, 'f1', 'n1', {'step': 1})
+    await states.advance(1, 2, 'n2', {'step': 2})
+
+    # Падение процесса: буфер теряется, таймер сброса не успел сработать
+    await store.close()
+
+
+async def recovered(path):
+    store = UserState(path)
+    try:
+        return [await store.get_state(1, user_id) for user_id in (1, 2)]
+    finally:
+        await store.close()
+
+
+async def test_sync_loses_nothing(tmp_path):
+    path = str(tmp_path / 'states.db')
+    await run_until_crash(path, 'sync')
+
+    first, second = await recovered(path)
+    assert first['current_node_id'] == 'n2' and first['context'] == {'step': 2}
+    assert second['current_node_id'] == 'n2' and second['context'] == {'step': 2}
+
+
+async def test_checkpoint_loses_only_unfinished_step(tmp_path):
+    path = str(tmp_path / 'states.db')
+    await run_until_crash(path, 'checkpoint')
+
+    first, second = await recovered(path)
+    assert first['current_node_id'] == 'n2' and first['context'] == {'step': 2}
+    assert second is None
+
+
+async def test_timer_loses_everything_since_last_flush(tmp_path):
+    path = str(tmp_path / 'states.db')
+    await run_until_crash(path, 'timer')
+
+    assert await recovered(path) == [None, None]
+
+
+async def test_timer_flush_makes_state_durable(tmp_path):
+    path = str(tmp_path / 'states.db')
+    store = UserState(path)
+    states = BufferedUserState(store, durability='timer', flush_interval=0.01)
+    await states.start()
+    await states.set_state(1, 1, 'f1', 'n1', {})
+    await states.advance(1, 1, 'n3', {'done': True})
+    await asyncio.sleep(0.1)
+
+    # Падение после сброса по таймеру
+    states._flush_task.cancel()
+    await store.close()
+
+    first, _ = await recovered(path)
+    assert first['current_node_id'] == 'n3' and first['context'] == {'done': True}
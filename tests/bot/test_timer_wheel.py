@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+
+from models.timer_store import TimerStore
+from utils.timer_wheel import TimerWheel
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = TimerStore(str(tmp_path / 'timers.db'))
+    yield store
+
+
+async def test_fires_due_timers(store):
+    fired = []
+    wheel = TimerWheel(store, horizon=60)
+    await wheel.start(lambda *timer: asyncio.sleep(0, fired.append(timer)))
+    try:
+        await wheel.schedule(1, 10, 'f1', 'delay', 0.05)
+        await asyncio.sleep(0.2)
+    finally:
+        await wheel.close()
+
+    assert fired == [(1, 10, 'f1', 'delay')]
+
+
+async def test_failed_window_load_is_retried(store, monkeypatch):
+    due_at = time.time() + 0.05
+    await store.schedule(1, 10, 'f1', 'delay', due_at)
+    original = store.load_range
+    calls = []
+
+    async def flaky_load_range(after, until):
+        calls.append(after)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        return await original(after, until)
+
+    monkeypatch.setattr(store, 'load_range', flaky_load_range)
+    wheel = TimerWheel(store, horizon=60)
+
+    with pytest.raises(RuntimeError):
+        await wheel._load_window(time.time())
+    assert wheel._loaded_until == 0.0
+    assert wheel.pending_in_memory() == 0
+
+    # Повторная загрузка начинается с прежней границы окна и находит таймер
+    now = time.time()
+    await wheel._load_window(now)
+    assert calls == [0.0, 0.0]
+    assert wheel._loaded_until == now + 60
+    assert wheel.pending_in_memory() == 1
+
+    fired = []
+    await wheel.start(lambda *timer: asyncio.sleep(0, fired.append(timer)))
+    try:
+        await asyncio.sleep(0.2)
+    finally:
+        await wheel.close()
+    assert fired == [(1, 10, 'f1', 'delay')]
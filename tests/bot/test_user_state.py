@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from models.user_state import UserState
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = UserState(str(tmp_path / 'states.db'))
+    yield store
+    await store.close()
+
+
+async def test_set_get_clear(store):
+    assert await store.get_state(1, 10) is None
+
+    await store.set_state(1, 10, 'f1', 'n1', {'name': 'Ann'})
+    assert await store.get_state(1, 10) == {'flow_id': 'f1', 'current_node_id': 'n1', 'context': {'name': 'Ann'}}
+    # Состояние хранится по (bot_id, user_id)
+    assert await store.get_state(2, 10) is None
+
+    await store.clear_state(1, 10)
+    assert await store.get_state(1, 10) is None
+
+
+async def test_advance_and_update_merge_context(store):
+    await store.set_state(1, 10, 'f1', 'n1', {'a': 1, 'b': 2})
+
+    state = await store.advance(1, 10, 'n2', {'b': 3, 'c': 4})
+    assert state == {'flow_id': 'f1', 'current_node_id': 'n2', 'context': {'a': 1, 'b': 3, 'c': 4}}
+
+    await store.update_context(1, 10, {'d': 5})
+    assert (await store.get_state(1, 10))['context'] == {'a': 1, 'b': 3, 'c': 4, 'd': 5}
+
+    assert await store.advance(1, 99, 'n2', {}) is None
+
+
+@pytest.mark.parametrize('stored', [None, ''])
+async def test_advance_merges_into_empty_legacy_context(store, stored):
+    await store.set_state(1, 10, 'f1', 'n1', {})
+    await store._run(lambda: store._conn.execute('UPDATE user_states SET context = ?', (stored,)))
+
+    state = await store.advance(1, 10, 'n2', {'a': 1})
+    assert state['context'] == {'a': 1}
+
+
+async def test_connection_uses_wal(store):
+    mode = await store._run(lambda: store._conn.execute('PRAGMA journal_mode').fetchone()[0])
+    assert mode == 'wal'
+
+
+async def test_write_batch_and_pages(store):
+    await store.write_batch([(1, user_id, 'f1', 'n1', {'i': user_id}) for user_id in range(5)], [])
+    await store.write_batch([], [(1, 0), (1, 1)])
+
+    first = await store.load_page(limit=2)
+    assert [row[1] for row in first] == [2, 3]
+    rest = await store.load_page(after=first[-1][:2], limit=10)
+    assert rest == [(1, 4, 'f1', 'n1', {'i': 4})]
+
+
+async def test_migrates_legacy_table(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE user_states (
+            user_id INTEGER PRIMARY KEY, flow_id TEXT NOT NULL, current_node_id TEXT NOT NULL,
+            context TEXT DEFAULT '{}', created_at TEXT NOT NULL, updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO user_states VALUES (10, 'f1', 'n1', '{\"x\": 1}', 't', 't')")
+    conn.commit()
+    conn.close()
+
+    store = UserState(path, legacy_bot_id=7)
+    try:
+        assert await store.get_state(7, 10) == {'flow_id': 'f1', 'current_node_id': 'n1', 'context': {'x': 1}}
+    finally:
+        await store.close()
@@ -0,0 +1,124 @@
+import asyncio
+import contextlib
+import json
+import random
+
+import httpx
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from webhook import WebhookApp, get_update_user_id
+
+
+def message_update(update_id, user_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'U'},
+            'text': text,
+        },
+    }
+
+
+class Recorder:
+    """Обработчик сообщений: запоминает порядок, может задерживать обработку"""
+
+    def __init__(self):
+        self.handled = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def dispatcher(self) -> Dispatcher:
+        router = Router()
+
+        @router.message()
+        async def on_message(message: Message):
+            await self.gate.wait()
+            # Случайная задержка перемешала бы порядок без очереди на пользователя
+            await asyncio.sleep(random.random() / 1000)
+            self.handled.append((message.from_user.id, message.text))
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        return dp
+
+
+@contextlib.asynccontextmanager
+async def running_webhook(queue_size: int):
+    recorder = Recorder()
+    bot = Bot('123456:TEST')
+    app = WebhookApp(bot, recorder.dispatcher(), path='/hook', secret='s3cret', workers=4, queue_size=queue_size)
+    await app.start()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bot')
+    try:
+        yield app, client, recorder
+    finally:
+        recorder.gate.set()
+        await client.aclose()
+        await app.close()
+        await bot.session.close()
+
+
+@pytest.fixture
+async def webhook():
+    async with running_webhook(queue_size=100) as running:
+        yield running
+
+
+HEADERS = {'X-Telegram-Bot-Api-Secret-Token': 's3cret'}
+
+
+async def test_updates_of_one_user_are_processed_in_order(webhook):
+    app, client, recorder = webhook
+
+    update_id = 0
+    for i in range(20):
+        for user_id in (1, 2, 3):
+            update_id += 1
+            response = await client.post('/hook', json=message_update(update_id, user_id, str(i)), headers=HEADERS)
+            assert response.status_code == 200
+    await app.drain()
+
+    for user_id in (1, 2, 3):
+        assert [text for uid, text in recorder.handled if uid == user_id] == [str(i) for i in range(20)]
+    assert app.metrics()['processed'] == 60
+
+
+async def test_rejects_wrong_secret_and_bad_json(webhook):
+    app, client, _ = webhook
+
+    assert (await client.post('/hook', json=message_update(1, 1, 'x'))).status_code == 403
+    response = await client.post('/hook', content=b'{not json', headers=HEADERS)
+    assert response.status_code == 400
+    assert (await client.post('/other', json={}, headers=HEADERS)).status_code == 404
+
+
+async def test_sheds_load_when_worker_queue_is_full():
+    async with running_webhook(queue_size=2) as (app, client, recorder):
+        recorder.gate.clear()
+
+        # Воркер занят первым update, очередь вмещает ещё два
+        statuses = []
+        for update_id in range(1, 6):
+            response = await client.post('/hook', json=message_update(update_id, 7, str(update_id)), headers=HEADERS)
+            statuses.append(response.status_code)
+            await asyncio.sleep(0.01)
+
+        assert statuses == [200, 200, 200, 503, 503]
+        assert response.headers['retry-after'] == '1'
+        recorder.gate.set()
+        await app.drain()
+        assert [text for _, text in recorder.handled] == ['1', '2', '3']
+
+        metrics = json.loads((await client.get('/health')).content)
+        assert metrics['accepted'] == 3 and metrics['shed'] == 2
+
+
+def test_update_user_id():
+    assert get_update_user_id(message_update(1, 42, 'x')) == 42
+    assert get_update_user_id({'update_id': 1, 'callback_query': {'from': {'id': 5}}}) == 5
+    assert get_update_user_id({'update_id': 1, 'poll': {}}) == 0